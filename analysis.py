@@ -0,0 +1,195 @@
+import numpy as np
+
+# Поля метаданных элементов датасета, по которым строятся страты
+STRATA = {
+    "type": "item_type",
+    "complexity": "complexity"
+}
+
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+# Ограничение памяти под матрицу бутстрэп-выборок (элементов за один проход)
+BOOTSTRAP_CHUNK_ELEMENTS = 4_000_000
+
+
+def _number(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def _percentiles(values, percentiles):
+    values = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+    if not len(values):
+        return {f"p{p}": None for p in percentiles}
+    return {f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))}
+
+
+def version_stats(quality, tokens, latency, ttft):
+    """Сводка по строкам одной версии промпта"""
+    if not len(quality):
+        return {"cells": 0}
+    stats = {
+        "cells": int(len(quality)),
+        "quality_mean": float(quality.mean()),
+        "quality_median": float(np.median(quality)),
+        "tokens_mean": float(tokens.mean()),
+        "tokens": _percentiles(tokens, (50, 95)),
+        "latency_seconds": _percentiles(latency, LATENCY_PERCENTILES)
+    }
+    if not np.isnan(ttft).all():
+        stats["time_to_first_token"] = _percentiles(ttft, (50, 95))
+    return stats
+
+
+def bootstrap_mean_ci(differences, n_boot=2000, confidence=0.95, rng=None):
+    """Перцентильный бутстрэп-интервал для среднего парных разностей"""
+    n = len(differences)
+    if n == 0:
+        return None, None
+    if n == 1:
+        value = float(differences[0])
+        return value, value
+    rng = rng or np.random.default_rng()
+    values, counts = np.unique(differences, return_counts=True)
+    if len(values) * 4 <= n:
+        # Оценки дискретны: выборка с возвращением эквивалентна мультиномиальным
+        # частотам различных значений, что дешевле индексации n элементов
+        means = rng.multinomial(n, counts / n, size=n_boot) @ values / n
+    else:
+        means = np.empty(n_boot)
+        chunk = max(1, BOOTSTRAP_CHUNK_ELEMENTS // n)
+        for start in range(0, n_boot, chunk):
+            size = min(chunk, n_boot - start)
+            samples = rng.integers(0, n, size=(size, n))
+            means[start:start + size] = differences[samples].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def paired_scores(pair_keys, versions, quality, version_list):
+    """Матрица средних оценок (пара × версия); NaN, если у пары нет строки этой версии"""
+    pairs, pair_index = np.unique(pair_keys, return_inverse=True)
+    version_index = np.searchsorted(version_list, versions)
+    flat = pair_index * len(version_list) + version_index
+    size = len(pairs) * len(version_list)
+    sums = np.bincount(flat, weights=quality, minlength=size)
+    counts = np.bincount(flat, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrix = sums / counts
+    return matrix.reshape(len(pairs), len(version_list))
+
+
+def compare_group(versions, quality, tokens, latency, ttft, pair_keys, baseline, n_boot, confidence, rng):
+    """Статистика по версиям и парные разности с baseline внутри одной группы строк"""
+    version_list = np.unique(versions)
+    result = {"versions": {}, "differences": []}
+    for version in version_list.tolist():
+        mask = versions == version
+        result["versions"][str(version)] = version_stats(quality[mask], tokens[mask], latency[mask], ttft[mask])
+
+    if baseline not in version_list or len(version_list) < 2:
+        return result
+    # Пара — один элемент датасета в одном эксперименте; повторные прогоны усредняются
+    matrix = paired_scores(pair_keys, versions, quality, version_list)
+    base_column = matrix[:, int(np.searchsorted(version_list, baseline))]
+    for position, version in enumerate(version_list.tolist()):
+        if version == baseline:
+            continue
+        both = ~np.isnan(base_column) & ~np.isnan(matrix[:, position])
+        differences = matrix[both, position] - base_column[both]
+        low, high = bootstrap_mean_ci(differences, n_boot, confidence, rng)
+        result["differences"].append({
+            "version": version,
+            "baseline": baseline,
+            "pairs": int(both.sum()),
+            "mean_difference": _number(differences.mean()) if len(differences) else None,
+            "ci_low": low,
+            "ci_high": high,
+            "confidence": confidence
+        })
+    return result
+
+
+def compare_versions(results, experiment=None, model=None, strata=("type", "complexity"), baseline=1,
+                     n_boot=2000, confidence=0.95, seed=0):
+    """Сравнение версий промптов по колоночному хранилищу: целиком и по стратам метаданных"""
+    mask = results.mask(experiment=experiment, model=model)
+    versions = np.asarray(results["version"][mask])
+    quality = np.asarray(results["quality_score"][mask], dtype=np.float64)
+    tokens = np.asarray(results["tokens"][mask])
+    latency = np.asarray(results["latency_seconds"][mask], dtype=np.float64)
+    ttft = np.asarray(results["time_to_first_token"][mask], dtype=np.float64)
+    items = np.asarray(results["item"][mask], dtype=np.int64)
+    experiments = np.asarray(results["experiment"][mask], dtype=np.int64)
+    pair_keys = experiments * max(1, len(results.dictionaries["item"])) + items
+    rng = np.random.default_rng(seed)
+
+    def group(group_mask):
+        return compare_group(
+            versions[group_mask], quality[group_mask], tokens[group_mask], latency[group_mask],
+            ttft[group_mask], pair_keys[group_mask], baseline, n_boot, confidence, rng
+        )
+
+    comparison = dict(group(np.ones(len(versions), dtype=bool)), cells=int(len(versions)), strata={})
+    for name in strata:
+        column = STRATA[name]
+        codes = np.asarray(results[column][mask])
+        comparison["strata"][name] = {
+            value: group(codes == code)
+            for code, value in zip(*_present(codes, results.dictionaries[column]))
+        }
+    return comparison
+
+
+def _present(codes, dictionary):
+    present = np.unique(codes).tolist()
+    return present, [dictionary[code] or "unknown" for code in present]
+
+
+def model_stats(results, version=None, item_type=None):
+    """Исторические показатели моделей по колоночному хранилищу для версии промпта и типа элемента"""
+    mask = results.mask(version=version, item_type=item_type)
+    models = np.asarray(results["model"][mask])
+    if not len(models):
+        return {}
+    quality = np.asarray(results["quality_score"][mask], dtype=np.float64)
+    tokens = np.asarray(results["tokens"][mask], dtype=np.float64)
+    latency = np.asarray(results["latency_seconds"][mask], dtype=np.float64)
+    codes, inverse, counts = np.unique(models, return_inverse=True, return_counts=True)
+    quality_mean = np.bincount(inverse, weights=quality) / counts
+    tokens_mean = np.bincount(inverse, weights=tokens) / counts
+    stats = {}
+    for position, (name, count) in enumerate(zip(results.decode("model", codes), counts.tolist())):
+        stats[name] = {
+            "cells": count,
+            "quality_mean": float(quality_mean[position]),
+            "tokens_mean": float(tokens_mean[position]),
+            "latency_seconds": _percentiles(latency[inverse == position], (50, 95))
+        }
+    return stats
+
+
+def summarize_models(item_results):
+    """Сводка эксперимента по моделям: качество, токены и задержки ячеек"""
+    cells = {}
+    for item in item_results:
+        for cell in item["results"]:
+            cells.setdefault(cell.get("model"), []).append(cell)
+    summary = {}
+    for model, model_cells in cells.items():
+        quality = np.array([cell["quality_score"] for cell in model_cells], dtype=np.float64)
+        tokens = np.array([cell["tokens_used"] or 0 for cell in model_cells], dtype=np.float64)
+        latency = np.array([cell["latency_seconds"] for cell in model_cells], dtype=np.float64)
+        versions = np.array([cell["version"] for cell in model_cells])
+        summary[model] = {
+            "cells": len(model_cells),
+            "quality_mean": float(quality.mean()),
+            "tokens_mean": float(tokens.mean()),
+            "tokens_total": int(tokens.sum()),
+            "latency_seconds": _percentiles(latency, LATENCY_PERCENTILES),
+            "quality_by_version": {
+                str(version): float(quality[versions == version].mean()) for version in np.unique(versions).tolist()
+            }
+        }
+    return summary
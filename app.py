@@ -1,15 +1,37 @@
 import os
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from dotenv import load_dotenv
-from openai import OpenAI
-from langfuse import Langfuse
 from langfuse.decorators import observe
 import logging
 import time
 import json
+import math
 from datetime import datetime
-import httpx
+from urllib.parse import quote
+import threading
+import atexit
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
 from datasets import AVAILABLE_DATASETS, PROMPT_TUNING_DATASET
+from jobs import JobManager, JobStore, format_sse
+from llm import ChatStream, cached_chat_completion, chat_completion, llm_cache, request_scheduler, single_flight
+from telemetry import HttpIngestionSink, LangfuseSDKSink, TelemetryWriter
+from dataset_cache import DatasetCache
+from ingest import bulk_ingest, iter_json_array, iter_jsonl
+from clients import close_clients, get_langfuse, get_openai_client, pool_stats, reset_clients
+from readiness import Readiness, start_warmup, warm_up
+from metrics import PROMETHEUS_CONTENT_TYPE, registry, span
+from scoring import scoring_engine
+from checkpoints import CheckpointStore, resolve_run
+from result_store import ResultStore
+from analysis import STRATA, compare_versions, summarize_models
+from router import ModelRouter
+from racing import ExperimentRace
+from sampling import stratified_mean, stratified_order, stratum_key
+from response_cache import CursorError, ResponseCache, content_version, paginate, parse_limit
+from dedup import DatasetDeduplicator, DuplicateItemError, item_text
+from prompts import PROMPT_VERSIONS, build_messages
+from batch import BatchError, BatchSubmitter, LocalBatchProvider, OpenAIBatchProvider, cell_custom_id
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -21,36 +43,186 @@ load_dotenv()
 # Инициализация Flask
 app = Flask(__name__)
 
-# Инициализация Langfuse
-logger.info("Инициализация клиента Langfuse...")
-langfuse = Langfuse(
-    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-    host=os.getenv("LANGFUSE_BASE_URL", "https://us.cloud.langfuse.com")
+# Максимальное число параллельных вызовов одной модели в эксперименте
+EXPERIMENT_MAX_CONCURRENCY = int(os.getenv("EXPERIMENT_MAX_CONCURRENCY", "8"))
+
+# Ограничение числа моделей в одном эксперименте
+EXPERIMENT_MAX_MODELS = int(os.getenv("EXPERIMENT_MAX_MODELS", "5"))
+
+# Адаптивный режим экспериментов: уровень доверия и минимум элементов до первой проверки
+ADAPTIVE_CONFIDENCE = float(os.getenv("ADAPTIVE_CONFIDENCE", "0.95"))
+ADAPTIVE_MIN_ITEMS = int(os.getenv("ADAPTIVE_MIN_ITEMS", "10"))
+
+# Предварительная оценка на выборке: начальный размер и число расширений до целевой точности
+PREVIEW_SAMPLE_SIZE = int(os.getenv("PREVIEW_SAMPLE_SIZE", "20"))
+PREVIEW_MAX_ROUNDS = int(os.getenv("PREVIEW_MAX_ROUNDS", "5"))
+
+# Пакетный режим экспериментов: провайдер (openai — Batch API, local — файловая замена),
+# каталог файлов пакетов, период опроса и предельное время ожидания в секундах
+BATCH_PROVIDER = os.getenv("BATCH_PROVIDER", "openai")
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join("results", "batches"))
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", str(26 * 3600)))
+
+# Версия промпта для /ask, если в запросе она не указана
+ROUTER_PROMPT_VERSION = int(os.getenv("ROUTER_PROMPT_VERSION", "2"))
+
+# Число фоновых воркеров для асинхронных экспериментов
+EXPERIMENT_JOB_WORKERS = int(os.getenv("EXPERIMENT_JOB_WORKERS", "2"))
+
+# Число попыток прогрева в мастер-процессе WSGI-сервера до fork воркеров
+PRELOAD_WARMUP_ATTEMPTS = int(os.getenv("PRELOAD_WARMUP_ATTEMPTS", "3"))
+
+# Параллелизм пакетной загрузки элементов в Langfuse
+INGEST_MAX_PARALLEL = int(os.getenv("INGEST_MAX_PARALLEL", "8"))
+
+# Буферизованная отправка трейсов и оценок экспериментов пачками
+if os.getenv("TELEMETRY_SINK", "ingestion") == "sdk":
+    telemetry_sink = LangfuseSDKSink(get_langfuse)
+else:
+    telemetry_sink = HttpIngestionSink(
+        host=os.getenv("LANGFUSE_BASE_URL", "https://us.cloud.langfuse.com"),
+        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
+        secret_key=os.getenv("LANGFUSE_SECRET_KEY")
+    )
+telemetry = TelemetryWriter(
+    telemetry_sink,
+    max_queue_size=int(os.getenv("TELEMETRY_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("TELEMETRY_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1.0")),
+    overflow=os.getenv("TELEMETRY_OVERFLOW", "block")
+)
+atexit.register(telemetry.close)
+atexit.register(close_clients)
+
+# Чекпоинты завершенных ячеек для возобновления прерванных экспериментов
+checkpoints = CheckpointStore(
+    os.getenv("CHECKPOINT_PATH", os.path.join("results", "checkpoints.sqlite")),
+    enabled=os.getenv("CHECKPOINTS_ENABLED", "1") != "0",
+    retention=float(os.getenv("CHECKPOINT_RETENTION_DAYS", "7")) * 86400
+)
+
+# Колоночная история результатов для локальной аналитики по версиям промптов
+result_store = ResultStore(
+    os.getenv("RESULT_STORE_DIR", os.path.join("results", "store")),
+    enabled=os.getenv("RESULT_STORE_ENABLED", "1") != "0"
+)
+
+# Маршрутизация запросов /ask по истории экспериментов: цена 1K токенов по моделям (USD)
+model_router = ModelRouter(
+    result_store,
+    prices=json.loads(os.getenv("MODEL_PRICES", "{}")),
+    default_model=os.getenv("ROUTER_DEFAULT_MODEL", "gpt-3.5-turbo"),
+    min_quality=float(os.getenv("ROUTER_MIN_QUALITY", "3")),
+    min_cells=int(os.getenv("ROUTER_MIN_CELLS", "5"))
+)
+
+# Пакетный провайдер: локальная замена выполняет запросы пакета обычными вызовами модели
+if BATCH_PROVIDER == "local":
+    batch_provider = LocalBatchProvider(
+        os.path.join(BATCH_DIR, "local"),
+        lambda body: chat_completion(get_openai_client(), **body).model_dump(),
+        max_parallel=int(os.getenv("BATCH_LOCAL_PARALLEL", "4"))
+    )
+else:
+    batch_provider = OpenAIBatchProvider(get_openai_client)
+batch_submitter = BatchSubmitter(batch_provider, BATCH_DIR, poll_interval=BATCH_POLL_INTERVAL, timeout=BATCH_TIMEOUT)
+
+# Готовые сериализованные ответы эндпоинтов датасетов
+response_cache = ResponseCache(max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", "256")))
+
+# Версии встроенных датасетов: содержимое неизменно, хэш считается один раз
+static_dataset_versions = {}
+
+def static_dataset_version(name):
+    version = static_dataset_versions.get(name)
+    if version is None:
+        version = static_dataset_versions[name] = content_version(AVAILABLE_DATASETS[name])
+    return version
+
+# Метрики горячего пути для /metrics
+EXPERIMENT_PHASE_SECONDS = registry.histogram(
+    "experiment_phase_seconds", "Длительность фаз ячейки эксперимента", ["phase", "model", "version"]
+)
+LLM_CALLS = registry.counter("llm_calls_total", "Вызовы модели", ["model", "version"])
+LLM_TOKENS = registry.counter("llm_tokens_total", "Использованные токены", ["model", "version"])
+LLM_ERRORS = registry.counter("llm_errors_total", "Ошибки обработки ячеек", ["model", "version"])
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Длительность HTTP-запросов", ["method", "endpoint", "status"]
 )
+registry.gauge("telemetry_queue_depth", "Событий телеметрии в очереди", lambda: telemetry.stats()["queue_depth"])
+registry.callback_counter("telemetry_dropped_total", "Потерянные события телеметрии", lambda: telemetry.stats()["dropped"])
+registry.callback_counter("llm_cache_hits_total", "Попадания в кэш ответов LLM", lambda: llm_cache.stats()["hits"])
+registry.callback_counter("llm_cache_misses_total", "Промахи кэша ответов LLM", lambda: llm_cache.stats()["misses"])
+registry.callback_counter("llm_coalesced_total", "Вызовы LLM, объединенные с одинаковым запросом в полете",
+               lambda: single_flight.stats()["coalesced"])
+registry.callback_counter("llm_coalesced_cross_process_total", "Ответы LLM, дождавшиеся вызова в другом процессе",
+               lambda: single_flight.stats()["coalesced_cross_process"])
+registry.gauge("llm_in_flight", "Уникальные вызовы LLM в полете", lambda: single_flight.stats()["in_flight"])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+            status=response.status_code
+        )
+    return response
+
+def load_dataset(name):
+    """Полная загрузка датасета из Langfuse для кэша"""
+    dataset = get_langfuse().get_dataset(name)
+    items = list(dataset.items)
+    return f"{dataset.updated_at.isoformat()}|{len(items)}", items
+
+def load_dataset_version(name):
+    """Маркер версии датасета без загрузки элементов: время изменения и число элементов
 
-# Проверка аутентификации
-try:
-    logger.info("Проверка аутентификации Langfuse...")
-    langfuse.auth_check()
-    logger.info("Langfuse аутентификация успешна")
-except Exception as e:
-    logger.error(f"Ошибка аутентификации Langfuse: {str(e)}")
-    raise
-
-# Создаем HTTP-клиент с совместимой версией httpx
-http_client = httpx.Client()
-
-# Инициализация OpenAI клиента
-openai_client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    http_client=http_client
+    Правку элемента маркер не видит: такие изменения подхватываются по DATASET_CACHE_MAX_AGE
+    или после DELETE /dataset_cache/<name>."""
+    langfuse = get_langfuse()
+    dataset = langfuse.client.datasets.get(dataset_name=name)
+    # Имя в пути списка элементов кодируется так же, как в Langfuse.get_dataset
+    page = langfuse.client.dataset_items.list(dataset_name=quote(name), page=1, limit=1)
+    return f"{dataset.updated_at.isoformat()}|{page.meta.total_items}"
+
+# Локальный кэш датасетов, чтобы эксперименты не скачивали датасет при каждом запуске
+dataset_cache = DatasetCache(
+    loader=load_dataset,
+    version_loader=load_dataset_version,
+    directory=os.getenv("DATASET_CACHE_DIR", os.path.join("results", "dataset_cache")),
+    ttl=int(os.getenv("DATASET_CACHE_TTL", "300")),
+    max_age=int(os.getenv("DATASET_CACHE_MAX_AGE", "3600"))
 )
 
+def load_dataset_texts(name):
+    """Тексты существующих элементов датасета для индекса почти дубликатов"""
+    return [(item.id, item_text(item.input)) for item in dataset_cache.get(name).items]
+
+# Поиск почти дубликатов при загрузке элементов (MinHash + LSH)
+deduplicator = DatasetDeduplicator(
+    loader=load_dataset_texts,
+    version_loader=lambda name: dataset_cache.get(name).version,
+    refresh_interval=float(os.getenv("DEDUP_REFRESH_INTERVAL", "60")),
+    mode=os.getenv("DEDUP_MODE", "flag"),
+    threshold=float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+)
+registry.callback_counter("dataset_near_duplicates_flagged_total", "Элементы, помеченные как почти дубликаты",
+               lambda: deduplicator.stats()["flagged"])
+registry.callback_counter("dataset_near_duplicates_rejected_total", "Элементы, отклоненные как почти дубликаты",
+               lambda: deduplicator.stats()["rejected"])
+
 def create_dataset(name, description):
     """Создание датасета в Langfuse"""
     try:
-        dataset = langfuse.create_dataset(
+        dataset = get_langfuse().create_dataset(
             name=name,
             description=description,
             metadata={
@@ -59,188 +231,615 @@ def create_dataset(name, description):
                 "created_at": datetime.now().isoformat()
             }
         )
+        dataset_cache.invalidate(name)
         logger.info(f"Датасет {name} создан успешно")
         return dataset
     except Exception as e:
         logger.error(f"Ошибка при создании датасета: {str(e)}")
         raise
 
-def add_dataset_item(dataset_name, input_data, expected_output, metadata=None):
-    """Добавление элемента в датасет"""
-    try:
-        item = langfuse.create_dataset_item(
+def add_dataset_item(dataset_name, input_data, expected_output, metadata=None, dedup=None):
+    """Добавление элемента в датасет с проверкой на почти дубликаты (dedup: off, flag, reject)"""
+    def create(item_metadata):
+        return get_langfuse().create_dataset_item(
             dataset_name=dataset_name,
             input=input_data,
             expected_output=expected_output,
-            metadata=metadata or {}
+            metadata=item_metadata or {}
         )
+    
+    try:
+        item = deduplicator.add(dataset_name, item_text(input_data), create, metadata, mode=dedup)
+        dataset_cache.invalidate(dataset_name)
         logger.info(f"Элемент добавлен в датасет {dataset_name}")
         return item
+    except DuplicateItemError as e:
+        logger.info(f"Элемент не добавлен в датасет {dataset_name}: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"Ошибка при добавлении элемента в датасет: {str(e)}")
         raise
 
-def run_experiment(dataset_name, prompt_versions, model="gpt-3.5-turbo"):
-    """Запуск эксперимента с разными версиями промптов"""
+def run_experiment_cell(dataset_name, item, version, prompt_func, model, use_cache=True, stream=False):
+    """Обработка одной ячейки эксперимента (элемент датасета × версия промпта)"""
+    labels = {"model": model, "version": version}
+    
+    # Создаем трейс
+    with span(EXPERIMENT_PHASE_SECONDS, phase="trace_create", **labels):
+        trace_id = telemetry.trace(
+            name=f"experiment_{version}",
+            input=item.input,
+            metadata={
+                "dataset": dataset_name,
+                "version": version,
+                "model": model,
+                "item_id": item.id
+            }
+        )
+    
     try:
-        dataset = langfuse.get_dataset(dataset_name)
-        results = []
+        # Создаем промпт
+        with span(EXPERIMENT_PHASE_SECONDS, phase="prompt", **labels):
+            prompt = prompt_func(item.input["text"])
         
-        for item in dataset.items:
-            item_results = []
-            
-            for version, prompt_func in prompt_versions:
-                # Создаем трейс
-                trace = langfuse.trace(
-                    name=f"experiment_{version}",
-                    input=item.input,
-                    metadata={
-                        "dataset": dataset_name,
-                        "version": version,
-                        "model": model,
-                        "item_id": item.id
-                    }
+        # Запускаем модель; в потоковом режиме замеряем время до первого токена
+        started = time.perf_counter()
+        stream_metrics = None
+        cached = False
+        LLM_CALLS.inc(**labels)
+        with span(EXPERIMENT_PHASE_SECONDS, phase="llm", **labels):
+            if stream:
+                chat_stream = ChatStream(
+                    get_openai_client(),
+                    model=model,
+                    messages=build_messages(prompt),
+                    temperature=0.7
+                ).consume()
+                answer = chat_stream.answer
+                tokens_used = chat_stream.total_tokens
+                stream_metrics = chat_stream.metrics()
+            else:
+                response, cached = cached_chat_completion(
+                    get_openai_client(),
+                    use_cache=use_cache,
+                    model=model,
+                    messages=build_messages(prompt),
+                    temperature=0.7
                 )
                 
-                try:
-                    # Создаем промпт
-                    prompt = prompt_func(item.input["text"])
-                    
-                    # Запускаем модель
-                    response = openai_client.chat.completions.create(
-                        model=model,
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.7
-                    )
-                    
-                    # Получаем ответ
-                    answer = response.choices[0].message.content
-                    tokens_used = response.usage.total_tokens
-                    
-                    # Анализ ответа
-                    word_count = len(answer.split())
-                    has_examples = "пример" in answer.lower() or "example" in answer.lower()
-                    has_practical_advice = "совет" in answer.lower() or "advice" in answer.lower()
-                    has_code_blocks = "```" in answer
-                    has_bullet_points = "- " in answer or "* " in answer
-                    
-                    # Оценка качества
-                    quality_score = 0
-                    if has_examples: quality_score += 1
-                    if has_practical_advice: quality_score += 1
-                    if has_code_blocks: quality_score += 1
-                    if has_bullet_points: quality_score += 1
-                    if 100 <= word_count <= 300: quality_score += 1
-                    
-                    # Сохраняем результаты
-                    trace.update(
-                        output={
-                            "answer": answer,
-                            "tokens_used": tokens_used,
-                            "quality_score": quality_score
-                        },
-                        metadata={
-                            "quality_metrics": {
-                                "score": quality_score,
-                                "max_score": 5,
-                                "criteria": {
-                                    "has_examples": has_examples,
-                                    "has_practical_advice": has_practical_advice,
-                                    "has_code_blocks": has_code_blocks,
-                                    "has_bullet_points": has_bullet_points,
-                                    "word_count_optimal": 100 <= word_count <= 300
-                                }
-                            }
-                        }
-                    )
-                    
-                    # Добавляем оценку
-                    langfuse.score(
-                        trace_id=trace.id,
-                        name="quality",
-                        value=quality_score,
-                        comment=f"Оценка качества версии {version}"
-                    )
-                    
-                    item_results.append({
-                        "version": version,
-                        "answer": answer,
-                        "tokens_used": tokens_used,
-                        "quality_score": quality_score
-                    })
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке версии {version}: {str(e)}")
-                    trace.update(
-                        output={"error": str(e)},
-                        metadata={"error": True}
+                # Получаем ответ
+                answer = response.choices[0].message.content
+                tokens_used = response.usage.total_tokens
+        # Ответ из кэша не говорит о задержке модели: как и в пакетном режиме, latency — None,
+        # чтобы такие ячейки не попадали в перцентили и выбор модели по задержке
+        latency = None if cached else time.perf_counter() - started
+        LLM_TOKENS.inc(tokens_used or 0, **labels)
+        
+        # Оценка качества по зарегистрированным критериям
+        with span(EXPERIMENT_PHASE_SECONDS, phase="scoring", **labels):
+            quality_score, criteria = scoring_engine.score(answer)
+        
+        # Сохраняем результаты
+        with span(EXPERIMENT_PHASE_SECONDS, phase="trace_update", **labels):
+            telemetry.update_trace(
+                trace_id,
+                output={
+                    "answer": answer,
+                    "tokens_used": tokens_used,
+                    "quality_score": quality_score,
+                    "latency_seconds": latency
+                },
+                metadata={
+                    "streaming": stream_metrics,
+                    "quality_metrics": {
+                        "score": quality_score,
+                        "max_score": scoring_engine.max_score,
+                        "criteria": criteria
+                    }
+                }
+            )
+        
+        # Добавляем оценку
+        with span(EXPERIMENT_PHASE_SECONDS, phase="score", **labels):
+            telemetry.score(
+                trace_id=trace_id,
+                name="quality",
+                value=quality_score,
+                comment=f"Оценка качества версии {version}"
+            )
+        
+        result = {
+            "version": version,
+            "model": model,
+            "answer": answer,
+            "tokens_used": tokens_used,
+            "quality_score": quality_score,
+            "criteria": criteria,
+            "latency_seconds": latency,
+            "cached": cached
+        }
+        if stream_metrics is not None:
+            result["streaming"] = stream_metrics
+        return result
+    except Exception as e:
+        LLM_ERRORS.inc(**labels)
+        logger.error(f"Ошибка при обработке версии {version}: {str(e)}")
+        telemetry.update_trace(
+            trace_id,
+            output={"error": str(e)},
+            metadata={"error": True}
+        )
+        return None
+
+def run_experiment(dataset_name, prompt_versions, model="gpt-3.5-turbo", max_concurrency=None, listener=None,
+                   use_cache=True, stream=False, experiment_id=None, resume=None, race=None, item_ids=None):
+    """Запуск эксперимента с разными версиями промптов; model — модель или список моделей.
+    
+    race (ExperimentRace) включает адаптивный режим: версии, статистически уступающие лидеру,
+    перестают получать новые элементы, а вызовы модели уходят оставшимся версиям.
+    item_ids ограничивает прогон подмножеством элементов датасета (в указанном порядке).
+    Завершенные ячейки берутся из чекпоинтов только при явном experiment_id или resume=True."""
+    try:
+        items = dataset_cache.get(dataset_name).items
+        if item_ids is not None:
+            by_id = {item.id: item for item in items}
+            items = [by_id[item_id] for item_id in item_ids if item_id in by_id]
+        models = [model] if isinstance(model, str) else list(model)
+        # Бюджеты лимитов у моделей раздельные, поэтому параллелизм по умолчанию — на модель
+        max_concurrency = max_concurrency or EXPERIMENT_MAX_CONCURRENCY * len(models)
+        cells_per_item = len(prompt_versions) * len(models)
+        
+        # Ячейки, завершенные в прошлых запусках с тем же id, не выполняются повторно
+        experiment_id, resume = resolve_run(dataset_name, model, prompt_versions, experiment_id, resume)
+        checkpoints.start(experiment_id, dataset_name, ",".join(models), [version for version, _ in prompt_versions])
+        completed = checkpoints.completed(experiment_id) if resume else {}
+        cells_resumed = sum(
+            1 for item in items for cell_model in models for version, _ in prompt_versions
+            if (item.id, version, cell_model) in completed
+        )
+        
+        if race is not None:
+            race.start(models, [version for version, _ in prompt_versions], len(items))
+        if listener is not None:
+            listener.experiment_started(len(items), len(items) * cells_per_item, cells_resumed)
+        
+        # Счетчики незавершенных ячеек по элементам, чтобы сообщать о готовых элементах
+        pending_cells = [0] * len(items)
+        pending_lock = threading.Lock()
+        item_futures = [[] for _ in items]
+        # В адаптивном режиме ячейки отправляются в пул по мере освобождения мест,
+        # чтобы решение об исключении версии успевало повлиять на следующие элементы
+        slots = threading.BoundedSemaphore(max_concurrency) if race is not None else None
+        
+        def on_cell_done(item_index, cell_model, version, future):
+            if race is not None:
+                race.record(item_index, cell_model, version, future.result())
+            if listener is not None:
+                listener.cell_finished(item_index, version, future.result())
+            with pending_lock:
+                pending_cells[item_index] -= 1
+                item_done = pending_cells[item_index] == 0
+            if not item_done:
+                return
+            if race is not None:
+                for eliminated_model, info in race.item_finished():
+                    logger.info(
+                        f"Эксперимент {experiment_id}: версия {info['version']} модели {eliminated_model} "
+                        f"исключена после {info['items']} элементов (уступает версии {info['leader']})"
                     )
-                    continue
-            
-            results.append({
-                "input": item.input,
-                "expected_output": item.expected_output,
-                "results": item_results
-            })
+                    if listener is not None:
+                        listener.version_eliminated(dict(info, model=eliminated_model))
+            if listener is not None:
+                listener.item_finished(
+                    item_index,
+                    build_item_result(items[item_index], [f.result() for f in item_futures[item_index]])
+                )
+        
+        def run_slot(*args):
+            try:
+                return run_checkpointed_cell(*args)
+            finally:
+                slots.release()
+        
+        # Ячейки (элемент × модель × версия) выполняются параллельно в ограниченном пуле: модели
+        # чередуются внутри элемента и идут одновременно; порядок результатов совпадает с обходом
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for item_index, item in enumerate(items):
+                cells = []
+                skipped = 0
+                for cell_model in models:
+                    for version, prompt_func in prompt_versions:
+                        checkpointed = completed.get((item.id, version, cell_model))
+                        if checkpointed is not None:
+                            future = Future()
+                            future.set_result(checkpointed)
+                        elif race is None:
+                            future = executor.submit(
+                                run_checkpointed_cell, experiment_id, dataset_name, item, version, prompt_func,
+                                cell_model, use_cache, stream
+                            )
+                        else:
+                            slots.acquire()
+                            if not race.is_alive(cell_model, version):
+                                slots.release()
+                                skipped += 1
+                                continue
+                            future = executor.submit(
+                                run_slot, experiment_id, dataset_name, item, version, prompt_func,
+                                cell_model, use_cache, stream
+                            )
+                        cells.append((cell_model, version, future))
+                if skipped:
+                    race.skip(skipped)
+                    if listener is not None:
+                        listener.skip_cells(skipped)
+                item_futures[item_index] = [future for _, _, future in cells]
+                with pending_lock:
+                    pending_cells[item_index] = len(cells)
+                for cell_model, version, future in cells:
+                    future.add_done_callback(partial(on_cell_done, item_index, cell_model, version))
+        
+        results = [build_item_result(item, [future.result() for future in item_futures[index]])
+                   for index, item in enumerate(items)]
         
+        if cells_resumed:
+            logger.info(f"Эксперимент {experiment_id}: {cells_resumed} ячеек восстановлено из чекпоинта")
+        if race is not None and race.cells_skipped:
+            logger.info(f"Эксперимент {experiment_id}: адаптивный режим пропустил {race.cells_skipped} ячеек")
         return results
     except Exception as e:
         logger.error(f"Ошибка при запуске эксперимента: {str(e)}")
         raise
 
-def create_prompt_v1(query):
-    """Базовая версия промпта"""
-    return f"""
-    Пожалуйста, ответь на следующий вопрос максимально подробно и информативно.
-    Вопрос: {query}
-    """
-
-def create_prompt_v2(query):
-    """Оптимизированная версия промпта с контекстом"""
-    return f"""
-    Контекст: Ты - эксперт в области технологий.
+def run_preview(dataset_name, prompt_versions, model, sample_size=None, target_margin=None, confidence=0.95,
+                seed=0, strata=("type", "complexity"), max_concurrency=None, use_cache=True, experiment_id=None,
+                resume=None):
+    """Предварительная оценка версий на стратифицированной выборке элементов
     
-    Правила:
-    1. Начни с краткого ответа (1-2 предложения)
-    2. Приведи 2-3 конкретных примера
-    3. Заверши практическим советом
+    Выборка — префикс фиксированного стратифицированного порядка, поэтому при расширении
+    уже оцененные элементы не меняются, а их ячейки берутся из чекпоинтов того же эксперимента.
+    С target_margin выборка растет, пока полуширина интервала любой версии больше цели."""
+    items = dataset_cache.get(dataset_name).items
+    models = [model] if isinstance(model, str) else list(model)
+    keys = [stratum_key(item.metadata, strata) for item in items]
+    order = stratified_order(keys, seed)
+    population = {}
+    for key in keys:
+        population[key] = population.get(key, 0) + 1
+    # Раунды расширения выборки одного вызова всегда продолжают один прогон
+    experiment_id, _ = resolve_run(dataset_name, model, prompt_versions, experiment_id, resume)
     
-    Вопрос: {query}
-    """
-
-def create_prompt_v3(query):
-    """Версия промпта с шаблоном и ограничениями"""
-    return f"""
-    Ты - эксперт в области технологий. Ответь на вопрос, следуя шаблону:
+    size = min(len(items), max(1, sample_size or PREVIEW_SAMPLE_SIZE))
+    evaluated = 0
+    cells = []
+    results = []
+    rounds = 0
+    while True:
+        batch = [items[index] for index in order[evaluated:size]]
+        batch_results = run_experiment(
+            dataset_name, prompt_versions, model, max_concurrency, use_cache=use_cache,
+            experiment_id=experiment_id, resume=True, item_ids=[item.id for item in batch]
+        )
+        for item, item_result in zip(batch, batch_results):
+            key = stratum_key(item.metadata, strata)
+            for cell in item_result["results"]:
+                cells.append((cell.get("model", models[0]), cell["version"], key, cell["quality_score"]))
+        results.extend(batch_results)
+        evaluated = size
+        rounds += 1
+        
+        estimates = {}
+        for cell_model in models:
+            estimates[cell_model] = {}
+            for version, _ in prompt_versions:
+                selected = [(key, score) for m, v, key, score in cells if m == cell_model and v == version]
+                estimates[cell_model][str(version)] = stratified_mean(
+                    [key for key, _ in selected], [score for _, score in selected], population, confidence
+                )
+        flat = [estimate for by_version in estimates.values() for estimate in by_version.values()]
+        worst = max((estimate["margin"] for estimate in flat if estimate["margin"] is not None), default=None)
+        # Пока в выборке есть не все страты, интервал не доверяем и выборку расширяем
+        complete = all(estimate["complete"] for estimate in flat)
+        if (target_margin is None or size >= len(items) or rounds >= PREVIEW_MAX_ROUNDS
+                or (complete and worst is not None and worst <= target_margin)):
+            break
+        # Нужный размер выборки растет как квадрат отношения текущей полуширины к целевой
+        required = math.ceil(size * (worst / target_margin) ** 2) if worst else size * 2
+        size = min(len(items), max(size + 1, min(required, size * 4)))
     
-    [Краткий ответ]
-    - Основная мысль
-    - Ключевой момент
+    return {
+        "experiment_id": experiment_id,
+        "sample": {
+            "size": evaluated,
+            "population": len(items),
+            "seed": seed,
+            "strata": {
+                "/".join(key): {"population": count, "sampled": sum(1 for index in order[:evaluated] if keys[index] == key)}
+                for key, count in population.items()
+            },
+            "rounds": rounds,
+            "complete": evaluated >= len(items),
+            "next_size": min(len(items), evaluated * 2) if evaluated < len(items) else None
+        },
+        "confidence": confidence,
+        "target_margin": target_margin,
+        "estimates": estimates,
+        "results": results
+    }
+
+def run_batch_experiment(dataset_name, prompt_versions, model="gpt-3.5-turbo", listener=None,
+                         experiment_id=None, resume=None):
+    """Офлайн-прогон эксперимента через пакетный провайдер
     
-    [Примеры]
-    - Пример 1
-    - Пример 2
+    Все ячейки (элемент × версия × модель) без чекпоинта компилируются в один JSONL-файл
+    запросов и отправляются пакетом; после завершения пакета ответы оцениваются одной матрицей
+    критериев, а трейсы, чекпоинты и строки хранилища пишутся пачкой. Задержка отдельного
+    вызова в пакете неизвестна, поэтому latency_seconds у таких ячеек — None."""
+    items = dataset_cache.get(dataset_name).items
+    models = [model] if isinstance(model, str) else list(model)
+    experiment_id, resume = resolve_run(dataset_name, model, prompt_versions, experiment_id, resume)
+    checkpoints.start(experiment_id, dataset_name, ",".join(models), [version for version, _ in prompt_versions])
+    completed = checkpoints.completed(experiment_id) if resume else {}
     
-    [Практическое применение]
-    - Совет 1
-    - Совет 2
+    # Результаты ячеек по элементам в порядке обхода (модель × версия), как в run_experiment
+    cells = {}
+    pending = []
+    for item_index, item in enumerate(items):
+        for cell_model in models:
+            for version, prompt_func in prompt_versions:
+                checkpointed = completed.get((item.id, version, cell_model))
+                cells[(item_index, cell_model, version)] = checkpointed
+                if checkpointed is None:
+                    pending.append((item_index, item, version, prompt_func, cell_model))
+    cells_resumed = len(cells) - len(pending)
+    if listener is not None:
+        listener.experiment_started(len(items), len(cells), cells_resumed)
     
-    Вопрос: {query}
+    if pending:
+        batch_id = batch_submitter.pending(experiment_id) if resume else None
+        if batch_id is None:
+            batch_id, count = batch_submitter.submit(experiment_id, (
+                (cell_custom_id(item.id, version, cell_model), {
+                    "model": cell_model,
+                    "messages": build_messages(prompt_func(item.input["text"])),
+                    "temperature": 0.7
+                })
+                for _, item, version, prompt_func, cell_model in pending
+            ))
+            logger.info(f"Эксперимент {experiment_id}: отправлен пакет {batch_id} ({count} запросов)")
+        else:
+            logger.info(f"Эксперимент {experiment_id}: продолжается опрос пакета {batch_id}")
+        
+        status = batch_submitter.wait(
+            batch_id, on_progress=listener.batch_progress if listener is not None else None
+        )
+        responses = batch_submitter.results(batch_id)
+        if not responses:
+            # Пакет без результатов не переиспользуется: следующий запуск отправит новый
+            batch_submitter.finish(experiment_id)
+            raise BatchError(f"Пакет {batch_id} завершился со статусом {status['status']} без результатов")
+        
+        # Ответы всех ячеек оцениваются за один проход по критериям
+        answered = []
+        for cell in pending:
+            item_index, item, version, _, cell_model = cell
+            body, error = responses.get(cell_custom_id(item.id, version, cell_model), (None, None))
+            labels = {"model": cell_model, "version": version}
+            LLM_CALLS.inc(**labels)
+            if body is None:
+                LLM_ERRORS.inc(**labels)
+                logger.error(f"Ошибка при обработке версии {version} в пакете {batch_id}: {error or 'нет ответа'}")
+                continue
+            usage = body.get("usage") or {}
+            answered.append((cell, body["choices"][0]["message"]["content"], usage.get("total_tokens")))
+        with span(EXPERIMENT_PHASE_SECONDS, phase="scoring", model=",".join(models), version="batch"):
+            scores = scoring_engine.score_batch([answer for _, answer, _ in answered])
+        
+        saved = []
+        rows = []
+        for position, ((item_index, item, version, _, cell_model), answer, tokens_used) in enumerate(answered):
+            quality_score = scores.score(position)
+            criteria = scores.criteria(position)
+            LLM_TOKENS.inc(tokens_used or 0, model=cell_model, version=version)
+            trace_id = telemetry.trace(
+                name=f"experiment_{version}",
+                input=item.input,
+                metadata={
+                    "dataset": dataset_name,
+                    "version": version,
+                    "model": cell_model,
+                    "item_id": item.id,
+                    "batch_id": batch_id
+                }
+            )
+            telemetry.update_trace(
+                trace_id,
+                output={"answer": answer, "tokens_used": tokens_used, "quality_score": quality_score},
+                metadata={
+                    "quality_metrics": {
+                        "score": quality_score,
+                        "max_score": scoring_engine.max_score,
+                        "criteria": criteria
+                    }
+                }
+            )
+            telemetry.score(
+                trace_id=trace_id,
+                name="quality",
+                value=quality_score,
+                comment=f"Оценка качества версии {version}"
+            )
+            result = {
+                "version": version,
+                "model": cell_model,
+                "answer": answer,
+                "tokens_used": tokens_used,
+                "quality_score": quality_score,
+                "criteria": criteria,
+                "latency_seconds": None,
+                "batch_id": batch_id
+            }
+            cells[(item_index, cell_model, version)] = result
+            saved.append((item.id, version, cell_model, result))
+            rows.append(result_row(experiment_id, item, cell_model, result))
+        checkpoints.save_many(experiment_id, saved)
+        try:
+            result_store.append(rows)
+        except Exception as e:
+            logger.error(f"Ошибка записи результатов в хранилище: {str(e)}")
+        batch_submitter.finish(experiment_id)
     
-    Ограничения:
-    - Не используй технический жаргон
-    - Держи ответ в пределах 200 слов
-    - Фокусируйся на практической пользе
-    """
+    results = []
+    for item_index, item in enumerate(items):
+        item_cells = [cells[(item_index, cell_model, version)] for cell_model in models for version, _ in prompt_versions]
+        if listener is not None:
+            for (version, _), result in zip(prompt_versions * len(models), item_cells):
+                listener.cell_finished(item_index, version, result)
+        item_result = build_item_result(item, item_cells)
+        if listener is not None:
+            listener.item_finished(item_index, item_result)
+        results.append(item_result)
+    if cells_resumed:
+        logger.info(f"Эксперимент {experiment_id}: {cells_resumed} ячеек восстановлено из чекпоинта")
+    return results
+
+def run_checkpointed_cell(experiment_id, dataset_name, item, version, prompt_func, model, use_cache, stream):
+    """Ячейка эксперимента с записью результата в чекпоинт сразу после завершения"""
+    result = run_experiment_cell(dataset_name, item, version, prompt_func, model, use_cache, stream)
+    checkpoints.save(experiment_id, item.id, version, model, result)
+    if result is not None:
+        store_cell_result(experiment_id, item, model, result)
+    return result
+
+def result_row(experiment_id, item, model, result):
+    """Строка колоночного хранилища по результату ячейки"""
+    metadata = item.metadata or {}
+    return {
+        "experiment": experiment_id,
+        "item": item.id,
+        "version": result["version"],
+        "model": model,
+        "item_type": metadata.get("type"),
+        "complexity": metadata.get("complexity"),
+        "quality_score": result["quality_score"],
+        "tokens": result["tokens_used"],
+        "latency_seconds": result["latency_seconds"],
+        "time_to_first_token": (result.get("streaming") or {}).get("time_to_first_token"),
+        "criteria": result["criteria"],
+        "answer": result["answer"]
+    }
+
+def store_cell_result(experiment_id, item, model, result):
+    """Дозапись ячейки в колоночное хранилище результатов"""
+    try:
+        result_store.append([result_row(experiment_id, item, model, result)])
+    except Exception as e:
+        logger.error(f"Ошибка записи результата в хранилище: {str(e)}")
+
+def build_item_result(item, cells):
+    """Сборка результата по элементу датасета из результатов его ячеек"""
+    return {
+        "input": item.input,
+        "expected_output": item.expected_output,
+        "results": [cell for cell in cells if cell is not None]
+    }
+
+def parse_max_concurrency(value):
+    """Проверка параметра max_concurrency из запроса"""
+    if value is None:
+        return None
+    value = int(value)
+    if value < 1:
+        raise ValueError("max_concurrency должен быть положительным числом")
+    return value
+
+def parse_models(data):
+    """Модель или список моделей эксперимента из полей model/models запроса"""
+    models = data.get("models")
+    if models is None:
+        return data.get("model", "gpt-3.5-turbo")
+    if isinstance(models, str):
+        models = [name.strip() for name in models.split(",")]
+    if not isinstance(models, list) or not all(isinstance(name, str) and name for name in models):
+        raise ValueError("Поле models должно быть списком названий моделей")
+    models = list(dict.fromkeys(models))
+    if not models:
+        raise ValueError("Список models пуст")
+    if len(models) > EXPERIMENT_MAX_MODELS:
+        raise ValueError(f"Не больше {EXPERIMENT_MAX_MODELS} моделей в одном эксперименте")
+    # Одна модель из списка — обычный эксперимент с прежним id
+    return models[0] if len(models) == 1 else models
+
+def parse_adaptive(data):
+    """Адаптивный режим: {"adaptive": true, "confidence": 0.95, "min_items": 10}"""
+    if not data.get("adaptive"):
+        return None
+    return {
+        "confidence": float(data.get("confidence", ADAPTIVE_CONFIDENCE)),
+        "min_items": int(data.get("min_items", ADAPTIVE_MIN_ITEMS))
+    }
+
+def parse_run(data, dataset_name, model):
+    """id прогона и возобновление из полей experiment_id/resume запроса"""
+    resume = data.get("resume")
+    return resolve_run(
+        dataset_name, model, PROMPT_VERSIONS, data.get("experiment_id"), None if resume is None else bool(resume)
+    )
+
+def parse_mode(data):
+    """Режим эксперимента: online — вызовы по ячейкам, batch — один пакет через провайдер"""
+    mode = data.get("mode", "online")
+    if mode not in ("online", "batch"):
+        raise ValueError("mode должен быть online или batch")
+    if mode == "batch" and (data.get("adaptive") or data.get("stream")):
+        raise ValueError("Пакетный режим несовместим с adaptive и stream")
+    return mode
+
+def run_experiment_job(job):
+    """Выполнение эксперимента в фоновом воркере"""
+    if job.params.get("mode") == "batch":
+        return run_batch_experiment(
+            job.params["dataset_name"],
+            PROMPT_VERSIONS,
+            job.params["model"],
+            listener=job,
+            experiment_id=job.params["experiment_id"],
+            resume=job.params["resume"]
+        )
+    adaptive = job.params.get("adaptive")
+    return run_experiment(
+        job.params["dataset_name"],
+        PROMPT_VERSIONS,
+        job.params["model"],
+        job.params["max_concurrency"],
+        listener=job,
+        use_cache=job.params["use_cache"],
+        stream=job.params["stream"],
+        experiment_id=job.params["experiment_id"],
+        resume=job.params["resume"],
+        race=ExperimentRace(**adaptive) if adaptive else None
+    )
+
+# Состояние задач в общем файле: статус и события отдает любой воркер WSGI-сервера
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join("results", "jobs.sqlite"))
+experiment_jobs = JobManager(
+    run_experiment_job,
+    max_workers=EXPERIMENT_JOB_WORKERS,
+    store=JobStore(JOB_STORE_PATH) if JOB_STORE_PATH else None,
+    poll_interval=float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "0.5"))
+)
+
+def enumerate_items(items):
+    """Элементы в формате записей для bulk_ingest"""
+    for index, item in enumerate(items):
+        yield index, item, None
 
 def create_initial_dataset():
     """Создание начального датасета при запуске приложения"""
     try:
         # Проверяем, существует ли датасет
         try:
-            dataset = langfuse.get_dataset(PROMPT_TUNING_DATASET["name"])
+            dataset = dataset_cache.get(PROMPT_TUNING_DATASET["name"])
             logger.info(f"Датасет {PROMPT_TUNING_DATASET['name']} уже существует")
             return dataset
         except Exception:
@@ -250,14 +849,16 @@ def create_initial_dataset():
                 description=PROMPT_TUNING_DATASET["description"]
             )
             
-            # Добавляем элементы в датасет
-            for item in PROMPT_TUNING_DATASET["items"]:
-                add_dataset_item(
-                    dataset_name=PROMPT_TUNING_DATASET["name"],
-                    input_data=item["input"],
-                    expected_output=item["expected_output"],
-                    metadata=item["metadata"]
-                )
+            # Добавляем элементы в датасет параллельно
+            report = bulk_ingest(
+                enumerate_items(PROMPT_TUNING_DATASET["items"]),
+                lambda input_data, expected_output, metadata: add_dataset_item(
+                    PROMPT_TUNING_DATASET["name"], input_data, expected_output, metadata
+                ),
+                max_parallel=INGEST_MAX_PARALLEL
+            )
+            if report["failed"]:
+                raise RuntimeError(f"Не удалось добавить {report['failed']} элементов начального датасета")
             
             logger.info(f"Датасет {PROMPT_TUNING_DATASET['name']} создан успешно")
             return dataset
@@ -273,7 +874,7 @@ def index():
 def get_datasets():
     """Получение списка доступных датасетов"""
     try:
-        return jsonify({
+        return response_cache.respond(request, ("datasets",), lambda: {
             "status": "success",
             "datasets": list(AVAILABLE_DATASETS.keys())
         })
@@ -285,7 +886,7 @@ def get_datasets():
 
 @app.route("/dataset/<name>")
 def get_dataset(name):
-    """Получение информации о конкретном датасете"""
+    """Получение информации о датасете; элементы отдаются страницами по курсору"""
     try:
         if name not in AVAILABLE_DATASETS:
             return jsonify({
@@ -293,10 +894,30 @@ def get_dataset(name):
                 "message": f"Dataset {name} not found"
             }), 404
         
+        limit = parse_limit(request.args.get("limit"))
+        cursor = request.args.get("cursor")
+        dataset = AVAILABLE_DATASETS[name]
+        version = static_dataset_version(name)
+        
+        def build():
+            items, next_cursor = paginate(dataset["items"], cursor, limit, version)
+            return {
+                "status": "success",
+                "dataset": dict(
+                    {key: value for key, value in dataset.items() if key != "items"},
+                    items=items,
+                    items_total=len(dataset["items"]),
+                    version=version
+                ),
+                "next_cursor": next_cursor
+            }
+        
+        return response_cache.respond(request, ("dataset", name, version, cursor, limit), build)
+    except (CursorError, ValueError) as e:
         return jsonify({
-            "status": "success",
-            "dataset": AVAILABLE_DATASETS[name]
-        })
+            "status": "error",
+            "message": str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -336,7 +957,15 @@ def add_item_route():
     metadata = data.get("metadata")
     
     try:
-        item = add_dataset_item(dataset_name, input_data, expected_output, metadata)
+        dedup = deduplicator.resolve_mode(data.get("dedup"))
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    
+    try:
+        item = add_dataset_item(dataset_name, input_data, expected_output, metadata, dedup=dedup)
         return jsonify({
             "status": "success",
             "item": {
@@ -344,7 +973,65 @@ def add_item_route():
                 "input": item.input,
                 "expected_output": item.expected_output,
                 "metadata": item.metadata
-            }
+            },
+            "near_duplicate_of": (item.metadata or {}).get("near_duplicate_of")
+        })
+    except DuplicateItemError as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "near_duplicate_of": e.duplicate_of,
+            "similarity": e.similarity
+        }), 409
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route("/add_items", methods=["POST"])
+def add_items_route():
+    """Пакетная загрузка элементов: JSON-массив или JSONL-поток"""
+    dataset_name = request.args.get("dataset_name")
+    if not dataset_name:
+        return jsonify({
+            "status": "error",
+            "error": "Параметр dataset_name обязателен"
+        }), 400
+    
+    content_type = request.mimetype or ""
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/x-jsonlines"):
+        entries = iter_jsonl(request.stream)
+    else:
+        entries = iter_json_array(request.stream)
+    
+    try:
+        max_parallel = int(request.args.get("max_parallel", INGEST_MAX_PARALLEL))
+        dedup = deduplicator.resolve_mode(request.args.get("dedup"))
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    
+    try:
+        report = bulk_ingest(
+            entries,
+            lambda input_data, expected_output, metadata: add_dataset_item(
+                dataset_name, input_data, expected_output, metadata, dedup=dedup
+            ),
+            max_parallel=max(1, max_parallel)
+        )
+        if report["parse_error"]:
+            # Элементы до места ошибки уже созданы: отчет нужен клиенту, чтобы не дублировать их
+            return jsonify({
+                "status": "error",
+                "error": report["parse_error"],
+                "report": report
+            }), 400
+        return jsonify({
+            "status": "success",
+            "report": report
         })
     except Exception as e:
         return jsonify({
@@ -358,19 +1045,488 @@ def run_experiment_route():
     """Запуск эксперимента"""
     data = request.get_json()
     dataset_name = data.get("dataset_name")
+    
+    try:
+        model = parse_models(data)
+        max_concurrency = parse_max_concurrency(data.get("max_concurrency"))
+        adaptive = parse_adaptive(data)
+        race = ExperimentRace(**adaptive) if adaptive else None
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    
+    try:
+        experiment_id, resume = parse_run(data, dataset_name, model)
+        results = run_experiment(
+            dataset_name,
+            PROMPT_VERSIONS,
+            model,
+            max_concurrency,
+            use_cache=bool(data.get("use_cache", True)),
+            stream=bool(data.get("stream", False)),
+            experiment_id=experiment_id,
+            resume=resume,
+            race=race
+        )
+        return jsonify({
+            "status": "success",
+            "experiment_id": experiment_id,
+            "results": results,
+            "models": summarize_models(results),
+            "adaptive": race.summary() if race is not None else None
+        })
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route("/experiments", methods=["POST"])
+def submit_experiment_route():
+    """Постановка эксперимента в фоновую очередь"""
+    data = request.get_json()
+    
+    try:
+        dataset_name = data.get("dataset_name")
+        model = parse_models(data)
+        mode = parse_mode(data)
+        adaptive = parse_adaptive(data)
+        if adaptive:
+            # Проверка параметров до постановки в очередь
+            ExperimentRace(**adaptive)
+        experiment_id, resume = parse_run(data, dataset_name, model)
+        job = experiment_jobs.submit({
+            "dataset_name": dataset_name,
+            "model": model,
+            "max_concurrency": parse_max_concurrency(data.get("max_concurrency")),
+            "use_cache": bool(data.get("use_cache", True)),
+            "stream": bool(data.get("stream", False)),
+            "experiment_id": experiment_id,
+            "resume": resume,
+            "adaptive": adaptive,
+            "mode": mode
+        })
+        return jsonify({
+            "status": "success",
+            "job_id": job.id,
+            "status_url": f"/experiments/{job.id}",
+            "events_url": f"/experiments/{job.id}/events"
+        }), 202
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+
+@app.route("/experiments/compare")
+def compare_experiments_route():
+    """Сравнение версий промптов по истории результатов: перцентили и бутстрэп-интервалы"""
+    try:
+        strata = [name for name in request.args.get("strata", "type,complexity").split(",") if name]
+        unknown = [name for name in strata if name not in STRATA]
+        if unknown:
+            raise ValueError(f"Неизвестные страты: {', '.join(unknown)}")
+        confidence = float(request.args.get("confidence", 0.95))
+        if not 0 < confidence < 1:
+            raise ValueError("confidence должен быть в интервале (0, 1)")
+        n_boot = int(request.args.get("n_boot", 2000))
+        if n_boot < 1:
+            raise ValueError("n_boot должен быть положительным числом")
+        baseline = int(request.args.get("baseline", 1))
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    
+    try:
+        comparison = compare_versions(
+            result_store.load(),
+            experiment=request.args.get("experiment_id"),
+            model=request.args.get("model"),
+            strata=strata,
+            baseline=baseline,
+            n_boot=n_boot,
+            confidence=confidence
+        )
+        return jsonify({
+            "status": "success",
+            "comparison": comparison
+        })
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route("/experiments/preview", methods=["POST"])
+def preview_experiment_route():
+    """Быстрая оценка версий на стратифицированной выборке с интервалами; выборку можно расширять"""
+    data = request.get_json()
+    
+    try:
+        dataset_name = data.get("dataset_name")
+        model = parse_models(data)
+        max_concurrency = parse_max_concurrency(data.get("max_concurrency"))
+        strata = data.get("strata", ["type", "complexity"])
+        if isinstance(strata, str):
+            strata = [name for name in strata.split(",") if name]
+        unknown = [name for name in strata if name not in STRATA]
+        if unknown:
+            raise ValueError(f"Неизвестные страты: {', '.join(unknown)}")
+        sample_size = data.get("sample_size")
+        sample_size = int(sample_size) if sample_size is not None else None
+        if sample_size is not None and sample_size < 1:
+            raise ValueError("sample_size должен быть положительным числом")
+        target_margin = data.get("target_margin")
+        target_margin = float(target_margin) if target_margin is not None else None
+        if target_margin is not None and target_margin <= 0:
+            raise ValueError("target_margin должен быть положительным числом")
+        confidence = float(data.get("confidence", 0.95))
+        if not 0 < confidence < 1:
+            raise ValueError("confidence должен быть в интервале (0, 1)")
+        seed = int(data.get("seed", 0))
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    
+    try:
+        preview = run_preview(
+            dataset_name,
+            PROMPT_VERSIONS,
+            model,
+            sample_size=sample_size,
+            target_margin=target_margin,
+            confidence=confidence,
+            seed=seed,
+            strata=strata,
+            max_concurrency=max_concurrency,
+            use_cache=bool(data.get("use_cache", True)),
+            experiment_id=data.get("experiment_id"),
+            resume=data.get("resume")
+        )
+        return jsonify(dict(preview, status="success"))
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route("/experiments/<job_id>")
+def experiment_status_route(job_id):
+    """Статус и прогресс фонового эксперимента"""
+    job = experiment_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Job {job_id} not found"
+        }), 404
+    
+    snapshot = job.snapshot(include_results=True)
+    if snapshot.get("results") is not None:
+        snapshot["models"] = summarize_models(snapshot["results"])
+    return jsonify({
+        "status": "success",
+        "job": snapshot
+    })
+
+@app.route("/experiments/<job_id>/events")
+def experiment_events_route(job_id):
+    """Поток результатов фонового эксперимента (Server-Sent Events)"""
+    job = experiment_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Job {job_id} not found"
+        }), 404
+    
+    last_event_id = int(request.headers.get("Last-Event-ID", 0) or 0)
+    
+    def stream():
+        for event in job.events(last_event_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield format_sse(*event)
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/checkpoints")
+def list_checkpoints_route():
+    """Список экспериментов с сохраненными чекпоинтами"""
+    return jsonify({
+        "status": "success",
+        "experiments": checkpoints.list()
+    })
+
+@app.route("/checkpoints/<experiment_id>")
+def checkpoint_route(experiment_id):
+    """Прогресс эксперимента по чекпоинтам"""
+    experiment = checkpoints.describe(experiment_id)
+    if experiment is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Experiment {experiment_id} not found"
+        }), 404
+    
+    return jsonify({
+        "status": "success",
+        "experiment": experiment
+    })
+
+@app.route("/checkpoints/<experiment_id>", methods=["DELETE"])
+def delete_checkpoint_route(experiment_id):
+    """Сброс чекпоинтов: следующий запуск выполнит все ячейки заново"""
+    return jsonify({
+        "status": "success",
+        "cells_deleted": checkpoints.delete(experiment_id)
+    })
+
+@app.route("/results/stats")
+def result_store_stats_route():
+    """Размер колоночного хранилища результатов"""
+    return jsonify({
+        "status": "success",
+        "store": result_store.stats()
+    })
+
+def parse_routing_params(data):
+    """Параметры маршрутизации из тела запроса или query string"""
+    prompt_funcs = dict(PROMPT_VERSIONS)
+    version = int(data.get("version") or ROUTER_PROMPT_VERSION)
+    if version not in prompt_funcs:
+        raise ValueError(f"Неизвестная версия промпта {version}")
+    min_quality = data.get("min_quality")
+    models = data.get("models")
+    if isinstance(models, str):
+        models = [name.strip() for name in models.split(",") if name.strip()]
+    if models is not None and not isinstance(models, list):
+        raise ValueError("Поле models должно быть списком названий моделей")
+    return {
+        "version": version,
+        "item_type": data.get("item_type") or None,
+        "objective": data.get("objective") or "cost",
+        "min_quality": float(min_quality) if min_quality is not None else None,
+        "models": models or None
+    }
+
+@app.route("/router/decision")
+def router_decision_route():
+    """Какую модель выбрал бы маршрутизатор и по каким показателям"""
+    try:
+        decision = model_router.decide(**parse_routing_params(request.args))
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    return jsonify({
+        "status": "success",
+        "decision": decision
+    })
+
+@app.route("/ask", methods=["POST"])
+def ask_route():
+    """Ответ на запрос моделью, выбранной маршрутизатором по истории экспериментов"""
+    data = request.get_json()
+    query = data.get("query")
+    
+    try:
+        if not query:
+            raise ValueError("Поле query обязательно")
+        decision = model_router.decide(**parse_routing_params(data))
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    
+    version = decision["version"]
+    model = decision["model"]
+    trace_id = telemetry.trace(
+        name=f"ask_v{version}",
+        input={"query": query},
+        metadata={"version": version, "model": model, "routing": decision["reason"]}
+    )
+    try:
+        started = time.perf_counter()
+        response, cached = cached_chat_completion(
+            get_openai_client(),
+            use_cache=bool(data.get("use_cache", True)),
+            model=model,
+            messages=build_messages(dict(PROMPT_VERSIONS)[version](query)),
+            temperature=0.7
+        )
+        latency = time.perf_counter() - started
+        answer = response.choices[0].message.content
+        tokens_used = response.usage.total_tokens if response.usage else None
+        quality_score, criteria = scoring_engine.score(answer)
+        telemetry.update_trace(
+            trace_id,
+            output={"answer": answer, "tokens_used": tokens_used, "quality_score": quality_score},
+            metadata={"routing": {"model": model, "reason": decision["reason"], "objective": decision["objective"]}}
+        )
+        return jsonify({
+            "status": "success",
+            "trace_id": trace_id,
+            "model": model,
+            "answer": answer,
+            "tokens_used": tokens_used,
+            "quality_score": quality_score,
+            "criteria": criteria,
+            "latency_seconds": latency,
+            "cached": cached,
+            "routing": decision
+        })
+    except Exception as e:
+        logger.error(f"Ошибка ответа через маршрутизатор: {str(e)}")
+        telemetry.update_trace(trace_id, output={"error": str(e)}, metadata={"error": True})
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route("/stream_prompt", methods=["POST"])
+def stream_prompt_route():
+    """Потоковая генерация ответа с пересылкой токенов клиенту (Server-Sent Events)"""
+    data = request.get_json()
+    query = data.get("query")
     model = data.get("model", "gpt-3.5-turbo")
+    prompt_funcs = dict(PROMPT_VERSIONS)
     
-    prompt_versions = [
-        (1, create_prompt_v1),
-        (2, create_prompt_v2),
-        (3, create_prompt_v3)
-    ]
+    try:
+        version = int(data.get("version", 1))
+        if not query:
+            raise ValueError("Поле query обязательно")
+        if version not in prompt_funcs:
+            raise ValueError(f"Неизвестная версия промпта {version}")
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    
+    def stream():
+        trace_id = telemetry.trace(
+            name=f"stream_prompt_v{version}",
+            input={"query": query},
+            metadata={"version": version, "model": model, "streaming": True}
+        )
+        chat_stream = ChatStream(
+            get_openai_client(),
+            model=model,
+            messages=build_messages(prompt_funcs[version](query)),
+            temperature=0.7
+        )
+        try:
+            for index, delta in enumerate(chat_stream):
+                yield format_sse(index + 1, "token", {"delta": delta})
+            metrics = chat_stream.metrics()
+            telemetry.update_trace(
+                trace_id,
+                output={"answer": chat_stream.answer, "tokens_used": chat_stream.total_tokens},
+                metadata={"streaming": metrics}
+            )
+            yield format_sse(chat_stream.chunks + 1, "done", {
+                "trace_id": trace_id,
+                "tokens_used": chat_stream.total_tokens,
+                "metrics": metrics
+            })
+        except Exception as e:
+            logger.error(f"Ошибка потоковой генерации: {str(e)}")
+            telemetry.update_trace(trace_id, output={"error": str(e)}, metadata={"error": True})
+            yield format_sse(chat_stream.chunks + 1, "error", {"error": str(e)})
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/rescore", methods=["POST"])
+def rescore_route():
+    """Пакетная переоценка ответов текущим набором критериев"""
+    data = request.get_json()
+    answers = data.get("answers")
+    if not isinstance(answers, list):
+        return jsonify({
+            "status": "error",
+            "error": "Поле answers должно быть списком строк"
+        }), 400
+    
+    batch = scoring_engine.score_batch(answers)
+    return jsonify({
+        "status": "success",
+        "criteria": batch.names,
+        "max_score": scoring_engine.max_score,
+        "scores": [batch.score(index) for index in range(len(batch))],
+        "matrix": batch.matrix.astype(int).tolist()
+    })
+
+@app.route("/rate_limits/stats")
+def rate_limits_stats_route():
+    """Состояние бюджетов RPM/TPM и повторов по моделям"""
+    return jsonify({
+        "status": "success",
+        "models": request_scheduler.stats()
+    })
+
+@app.route("/llm_cache/stats")
+def llm_cache_stats_route():
+    """Статистика кэша ответов LLM"""
+    return jsonify({
+        "status": "success",
+        "cache": llm_cache.stats(),
+        "single_flight": single_flight.stats()
+    })
+
+@app.route("/llm_cache", methods=["DELETE"])
+def llm_cache_clear_route():
+    """Очистка кэша ответов LLM"""
+    try:
+        llm_cache.clear()
+        return jsonify({"status": "success"})
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route("/response_cache/stats")
+def response_cache_stats_route():
+    """Статистика кэша сериализованных ответов"""
+    return jsonify({
+        "status": "success",
+        "stats": response_cache.stats()
+    })
+
+@app.route("/dataset/<name>/duplicates")
+def dataset_duplicates_route(name):
+    """Отчет о кластерах почти дубликатов среди элементов датасета"""
+    try:
+        threshold = float(request.args.get("threshold", deduplicator.threshold))
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold должен быть в интервале (0, 1]")
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
     
     try:
-        results = run_experiment(dataset_name, prompt_versions, model)
         return jsonify({
             "status": "success",
-            "results": results
+            "dataset": name,
+            "threshold": threshold,
+            "report": deduplicator.report(load_dataset_texts(name), threshold)
         })
     except Exception as e:
         return jsonify({
@@ -378,12 +1534,121 @@ def run_experiment_route():
             "error": str(e)
         }), 500
 
-if __name__ == "__main__":
-    # Создаем директорию для результатов, если её нет
+@app.route("/dedup/stats")
+def dedup_stats_route():
+    """Режим дедупликации и размеры индексов почти дубликатов"""
+    return jsonify({
+        "status": "success",
+        "stats": deduplicator.stats()
+    })
+
+@app.route("/dataset_cache/stats")
+def dataset_cache_stats_route():
+    """Состояние локального кэша датасетов"""
+    return jsonify({
+        "status": "success",
+        "cache": dataset_cache.stats()
+    })
+
+@app.route("/dataset_cache", methods=["DELETE"])
+@app.route("/dataset_cache/<name>", methods=["DELETE"])
+def dataset_cache_invalidate_route(name=None):
+    """Явный сброс кэша датасета (или всех датасетов)"""
+    try:
+        dataset_cache.invalidate(name)
+        return jsonify({"status": "success"})
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route("/http_pool/stats")
+def http_pool_stats_route():
+    """Состояние пулов соединений к OpenAI в текущем процессе"""
+    return jsonify({
+        "status": "success",
+        "pools": pool_stats()
+    })
+
+@app.route("/telemetry/stats")
+def telemetry_stats_route():
+    """Метрики очереди телеметрии: глубина, потери, задержка отправки"""
+    return jsonify({
+        "status": "success",
+        "telemetry": telemetry.stats()
+    })
+
+@app.route("/metrics")
+def metrics_route():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(registry.render(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route("/healthz")
+def healthz_route():
+    """Liveness: процесс запущен и обрабатывает запросы"""
+    return jsonify({"status": "success"})
+
+@app.route("/readyz")
+def readyz_route():
+    """Readiness: зависимости прогреты, начальный датасет создан"""
+    state = readiness.snapshot()
+    return jsonify({
+        "status": "success" if state["ready"] else "warming_up",
+        "readiness": state
+    }), 200 if state["ready"] else 503
+
+WARMUP_STEPS = [
+    ("langfuse_auth", lambda: get_langfuse().auth_check()),
+    ("openai_client", get_openai_client),
+    ("initial_dataset", create_initial_dataset)
+]
+
+# Прогрев зависимостей в фоне: импорт модуля не ждет сетевых вызовов,
+# а сбой Langfuse не роняет процесс, а повторяется с backoff.
+# Под WSGI-сервером (APP_WARMUP=preload) прогрев выполняет create_app
+readiness = Readiness([name for name, _ in WARMUP_STEPS])
+if os.getenv("APP_WARMUP", "background") == "background":
+    start_warmup(readiness, WARMUP_STEPS)
+
+def create_app(preload=False, forks_workers=False):
+    """Фабрика приложения для WSGI-сервера; preload прогревает зависимости синхронно
+    
+    forks_workers — процесс после create_app форкает воркеры (gunicorn с preload_app): тогда
+    незавершенный прогрев повторит init_worker в каждом воркере, а не фоновый поток мастера."""
     os.makedirs("results", exist_ok=True)
     os.makedirs("static", exist_ok=True)
-    
-    # Создаем начальный датасет
-    create_initial_dataset()
-    
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    if preload:
+        # Шаблоны компилируются и датасеты загружаются один раз в мастер-процессе,
+        # воркеры получают их готовыми после fork
+        app.jinja_env.get_template("index.html")
+        if warm_up(readiness, WARMUP_STEPS, max_attempts=PRELOAD_WARMUP_ATTEMPTS):
+            dataset_cache.get(PROMPT_TUNING_DATASET["name"])
+        elif forks_workers:
+            logger.warning("Предзагрузка не удалась, воркеры прогреются самостоятельно")
+        else:
+            logger.warning("Предзагрузка не удалась, прогрев продолжится в фоне")
+            start_warmup(readiness, WARMUP_STEPS)
+    elif not readiness.is_ready and os.getenv("APP_WARMUP", "background") != "background":
+        start_warmup(readiness, WARMUP_STEPS)
+    return app
+
+def init_worker():
+    """Инициализация воркера после fork: клиенты Langfuse и OpenAI создаются заново"""
+    reset_clients()
+    if not readiness.is_ready:
+        start_warmup(readiness, WARMUP_STEPS)
+
+def shutdown_worker():
+    """Остановка воркера: отправка буфера телеметрии и закрытие соединений"""
+    telemetry.close()
+    close_clients()
+
+if __name__ == "__main__":
+    create_app()
+    app.run(
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "5000")),
+        debug=os.getenv("FLASK_DEBUG", "1") == "1",
+        threaded=True
+    ) 
\ No newline at end of file
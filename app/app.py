@@ -6,35 +6,207 @@ from dotenv import load_dotenv
 import json
 from datetime import datetime
 import httpx
+from concurrent.futures import ThreadPoolExecutor
 from app.datasets import AVAILABLE_DATASETS
+from clients import get_openai_client
+from llm import chat_completion
+from microbatch import MicroBatcher
+from prompts import PROMPT_VERSIONS, build_messages
+from response_cache import CursorError, ResponseCache, content_version, paginate, parse_limit
+from scoring import scoring_engine
+
+load_dotenv()
 
 app = Flask(__name__)
 
+# Микропакеты /api/*: запросы, пришедшие в пределах окна, обрабатываются одним проходом.
+# Окно закрывается по размеру пачки или через MICROBATCH_MAX_WAIT_MS после первого запроса
+MICROBATCH_MAX_SIZE = int(os.getenv('MICROBATCH_MAX_SIZE', '32'))
+MICROBATCH_MAX_WAIT = float(os.getenv('MICROBATCH_MAX_WAIT_MS', '10')) / 1000
+# Пачек генерации в обработке одновременно и параллельных вызовов модели на все пачки
+PREDICT_BATCH_WORKERS = int(os.getenv('PREDICT_BATCH_WORKERS', '4'))
+PREDICT_MAX_PARALLEL = int(os.getenv('PREDICT_MAX_PARALLEL', '16'))
+
+PROMPTS = dict(PROMPT_VERSIONS)
+generation_pool = ThreadPoolExecutor(max_workers=PREDICT_MAX_PARALLEL, thread_name_prefix='predict')
+
+
+def score_answers(answers):
+    """Пачка ответов оценивается одной матрицей критериев"""
+    scores = scoring_engine.score_batch(answers)
+    return [(scores.score(index), scores.explain(index)) for index in range(len(scores))]
+
+
+def generate_answers(requests):
+    """Пачка запросов генерации: одинаковые запросы пачки с use_cache — один вызов модели,
+    остальные идут параллельно, все ответы оцениваются одним проходом"""
+    # Без кэша каждый запрос получает собственный ответ модели
+    requests = [request if request[3] else request + (index,) for index, request in enumerate(requests)]
+    unique = list(dict.fromkeys(requests))
+
+    def generate(key):
+        query, version, model, use_cache = key[:4]
+        try:
+            response = chat_completion(
+                get_openai_client(),
+                use_cache=use_cache,
+                model=model,
+                messages=build_messages(PROMPTS[version](query)),
+                temperature=0.7
+            )
+            return response.choices[0].message.content, response.usage.total_tokens if response.usage else None
+        except Exception as e:
+            return e
+
+    generated = dict(zip(unique, generation_pool.map(generate, unique)))
+    answered = [key for key in unique if not isinstance(generated[key], Exception)]
+    scored = dict(zip(answered, score_answers([generated[key][0] for key in answered])))
+    results = []
+    for key in requests:
+        if isinstance(generated[key], Exception):
+            results.append(generated[key])
+            continue
+        answer, tokens_used = generated[key]
+        score, criteria = scored[key]
+        results.append({'answer': answer, 'tokens_used': tokens_used, 'score': score, 'criteria': criteria})
+    return results
+
+
+scoring_batcher = MicroBatcher(
+    score_answers, max_batch_size=MICROBATCH_MAX_SIZE, max_wait=MICROBATCH_MAX_WAIT, name='score-batch'
+)
+predict_batcher = MicroBatcher(
+    generate_answers, max_batch_size=MICROBATCH_MAX_SIZE, max_wait=MICROBATCH_MAX_WAIT,
+    workers=PREDICT_BATCH_WORKERS, name='predict-batch'
+)
+
+# Датасеты неизменны в рамках процесса: ответы сериализуются и сжимаются один раз
+response_cache = ResponseCache()
+DATASET_VERSIONS = {name: content_version(dataset) for name, dataset in AVAILABLE_DATASETS.items()}
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/datasets')
 def get_datasets():
-    return jsonify(AVAILABLE_DATASETS)
+    return response_cache.respond(request, ('datasets',), lambda: AVAILABLE_DATASETS)
+
+@app.route('/api/datasets/<name>')
+def get_dataset(name):
+    if name not in AVAILABLE_DATASETS:
+        return jsonify({'error': f'Dataset {name} not found'}), 404
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cursor = request.args.get('cursor')
+    dataset = AVAILABLE_DATASETS[name]
+    version = DATASET_VERSIONS[name]
+
+    def build():
+        items, next_cursor = paginate(dataset['items'], cursor, limit, version)
+        return {
+            'name': dataset['name'],
+            'description': dataset['description'],
+            'items': items,
+            'items_total': len(dataset['items']),
+            'version': version,
+            'next_cursor': next_cursor
+        }
+
+    try:
+        return response_cache.respond(request, ('dataset', name, version, cursor, limit), build)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+def parse_answers(data):
+    """Ответ или список ответов из полей answer/answers запроса"""
+    answers = data.get('answers')
+    if answers is None:
+        answer = data.get('answer')
+        if not isinstance(answer, str):
+            raise ValueError('Поле answer обязательно')
+        return [answer]
+    if not isinstance(answers, list) or not all(isinstance(answer, str) for answer in answers):
+        raise ValueError('Поле answers должно быть списком строк')
+    return answers
+
+
+def evaluation(result):
+    score, criteria = result
+    return {
+        'score': score,
+        'max_score': scoring_engine.max_score,
+        'criteria': {criterion['name']: criterion['passed'] for criterion in criteria}
+    }
+
+
+def explanation(result):
+    score, criteria = result
+    return {
+        'score': score,
+        'max_score': scoring_engine.max_score,
+        'criteria': criteria,
+        'missing': [criterion['description'] or criterion['name'] for criterion in criteria if not criterion['passed']]
+    }
+
+
+def score_route(key, format_result):
+    """Оценка ответов запроса через общий микропакет; несколько ответов — несколько мест в пачке"""
+    data = request.get_json(silent=True) or {}
+    try:
+        answers = parse_answers(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    futures = [scoring_batcher.submit(answer) for answer in answers]
+    try:
+        results = [format_result(future.result()) for future in futures]
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if 'answers' in data:
+        return jsonify({f'{key}s': results})
+    return jsonify({key: results[0]})
+
 
 @app.route('/api/predict', methods=['POST'])
 def predict():
-    data = request.get_json()
-    # Placeholder for prediction logic
-    return jsonify({'prediction': 'This is a placeholder prediction'})
+    data = request.get_json(silent=True) or {}
+    query = data.get('query') or data.get('text')
+    model = data.get('model', 'gpt-3.5-turbo')
+    if not isinstance(query, str) or not query:
+        return jsonify({'error': 'Поле query обязательно'}), 400
+    try:
+        version = int(data.get('version', 2))
+    except (TypeError, ValueError):
+        version = None
+    if version not in PROMPTS:
+        return jsonify({'error': f"Неизвестная версия промпта: {data.get('version')}"}), 400
+    if not isinstance(model, str) or not model:
+        return jsonify({'error': 'Поле model должно быть названием модели'}), 400
+    try:
+        result = predict_batcher.call((query, version, model, bool(data.get('use_cache', True))))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'prediction': result['answer'],
+        'version': version,
+        'model': model,
+        'tokens_used': result['tokens_used'],
+        'evaluation': evaluation((result['score'], result['criteria']))
+    })
 
 @app.route('/api/explain', methods=['POST'])
 def explain():
-    data = request.get_json()
-    # Placeholder for explanation logic
-    return jsonify({'explanation': 'This is a placeholder explanation'})
+    return score_route('explanation', explanation)
 
 @app.route('/api/evaluate', methods=['POST'])
 def evaluate():
-    data = request.get_json()
-    # Placeholder for evaluation logic
-    return jsonify({'evaluation': 'This is a placeholder evaluation'})
+    return score_route('evaluation', evaluation)
+
+@app.route('/api/microbatch/stats')
+def microbatch_stats():
+    return jsonify({'predict': predict_batcher.stats(), 'score': scoring_batcher.stats()})
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,352 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Эндпоинт, в который уходят запросы пакета (формат OpenAI Batch API)
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Пакет в этих статусах больше не даст новых результатов
+FAILED_STATUSES = ("failed", "expired", "cancelled")
+
+
+class BatchError(RuntimeError):
+    """Пакет завершился без результатов или не дождался завершения"""
+
+
+def cell_custom_id(item_id, version, model):
+    """custom_id строки пакета: ячейка эксперимента (элемент × версия × модель)"""
+    return json.dumps([item_id, version, model], separators=(",", ":"), ensure_ascii=False)
+
+
+def parse_custom_id(custom_id):
+    item_id, version, model = json.loads(custom_id)
+    return item_id, version, model
+
+
+def write_requests(path, requests):
+    """Файл запросов пакета в JSONL: по строке на (custom_id, тело запроса); возвращает их число"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body
+            }, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_results(lines):
+    """Результаты пакета по custom_id: (тело ответа, ошибка) из строк выходного JSONL"""
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        error = record.get("error")
+        body = response.get("body")
+        if error is None and response.get("status_code", 200) >= 400:
+            error = (body or {}).get("error") or {"message": f"HTTP {response.get('status_code')}"}
+        results[record["custom_id"]] = (None if error else body, error)
+    return results
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return f.readlines()
+
+
+class OpenAIBatchProvider:
+    """Пакетная обработка через OpenAI Batch API: загрузка файла, создание пакета, опрос статуса"""
+
+    name = "openai"
+
+    def __init__(self, get_client, completion_window="24h"):
+        self.get_client = get_client
+        self.completion_window = completion_window
+
+    def submit(self, path, metadata=None):
+        client = self.get_client()
+        with open(path, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+            metadata={key: str(value) for key, value in (metadata or {}).items()} or None
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        try:
+            batch = self.get_client().batches.retrieve(batch_id)
+        except openai.NotFoundError as e:
+            raise BatchError(f"Пакет {batch_id} не найден") from e
+        counts = batch.request_counts
+        return {
+            "batch_id": batch.id,
+            "status": batch.status,
+            "total": counts.total if counts else 0,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id
+        }
+
+    def results(self, batch_id):
+        client = self.get_client()
+        status = self.status(batch_id)
+        lines = []
+        # Успешные запросы — в выходном файле, отклоненные — в файле ошибок
+        for file_id in (status["output_file_id"], status["error_file_id"]):
+            if file_id:
+                lines.extend(client.files.content(file_id).text.splitlines())
+        return read_results(lines)
+
+    def cancel(self, batch_id):
+        self.get_client().batches.cancel(batch_id)
+
+
+class LocalBatchProvider:
+    """Файловая замена Batch API для офлайн-прогонов и тестов
+
+    Пакет — каталог с входным JSONL, файлом состояния и выходным JSONL. Запросы выполняются
+    в фоновом потоке функцией execute(body) -> тело ответа. Выполнение переживает перезапуск:
+    при опросе незавершенный пакет продолжается с первой строки без ответа, а файловая
+    блокировка не дает двум процессам обрабатывать один пакет."""
+
+    name = "local"
+
+    def __init__(self, directory, execute, max_parallel=4):
+        self.directory = directory
+        self.execute = execute
+        self.max_parallel = max_parallel
+        self._running = set()
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Потоки обработки не переживают fork: в ребенке пакеты подхватываются при опросе
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def _path(self, batch_id, suffix):
+        return os.path.join(self.directory, f"{batch_id}.{suffix}")
+
+    def submit(self, path, metadata=None):
+        os.makedirs(self.directory, exist_ok=True)
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        with open(path, encoding="utf-8") as source:
+            lines = [line for line in source if line.strip()]
+        with open(self._path(batch_id, "input.jsonl"), "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        _write_json(self._path(batch_id, "json"), {
+            "batch_id": batch_id,
+            "status": "in_progress",
+            "total": len(lines),
+            "completed": 0,
+            "failed": 0,
+            "metadata": metadata or {},
+            "created_at": time.time()
+        })
+        self._ensure_running(batch_id)
+        return batch_id
+
+    def status(self, batch_id):
+        path = self._path(batch_id, "json")
+        if not os.path.exists(path):
+            raise BatchError(f"Пакет {batch_id} не найден")
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["status"] == "in_progress":
+            self._ensure_running(batch_id)
+        return state
+
+    def results(self, batch_id):
+        return read_results(_read_lines(self._path(batch_id, "output.jsonl")))
+
+    def cancel(self, batch_id):
+        path = self._path(batch_id, "json")
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["status"] not in TERMINAL_STATUSES:
+            _write_json(path, dict(state, status="cancelled"))
+
+    def _ensure_running(self, batch_id):
+        with self._lock:
+            if batch_id in self._running:
+                return
+            self._running.add(batch_id)
+        threading.Thread(target=self._process, args=(batch_id,), name=f"batch-{batch_id}", daemon=True).start()
+
+    def _process(self, batch_id):
+        try:
+            with open(self._path(batch_id, "lock"), "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Пакет обрабатывает другой процесс
+                    return
+                try:
+                    self._run(batch_id)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception as e:
+            logger.error(f"Ошибка обработки пакета {batch_id}: {str(e)}")
+            state_path = self._path(batch_id, "json")
+            with open(state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            _write_json(state_path, dict(state, status="failed", error=str(e)))
+        finally:
+            with self._lock:
+                self._running.discard(batch_id)
+
+    def _call(self, request):
+        record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"]}
+        try:
+            record["response"] = {"status_code": 200, "body": self.execute(request["body"])}
+            record["error"] = None
+        except Exception as e:
+            record["response"] = None
+            record["error"] = {"code": type(e).__name__, "message": str(e)}
+        return record
+
+    def _run(self, batch_id):
+        state_path = self._path(batch_id, "json")
+        output_path = self._path(batch_id, "output.jsonl")
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["status"] != "in_progress":
+            return
+        # Строки с уже записанным ответом не выполняются повторно
+        done = set(read_results(_read_lines(output_path)))
+        with open(self._path(batch_id, "input.jsonl"), encoding="utf-8") as f:
+            requests = [request for request in map(json.loads, f) if request["custom_id"] not in done]
+
+        completed = state["completed"]
+        failed = state["failed"]
+        last_saved = time.monotonic()
+        with open(output_path, "a", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            for record in executor.map(self._call, requests):
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if record["error"] is None:
+                    completed += 1
+                else:
+                    failed += 1
+                if time.monotonic() - last_saved >= 1.0:
+                    output.flush()
+                    with open(state_path, encoding="utf-8") as f:
+                        state = json.load(f)
+                    if state["status"] == "cancelled":
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        return
+                    _write_json(state_path, dict(state, completed=completed, failed=failed))
+                    last_saved = time.monotonic()
+        _write_json(state_path, dict(
+            state, status="completed", completed=completed, failed=failed, completed_at=time.time()
+        ))
+
+
+class BatchSubmitter:
+    """Отправка пакетов экспериментов и ожидание результатов
+
+    Идентификатор отправленного пакета записывается рядом с файлом запросов, поэтому
+    перезапущенный эксперимент продолжает опрашивать уже оплаченный пакет, а не создает новый."""
+
+    def __init__(self, provider, directory, poll_interval=30.0, timeout=None):
+        self.provider = provider
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def _pending_path(self, experiment_id):
+        return os.path.join(self.directory, f"{experiment_id}.pending.json")
+
+    def pending(self, experiment_id):
+        """Пакет эксперимента от прошлого запуска с тем же провайдером, который еще может дать результаты
+
+        Пакет, завершившийся неудачей (failed, expired, cancelled) или пропавший у провайдера,
+        забывается, чтобы следующий запуск отправил новый."""
+        path = self._pending_path(experiment_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            record = json.load(f)
+        if record.get("provider") != self.provider.name:
+            return None
+        try:
+            status = self.provider.status(record["batch_id"])["status"]
+        except BatchError as e:
+            logger.warning(f"Пакет {record['batch_id']} эксперимента {experiment_id} недоступен: {str(e)}")
+            status = None
+        if status is None or status in FAILED_STATUSES:
+            self.finish(experiment_id)
+            return None
+        return record["batch_id"]
+
+    def submit(self, experiment_id, requests):
+        """Компиляция запросов в JSONL и отправка пакета; возвращает (batch_id, число запросов)"""
+        path = os.path.join(self.directory, f"{experiment_id}-{int(time.time())}.input.jsonl")
+        count = write_requests(path, requests)
+        batch_id = self.provider.submit(path, metadata={"experiment_id": experiment_id})
+        _write_json(self._pending_path(experiment_id), {
+            "batch_id": batch_id,
+            "provider": self.provider.name,
+            "requests_path": path,
+            "requests": count,
+            "submitted_at": time.time()
+        })
+        return batch_id, count
+
+    def wait(self, batch_id, on_progress=None):
+        """Опрос статуса до завершения пакета; on_progress получает каждый новый статус"""
+        started = time.monotonic()
+        last = None
+        while True:
+            status = self.provider.status(batch_id)
+            progress = (status["status"], status["completed"], status["failed"])
+            if on_progress is not None and progress != last:
+                on_progress(status)
+            last = progress
+            if status["status"] in TERMINAL_STATUSES:
+                return status
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                raise BatchError(f"Пакет {batch_id} не завершился за {self.timeout} с")
+            time.sleep(self.poll_interval)
+
+    def results(self, batch_id):
+        return self.provider.results(batch_id)
+
+    def finish(self, experiment_id):
+        """Результаты пакета обработаны: следующий запуск отправит новый пакет"""
+        try:
+            os.remove(self._pending_path(experiment_id))
+        except FileNotFoundError:
+            pass
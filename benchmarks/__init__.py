@@ -0,0 +1 @@
+# Бенчмарки и локальные заглушки внешних сервисов
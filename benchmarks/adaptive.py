@@ -0,0 +1,59 @@
+import argparse
+import json
+import numpy as np
+from benchmarks.common import save_result
+from racing import VersionRace
+
+
+def simulate(means, items, confidence, min_items, rng, max_score=5):
+    """Один прогон: оценки версий — биномиальные с заданным средним, элементы по одному"""
+    versions = list(range(1, len(means) + 1))
+    race = VersionRace(versions, items, confidence, min_items)
+    # Общая для версий сложность элемента делает оценки парно зависимыми, как в реальных датасетах
+    difficulty = rng.normal(0, 0.08, size=items)
+    cells = 0
+    for item in range(items):
+        for version, mean in zip(versions, means):
+            if version not in race.alive:
+                continue
+            p = np.clip(mean / max_score + difficulty[item], 0, 1)
+            race.record(item, version, int(rng.binomial(max_score, p)))
+            cells += 1
+        race.check(item + 1)
+    return cells, race
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экономия вызовов адаптивного режима (successive elimination)")
+    parser.add_argument("--means", default="3.0,3.4,3.8", help="Средние оценки версий")
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--min-items", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=200)
+    args = parser.parse_args()
+
+    means = [float(value) for value in args.means.split(",")]
+    best = int(np.argmax(means)) + 1
+    rng = np.random.default_rng(0)
+    cells = []
+    best_eliminated = 0
+    for _ in range(args.trials):
+        trial_cells, race = simulate(means, args.items, args.confidence, args.min_items, rng)
+        cells.append(trial_cells)
+        best_eliminated += best not in race.alive
+
+    full = args.items * len(means)
+    payload = {
+        "params": vars(args),
+        "cells_full": full,
+        "cells_adaptive_mean": float(np.mean(cells)),
+        "calls_saved_share": 1 - float(np.mean(cells)) / full,
+        "best_version_eliminated_share": best_eliminated / args.trials
+    }
+    path = save_result("adaptive", payload)
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    print(f"Результат сохранен в {path}")
+
+
+if __name__ == "__main__":
+    main()
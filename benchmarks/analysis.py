@@ -0,0 +1,72 @@
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from analysis import compare_versions
+from benchmarks.common import save_result, summarize
+from result_store import ResultStore
+
+TYPES = ["explanation", "technical", "comparison", "tutorial"]
+COMPLEXITIES = ["basic", "intermediate", "advanced"]
+CRITERIA = ["has_examples", "has_practical_advice", "has_code_blocks", "has_bullet_points", "word_count_optimal"]
+
+
+def fill_store(store, experiments, items, versions, seed=0):
+    """Синтетическая история: версии различаются средней оценкой и длиной ответа"""
+    rng = np.random.default_rng(seed)
+    for experiment in range(experiments):
+        rows = []
+        for item in range(items):
+            for version in range(1, versions + 1):
+                flags = rng.random(len(CRITERIA)) < 0.4 + 0.1 * version
+                rows.append({
+                    "experiment": f"exp-{experiment}",
+                    "item": f"item-{item}",
+                    "version": version,
+                    "model": "gpt-3.5-turbo",
+                    "item_type": TYPES[item % len(TYPES)],
+                    "complexity": COMPLEXITIES[item % len(COMPLEXITIES)],
+                    "quality_score": int(flags.sum()),
+                    "tokens": int(rng.normal(300 + 50 * version, 60)),
+                    "latency_seconds": float(rng.lognormal(0, 0.4)),
+                    "criteria": dict(zip(CRITERIA, flags.tolist())),
+                    "answer": "answer"
+                })
+        store.append(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сравнения версий по колоночному хранилищу")
+    parser.add_argument("--experiments", type=int, default=20)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--versions", type=int, default=3)
+    parser.add_argument("--n-boot", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    store = ResultStore(tempfile.mkdtemp(prefix="analysis_bench_"))
+    started = time.perf_counter()
+    fill_store(store, args.experiments, args.items, args.versions)
+    fill_seconds = time.perf_counter() - started
+
+    timings = []
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        comparison = compare_versions(store.load(), n_boot=args.n_boot)
+        timings.append(time.perf_counter() - started)
+
+    payload = {
+        "params": vars(args),
+        "cells": comparison["cells"],
+        "fill_seconds": fill_seconds,
+        "compare_seconds": summarize(timings),
+        "differences": comparison["differences"]
+    }
+    path = save_result("analysis", payload)
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    print(f"Результат сохранен в {path}")
+
+
+if __name__ == "__main__":
+    main()
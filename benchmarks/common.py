@@ -0,0 +1,84 @@
+import json
+import math
+import os
+import random
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LatencyModel:
+    """Распределение задержки заглушки: fixed:0.2, uniform:0.1,0.5, lognormal:0.3,0.6"""
+
+    def __init__(self, spec="fixed:0"):
+        if isinstance(spec, (int, float)):
+            spec = f"fixed:{spec}"
+        kind, _, args = str(spec).partition(":")
+        self.spec = str(spec)
+        self.kind = kind
+        self.args = [float(value) for value in args.split(",") if value]
+        if kind not in ("fixed", "uniform", "lognormal", "exponential"):
+            raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+    def sample(self):
+        """Задержка в секундах"""
+        if self.kind == "fixed":
+            return self.args[0] if self.args else 0.0
+        if self.kind == "uniform":
+            return random.uniform(self.args[0], self.args[1])
+        if self.kind == "lognormal":
+            # Параметры: медиана и sigma логарифма
+            median, sigma = self.args
+            return random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return random.expovariate(1 / self.args[0]) if self.args[0] > 0 else 0.0
+
+    def __repr__(self):
+        return self.spec
+
+
+def percentile(values, p):
+    """Перцентиль с линейной интерполяцией"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values):
+    """Сводка распределения: min/mean/p50/p95/p99/max"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "min": min(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_result(name, payload):
+    """Сохранение результата бенчмарка в results/benchmarks для сравнения между коммитами"""
+    directory = os.path.join(ROOT, "results", "benchmarks")
+    os.makedirs(directory, exist_ok=True)
+    revision = git_revision()
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{name}_{timestamp}_{revision}.json")
+    payload = dict(payload, benchmark=name, revision=revision, created_at=datetime.now().isoformat())
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return path
@@ -0,0 +1,68 @@
+import argparse
+import json
+import time
+import numpy as np
+from benchmarks.common import save_result, summarize
+from dedup import DatasetDeduplicator, NearDuplicateIndex
+
+TOPICS = ["machine learning", "databases", "networking", "python", "kubernetes", "statistics", "security"]
+
+
+def synthetic_texts(items, duplicate_share, seed=0):
+    """Синтетические запросы; часть из них — правки уже существующих (опечатка, лишнее слово)"""
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"w{index}" for index in range(20000)]
+    texts = []
+    for index in range(items):
+        if texts and rng.random() < duplicate_share:
+            words = texts[int(rng.integers(len(texts)))].split()
+            words.insert(int(rng.integers(len(words) + 1)), "please")
+            texts.append(" ".join(words))
+        else:
+            topic = TOPICS[index % len(TOPICS)]
+            texts.append(f"Explain {topic} " + " ".join(rng.choice(vocabulary, size=25)))
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска почти дубликатов (MinHash + LSH)")
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--duplicate-share", type=float, default=0.05)
+    parser.add_argument("--online", type=int, default=2000, help="Проверок при загрузке по одному элементу")
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.items, args.duplicate_share)
+    deduplicator = DatasetDeduplicator(loader=lambda name: [])
+
+    started = time.perf_counter()
+    report = deduplicator.report(list(enumerate(texts)))
+    report_seconds = time.perf_counter() - started
+
+    index = NearDuplicateIndex(deduplicator.hasher, initial_capacity=args.items + args.online)
+    started = time.perf_counter()
+    index.extend(list(range(args.items)), texts)
+    build_seconds = time.perf_counter() - started
+
+    probes = synthetic_texts(args.online, 0.0, seed=1)
+    timings = []
+    for position, text in enumerate(probes):
+        started = time.perf_counter()
+        index.add(args.items + position, text)
+        timings.append(time.perf_counter() - started)
+
+    payload = {
+        "params": vars(args),
+        "report_seconds": report_seconds,
+        "duplicate_items": report["duplicate_items"],
+        "clusters": len(report["clusters"]),
+        "index_build_seconds": build_seconds,
+        "index_memory_bytes": index.memory_bytes(),
+        "online_add_seconds": summarize(timings)
+    }
+    path = save_result("dedup", payload)
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    print(f"Результат сохранен в {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from benchmarks.common import save_result, summarize
+from wsgi import load_app_module
+from benchmarks.mock_langfuse import MockLangfuseServer
+from benchmarks.mock_openai import MockOpenAIServer
+
+
+def run_load(name, call, requests_count, concurrency):
+    """Прогон сценария: call() выполняет один запрос и возвращает True при успехе"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = call()
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests_count)))
+    duration = time.perf_counter() - started
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "duration_seconds": duration,
+        "throughput_rps": requests_count / duration if duration else None,
+        "latency_seconds": summarize(latencies),
+        "peak_traced_memory_mb": peak_memory / 1024 / 1024,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+    print(f"{name}: {result['throughput_rps']:.2f} req/s, p95 {result['latency_seconds'].get('p95', 0):.3f} сек, ошибок {errors}")
+    return result
+
+
+def start_app_server(module):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк с локальными заглушками OpenAI и Langfuse")
+    parser.add_argument("--scenarios", default="add_item,run_experiment,compare_prompts")
+    parser.add_argument("--requests", type=int, default=20, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=4, help="Параллельных клиентов")
+    parser.add_argument("--openai-latency", default="lognormal:0.3,0.4")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--openai-rpm-limit", type=int, default=0)
+    parser.add_argument("--langfuse-latency", default="lognormal:0.03,0.3")
+    parser.add_argument("--langfuse-error-rate", type=float, default=0.0)
+    parser.add_argument("--with-cache", action="store_true", help="Не отключать кэш ответов LLM")
+    args = parser.parse_args()
+
+    openai_mock = MockOpenAIServer(
+        latency=args.openai_latency,
+        error_rate=args.openai_error_rate,
+        rate_limit_rate=args.openai_rate_limit_rate,
+        rpm_limit=args.openai_rpm_limit
+    ).start()
+    langfuse_mock = MockLangfuseServer(latency=args.langfuse_latency, error_rate=args.langfuse_error_rate).start()
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+
+    # Окружение задается до импорта приложения: модули читают настройки при импорте
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-mock",
+        "OPENAI_BASE_URL": openai_mock.url,
+        "LANGFUSE_PUBLIC_KEY": "pk-mock",
+        "LANGFUSE_SECRET_KEY": "sk-mock",
+        "LANGFUSE_BASE_URL": langfuse_mock.url,
+        "LANGFUSE_HOST": langfuse_mock.url,
+        "DATASET_CACHE_DIR": os.path.join(work_dir, "datasets"),
+        "LLM_CACHE_PATH": os.path.join(work_dir, "llm_cache.sqlite"),
+        # Чекпоинты и хранилище результатов изолированы: иначе прогоны возобновлялись бы
+        # из чекпоинтов и писали в results/ репозитория
+        "CHECKPOINT_PATH": os.path.join(work_dir, "checkpoints.sqlite"),
+        "RESULT_STORE_DIR": os.path.join(work_dir, "store"),
+        "BATCH_DIR": os.path.join(work_dir, "batches"),
+        "OPENAI_RATE_LIMIT_STATE_PATH": os.path.join(work_dir, "rate_limits.sqlite"),
+        "LLM_CACHE_ENABLED": "1" if args.with_cache else "0"
+    })
+
+    module = load_app_module()
+    if not module.readiness.wait(60):
+        raise RuntimeError(f"Приложение не прогрелось: {module.readiness.snapshot()}")
+    server, base_url = start_app_server(module)
+    client = httpx.Client(base_url=base_url, timeout=600)
+    dataset_name = module.PROMPT_TUNING_DATASET["name"]
+
+    def add_item():
+        response = client.post("/add_item", json={
+            "dataset_name": "load_test_items",
+            "input": {"text": f"Вопрос {uuid.uuid4().hex}"},
+            "expected_output": {"text": "Ответ"},
+            "metadata": {"type": "load_test", "complexity": "basic"}
+        })
+        return response.status_code == 200
+
+    def run_experiment():
+        response = client.post("/run_experiment", json={"dataset_name": dataset_name})
+        return response.status_code == 200
+
+    def compare_prompts():
+        import prompt_tuning_example
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = prompt_tuning_example.compare_prompts("Какие преимущества у Python?")
+        return all("error" not in result for result in results)
+
+    scenarios = {
+        "add_item": add_item,
+        "run_experiment": run_experiment,
+        "compare_prompts": compare_prompts
+    }
+    client.post("/create_dataset", json={"name": "load_test_items", "description": "Нагрузочный тест"})
+
+    results = {}
+    for name in args.scenarios.split(","):
+        results[name] = run_load(name, scenarios[name], args.requests, args.concurrency)
+
+    module.telemetry.flush()
+    server.shutdown()
+    openai_mock.stop()
+    langfuse_mock.stop()
+
+    payload = {
+        "params": vars(args),
+        "scenarios": results,
+        "upstream": {"openai": dict(openai_mock.stats), "langfuse_events": len(langfuse_mock.events)},
+        "telemetry": module.telemetry.stats()
+    }
+    path = save_result("load_test", payload)
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    print(f"Результат сохранен в {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from benchmarks.common import LatencyModel
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class MockLangfuseServer:
+    """HTTP-сервер, имитирующий ingestion и dataset API Langfuse"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0):
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.batches = []
+        self.events = []
+        self.datasets = {}
+        self.dataset_items = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def received(self, event_type=None):
+        """Полученные события, при необходимости отфильтрованные по типу"""
+        with self._lock:
+            return [event for event in self.events if event_type is None or event["type"] == event_type]
+
+    def _record(self, batch):
+        with self._lock:
+            self.batches.append(len(batch))
+            self.events.extend(batch)
+
+    def create_dataset(self, name, description=None, metadata=None):
+        with self._lock:
+            dataset = self.datasets.get(name)
+            if dataset is None:
+                dataset = {
+                    "id": uuid.uuid4().hex,
+                    "name": name,
+                    "description": description,
+                    "metadata": metadata,
+                    "projectId": "mock-project",
+                    "createdAt": _now(),
+                    "updatedAt": _now()
+                }
+                self.datasets[name] = dataset
+                self.dataset_items[name] = []
+            return dataset
+
+    def create_dataset_item(self, data):
+        name = data["datasetName"]
+        with self._lock:
+            dataset = self.datasets.get(name)
+            if dataset is None:
+                return None
+            item = {
+                "id": data.get("id") or uuid.uuid4().hex,
+                "status": "ACTIVE",
+                "input": data.get("input"),
+                "expectedOutput": data.get("expectedOutput"),
+                "metadata": data.get("metadata"),
+                "sourceTraceId": None,
+                "sourceObservationId": None,
+                "datasetId": dataset["id"],
+                "datasetName": name,
+                "createdAt": _now(),
+                "updatedAt": _now()
+            }
+            self.dataset_items[name].append(item)
+            return item
+
+    def list_dataset_items(self, name, page, limit):
+        with self._lock:
+            items = list(self.dataset_items.get(name, []))
+        total_pages = max(1, -(-len(items) // limit))
+        return {
+            "data": items[(page - 1) * limit:page * limit],
+            "meta": {"page": page, "limit": limit, "totalItems": len(items), "totalPages": total_pages}
+        }
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _simulate(self):
+                # Задержка и случайные ошибки API; True — запрос нужно завершить ошибкой
+                with mock._lock:
+                    mock.requests += 1
+                delay = mock.latency.sample()
+                if delay:
+                    time.sleep(delay)
+                if mock.error_rate and random.random() < mock.error_rate:
+                    with mock._lock:
+                        mock.errors += 1
+                    self._send_json(500, {"message": "Simulated internal error"})
+                    return True
+                return False
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path.startswith("/api/public") and self._simulate():
+                    return
+                if self.path.startswith("/api/public/projects"):
+                    self._send_json(200, {"data": [{"id": "mock-project", "name": "mock"}]})
+                elif url.path.startswith("/api/public/v2/datasets/"):
+                    name = unquote(url.path[len("/api/public/v2/datasets/"):])
+                    dataset = mock.datasets.get(name)
+                    if dataset is None:
+                        self._send_json(404, {"message": f"Dataset {name} not found"})
+                    else:
+                        self._send_json(200, dataset)
+                elif url.path == "/api/public/dataset-items":
+                    name = unquote(query.get("datasetName", [""])[0])
+                    page = int(query.get("page", ["1"])[0])
+                    limit = int(query.get("limit", ["50"])[0])
+                    self._send_json(200, mock.list_dataset_items(name, page, limit))
+                elif self.path.startswith("/_mock/stats"):
+                    with mock._lock:
+                        self._send_json(200, {
+                            "batches": list(mock.batches),
+                            "events": len(mock.events),
+                            "requests": mock.requests,
+                            "errors": mock.errors
+                        })
+                else:
+                    self._send_json(404, {"message": "not found"})
+
+            def do_POST(self):
+                if self.path.startswith("/api/public"):
+                    # Тело читаем до ответа, чтобы не рвать keep-alive соединение
+                    data = self._read_json()
+                    if self._simulate():
+                        return
+                if self.path.startswith("/api/public/ingestion"):
+                    batch = data.get("batch", [])
+                    mock._record(batch)
+                    self._send_json(207, {
+                        "successes": [{"id": event.get("id"), "status": 201} for event in batch],
+                        "errors": []
+                    })
+                elif self.path.startswith("/api/public/v2/datasets"):
+                    self._send_json(200, mock.create_dataset(
+                        data["name"], data.get("description"), data.get("metadata")
+                    ))
+                elif self.path.startswith("/api/public/dataset-items"):
+                    item = mock.create_dataset_item(data)
+                    if item is None:
+                        self._send_json(404, {"message": "Dataset not found"})
+                    else:
+                        self._send_json(200, item)
+                else:
+                    self._send_json(404, {"message": "not found"})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка Langfuse API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency", default="fixed:0", help="Распределение задержки, напр. lognormal:0.05,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов с ошибкой 500")
+    args = parser.parse_args()
+
+    server = MockLangfuseServer(args.host, args.port, args.latency, args.error_rate)
+    print(f"Заглушка Langfuse слушает {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,251 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.common import LatencyModel
+
+# Фрагменты для правдоподобных ответов: часть ответов проходит критерии качества, часть нет
+ANSWER_SENTENCES = [
+    "Prompt tuning помогает получать более стабильные ответы модели.",
+    "Например, можно явно задать структуру ответа и ограничения по длине.",
+    "Практический совет: начинайте с простого промпта и измеряйте качество на датасете.",
+    "Метрики качества позволяют сравнивать версии промптов объективно.",
+    "For example, a template with explicit sections reduces irrelevant output.",
+    "Стоимость запроса зависит от числа токенов во входе и в ответе.",
+    "Мониторинг в Langfuse показывает задержки и ошибки по каждому трейсу."
+]
+ANSWER_EXTRAS = [
+    "- Определите цель промпта\n- Добавьте примеры\n- Ограничьте формат ответа",
+    "```python\nprompt = f\"Вопрос: {query}\"\n```",
+    "* Используйте версионирование промптов\n* Сравнивайте результаты на одном датасете"
+]
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def generate_answer(messages, min_words=60, max_words=320):
+    """Детерминированный по промпту ответ переменной длины"""
+    prompt = json.dumps(messages, ensure_ascii=False)
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    target_words = rng.randint(min_words, max_words)
+    parts = []
+    words = 0
+    while words < target_words:
+        sentence = rng.choice(ANSWER_SENTENCES)
+        parts.append(sentence)
+        words += len(sentence.split())
+    for extra in ANSWER_EXTRAS:
+        if rng.random() < 0.5:
+            parts.append(extra)
+    return "\n".join(parts)
+
+
+class MockOpenAIServer:
+    """HTTP-сервер, имитирующий OpenAI chat completions API"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", error_rate=0.0,
+                 rate_limit_rate=0.0, token_delay=0.0, retry_after=1.0, rpm_limit=0):
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.token_delay = token_delay
+        self.retry_after = retry_after
+        self.rpm_limit = rpm_limit
+        self._request_times = []
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "streams": 0, "tokens": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _admit(self):
+        """Скользящее окно в 60 сек для имитации лимита RPM; возвращает остаток или None"""
+        now = time.monotonic()
+        with self._lock:
+            self._request_times = [t for t in self._request_times if now - t < 60]
+            if self.rpm_limit and len(self._request_times) >= self.rpm_limit:
+                return None
+            self._request_times.append(now)
+            return self.rpm_limit - len(self._request_times) if self.rpm_limit else None
+
+    def _rate_limit_headers(self, remaining):
+        if not self.rpm_limit:
+            return {}
+        return {
+            "x-ratelimit-limit-requests": str(self.rpm_limit),
+            "x-ratelimit-remaining-requests": str(max(0, remaining or 0))
+        }
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/_mock/stats"):
+                    with mock._lock:
+                        self._send_json(200, dict(mock.stats))
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                mock._count("requests")
+                remaining = mock._admit()
+                if mock.rpm_limit and remaining is None:
+                    mock._count("rate_limited")
+                    self._send_json(429, {
+                        "error": {
+                            "message": "Rate limit reached for requests (mock)",
+                            "type": "requests",
+                            "code": "rate_limit_exceeded"
+                        }
+                    }, headers=dict(mock._rate_limit_headers(0), **{"retry-after": str(mock.retry_after)}))
+                    return
+                roll = random.random()
+                if roll < mock.rate_limit_rate:
+                    mock._count("rate_limited")
+                    self._send_json(429, {
+                        "error": {
+                            "message": "Rate limit reached (mock)",
+                            "type": "requests",
+                            "code": "rate_limit_exceeded"
+                        }
+                    }, headers={"retry-after": str(mock.retry_after)})
+                    return
+                if roll < mock.rate_limit_rate + mock.error_rate:
+                    mock._count("errors")
+                    self._send_json(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+                    return
+
+                delay = mock.latency.sample()
+                if delay:
+                    time.sleep(delay)
+
+                messages = request.get("messages", [])
+                answer = generate_answer(messages)
+                prompt_tokens = estimate_tokens(json.dumps(messages, ensure_ascii=False))
+                completion_tokens = estimate_tokens(answer)
+                mock._count("tokens", prompt_tokens + completion_tokens)
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+                if request.get("stream"):
+                    mock._count("streams")
+                    self._stream(request, answer, usage)
+                else:
+                    self._send_json(200, {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "mock"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": answer},
+                            "finish_reason": "stop",
+                            "logprobs": None
+                        }],
+                        "usage": usage
+                    }, headers=mock._rate_limit_headers(remaining))
+
+            def _stream(self, request, answer, usage):
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                created = int(time.time())
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def chunk(delta, finish_reason=None, chunk_usage=None, with_choice=True):
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": request.get("model", "mock"),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if with_choice else [],
+                        "usage": chunk_usage
+                    }
+                    self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                chunk({"role": "assistant", "content": ""})
+                for word in answer.split(" "):
+                    if mock.token_delay:
+                        time.sleep(mock.token_delay)
+                    chunk({"content": word + " "})
+                chunk({}, finish_reason="stop")
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    chunk(None, chunk_usage=usage, with_choice=False)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="lognormal:0.5,0.4", help="Распределение задержки ответа")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Задержка между токенами в потоке, сек")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="Лимит запросов в минуту (0 — без лимита)")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        args.host, args.port, args.latency, args.error_rate, args.rate_limit_rate, args.token_delay,
+        rpm_limit=args.rpm_limit
+    )
+    print(f"Заглушка OpenAI слушает {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
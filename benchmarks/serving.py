@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import httpx
+from benchmarks.common import ROOT, save_result, summarize
+from benchmarks.mock_langfuse import MockLangfuseServer
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, args):
+    if mode == "dev":
+        return [sys.executable, "app.py"]
+    return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"]
+
+
+def start_server(mode, env, args):
+    """Запуск сервера в отдельном процессе и ожидание готовности /readyz"""
+    port = free_port()
+    env = dict(env, PORT=str(port), FLASK_DEBUG="0", WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(args.threads), GUNICORN_ACCESS_LOG="")
+    process = subprocess.Popen(
+        server_command(mode, args), cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер {mode} завершился с кодом {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Сервер {mode} не прогрелся за {args.timeout} сек")
+
+
+def run_load(base_url, path, duration, concurrency):
+    """Фиксированное время нагрузки: каждый клиент шлет запросы по keepalive-соединению"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client_loop():
+        nonlocal errors
+        local_latencies = []
+        local_errors = 0
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                try:
+                    ok = client.get(path).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                local_latencies.append(time.perf_counter() - started)
+                local_errors += not ok
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "latency_seconds": summarize(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение dev-сервера Flask и gunicorn по req/s")
+    parser.add_argument("--modes", default="dev,gunicorn")
+    parser.add_argument("--paths", default="/datasets,/dataset/prompt_tuning_tutorial")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность нагрузки на путь, сек")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="Воркеры gunicorn")
+    parser.add_argument("--threads", type=int, default=8, help="Потоки на воркер gunicorn")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Ожидание готовности сервера, сек")
+    args = parser.parse_args()
+
+    langfuse = MockLangfuseServer().start()
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(
+            os.environ,
+            LANGFUSE_BASE_URL=langfuse.url,
+            LANGFUSE_HOST=langfuse.url,
+            LANGFUSE_PUBLIC_KEY="pk-mock",
+            LANGFUSE_SECRET_KEY="sk-mock",
+            OPENAI_API_KEY="sk-mock",
+            DATASET_CACHE_DIR=os.path.join(work_dir, "datasets"),
+            LLM_CACHE_PATH=os.path.join(work_dir, "llm_cache.sqlite"),
+            CHECKPOINT_PATH=os.path.join(work_dir, "checkpoints.sqlite"),
+            RESULT_STORE_DIR=os.path.join(work_dir, "store"),
+            BATCH_DIR=os.path.join(work_dir, "batches"),
+            OPENAI_RATE_LIMIT_STATE_PATH=os.path.join(work_dir, "rate_limits.sqlite")
+        )
+        for mode in args.modes.split(","):
+            process, base_url = start_server(mode, env, args)
+            try:
+                results[mode] = {}
+                for path in args.paths.split(","):
+                    result = run_load(base_url, path, args.duration, args.concurrency)
+                    results[mode][path] = result
+                    print(f"{mode} {path}: {result['throughput_rps']:.0f} req/s, "
+                          f"p95 {result['latency_seconds'].get('p95', 0) * 1000:.1f} мс, ошибок {result['errors']}")
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    langfuse.stop()
+
+    payload = {"params": vars(args), "cpu_count": os.cpu_count(), "results": results}
+    path = save_result("serving", payload)
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    print(f"Результат сохранен в {path}")
+
+
+if __name__ == "__main__":
+    main()
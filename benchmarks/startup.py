@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import ROOT, save_result, summarize
+from benchmarks.mock_langfuse import MockLangfuseServer
+
+# Код дочернего процесса: время импорта app.py и время до готовности зависимостей
+CHILD_CODE = """
+import time
+started = time.perf_counter()
+import json, sys
+sys.path.insert(0, {root!r})
+from wsgi import load_app_module
+module = load_app_module()
+imported = time.perf_counter()
+ready = module.readiness.wait({timeout})
+finished = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "ready_seconds": finished - started if ready else None,
+    "readiness": module.readiness.snapshot()
+}}))
+"""
+
+
+def run_once(env, timeout):
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE.format(root=ROOT, timeout=timeout)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=timeout + 30
+    )
+    process_seconds = time.perf_counter() - started
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr[-2000:])
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = process_seconds
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта приложения")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Максимальное ожидание готовности, сек")
+    parser.add_argument("--langfuse-latency", default="fixed:0.05", help="Распределение задержки заглушки Langfuse")
+    args = parser.parse_args()
+
+    langfuse = MockLangfuseServer(latency=args.langfuse_latency).start()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(
+            os.environ,
+            LANGFUSE_BASE_URL=langfuse.url,
+            LANGFUSE_PUBLIC_KEY="pk-mock",
+            LANGFUSE_SECRET_KEY="sk-mock",
+            OPENAI_API_KEY="sk-mock",
+            DATASET_CACHE_DIR=os.path.join(cache_dir, "datasets"),
+            LLM_CACHE_PATH=os.path.join(cache_dir, "llm_cache.sqlite"),
+            CHECKPOINT_PATH=os.path.join(cache_dir, "checkpoints.sqlite"),
+            RESULT_STORE_DIR=os.path.join(cache_dir, "store"),
+            BATCH_DIR=os.path.join(cache_dir, "batches"),
+            OPENAI_RATE_LIMIT_STATE_PATH=os.path.join(cache_dir, "rate_limits.sqlite")
+        )
+        runs = [run_once(env, args.timeout) for _ in range(args.runs)]
+    langfuse.stop()
+
+    payload = {
+        "params": vars(args),
+        "import_seconds": summarize([run["import_seconds"] for run in runs]),
+        "ready_seconds": summarize([run["ready_seconds"] for run in runs if run["ready_seconds"] is not None]),
+        "process_seconds": summarize([run["process_seconds"] for run in runs]),
+        "not_ready": sum(1 for run in runs if run["ready_seconds"] is None)
+    }
+    path = save_result("startup", payload)
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    print(f"Результат сохранен в {path}")
+
+
+if __name__ == "__main__":
+    main()
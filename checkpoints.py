@@ -0,0 +1,233 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def make_experiment_id(dataset_name, model, prompt_versions):
+    """Стабильный id эксперимента: датасет, модель и тексты шаблонов промптов"""
+    payload = json.dumps({
+        "dataset": dataset_name,
+        "model": model,
+        # Шаблон с подстановкой-маркером меняется при любой правке промпта
+        "prompts": [[version, prompt_func("{query}")] for version, prompt_func in prompt_versions]
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def make_run_id(dataset_name, model, prompt_versions):
+    """id нового прогона: id эксперимента и случайный суффикс, чекпоинты прошлых прогонов не берутся"""
+    return f"{make_experiment_id(dataset_name, model, prompt_versions)}-{uuid.uuid4().hex[:8]}"
+
+
+def resolve_run(dataset_name, model, prompt_versions, experiment_id=None, resume=None):
+    """id прогона и признак возобновления
+
+    Возобновление — только по явному запросу: с переданным experiment_id или resume=True
+    (тогда id стабилен и вычисляется из датасета, модели и промптов). Иначе каждый запуск
+    получает новый id и выполняет все ячейки."""
+    if resume is None:
+        resume = experiment_id is not None
+    if experiment_id is None:
+        experiment_id = (make_experiment_id if resume else make_run_id)(dataset_name, model, prompt_versions)
+    return experiment_id, bool(resume)
+
+
+# Как часто долгоживущий процесс удаляет устаревшие прогоны, сек
+PRUNE_INTERVAL = 3600
+
+
+class CheckpointStore:
+    """Журнал завершенных ячеек экспериментов в SQLite для возобновления прогона
+
+    Прогоны, не обновлявшиеся дольше retention секунд, удаляются при открытии базы и далее
+    не чаще раза в PRUNE_INTERVAL: каждый запуск без experiment_id создает новый прогон."""
+
+    def __init__(self, path, enabled=True, retention=None):
+        self.path = path
+        self.enabled = enabled
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+        self._pruned_at = 0.0
+
+    def _db(self):
+        # Соединение открывается лениво и заново после fork
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS experiments (
+                    experiment_id TEXT PRIMARY KEY,
+                    dataset_name TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    versions TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS experiment_cells (
+                    experiment_id TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (experiment_id, item_id, version, model)
+                )
+                """
+            )
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+            self._prune(self._connection)
+        return self._connection
+
+    def _prune(self, db):
+        self._pruned_at = time.time()
+        if not self.retention:
+            return
+        try:
+            expired = [row[0] for row in db.execute(
+                "SELECT experiment_id FROM experiments WHERE updated_at < ?", (self._pruned_at - self.retention,)
+            ).fetchall()]
+            for experiment_id in expired:
+                db.execute("DELETE FROM experiment_cells WHERE experiment_id = ?", (experiment_id,))
+                db.execute("DELETE FROM experiments WHERE experiment_id = ?", (experiment_id,))
+            db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка удаления устаревших чекпоинтов: {str(e)}")
+            return
+        if expired:
+            logger.info(f"Удалены чекпоинты {len(expired)} прогонов старше {self.retention} с")
+
+    def start(self, experiment_id, dataset_name, model, versions):
+        """Регистрация прогона; повторный запуск с тем же id только обновляет отметку времени"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self._prune(db)
+            db.execute(
+                """
+                INSERT INTO experiments (experiment_id, dataset_name, model, versions, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (experiment_id) DO UPDATE SET updated_at = excluded.updated_at
+                """,
+                (experiment_id, dataset_name, model, json.dumps(list(versions)), now, now)
+            )
+            db.commit()
+
+    def completed(self, experiment_id):
+        """Результаты завершенных ячеек: {(item_id, version, model): result}"""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT item_id, version, model, result FROM experiment_cells WHERE experiment_id = ?",
+                (experiment_id,)
+            ).fetchall()
+        return {(item_id, version, model): json.loads(result) for item_id, version, model, result in rows}
+
+    def save(self, experiment_id, item_id, version, model, result):
+        """Запись ячейки сразу после завершения; неудачные ячейки не сохраняются"""
+        if not self.enabled or result is None:
+            return
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute(
+                    """
+                    INSERT OR REPLACE INTO experiment_cells (experiment_id, item_id, version, model, result, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (experiment_id, item_id, version, model, json.dumps(result, ensure_ascii=False), time.time())
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                # Потеря чекпоинта не должна ронять эксперимент
+                logger.error(f"Ошибка записи чекпоинта {experiment_id}: {str(e)}")
+
+    def save_many(self, experiment_id, cells):
+        """Пакетная запись ячеек одной транзакцией: cells — [(item_id, version, model, result)]"""
+        rows = [
+            (experiment_id, item_id, version, model, json.dumps(result, ensure_ascii=False), time.time())
+            for item_id, version, model, result in cells if result is not None
+        ]
+        if not self.enabled or not rows:
+            return
+        with self._lock:
+            try:
+                db = self._db()
+                db.executemany(
+                    """
+                    INSERT OR REPLACE INTO experiment_cells (experiment_id, item_id, version, model, result, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    rows
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи чекпоинта {experiment_id}: {str(e)}")
+
+    def describe(self, experiment_id):
+        """Сведения о прогоне и число сохраненных ячеек по версиям"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT dataset_name, model, versions, created_at, updated_at FROM experiments WHERE experiment_id = ?",
+                (experiment_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            counts = db.execute(
+                "SELECT version, COUNT(*) FROM experiment_cells WHERE experiment_id = ? GROUP BY version",
+                (experiment_id,)
+            ).fetchall()
+        dataset_name, model, versions, created_at, updated_at = row
+        return {
+            "experiment_id": experiment_id,
+            "dataset_name": dataset_name,
+            "model": model,
+            "versions": json.loads(versions),
+            "cells_completed": {str(version): count for version, count in counts},
+            "created_at": created_at,
+            "updated_at": updated_at
+        }
+
+    def list(self):
+        if not self.enabled:
+            return []
+        with self._lock:
+            ids = [row[0] for row in self._db().execute(
+                "SELECT experiment_id FROM experiments ORDER BY updated_at DESC"
+            ).fetchall()]
+        return [self.describe(experiment_id) for experiment_id in ids]
+
+    def delete(self, experiment_id):
+        """Удаление чекпоинтов прогона; следующий запуск пройдет все ячейки заново"""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            db = self._db()
+            deleted = db.execute(
+                "DELETE FROM experiment_cells WHERE experiment_id = ?", (experiment_id,)
+            ).rowcount
+            db.execute("DELETE FROM experiments WHERE experiment_id = ?", (experiment_id,))
+            db.commit()
+        return deleted
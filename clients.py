@@ -0,0 +1,257 @@
+import logging
+import os
+import threading
+import time
+import httpx
+from dotenv import load_dotenv
+from langfuse import Langfuse
+from openai import OpenAI
+from metrics import registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Пул соединений к OpenAI: HTTP/2 мультиплексирует запросы в одном TLS-соединении
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1") != "0"
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+
+POOL_WAIT_SECONDS = registry.histogram(
+    "http_pool_wait_seconds",
+    "Ожидание соединения из пула до отправки запроса",
+    ["client"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+POOL_REQUESTS = registry.counter("http_pool_requests_total", "HTTP-запросы через пул", ["client"])
+POOL_CONNECTIONS_OPENED = registry.counter(
+    "http_pool_connections_opened_total", "Открытые TCP-соединения", ["client"]
+)
+POOL_TLS_HANDSHAKES = registry.counter("http_pool_tls_handshakes_total", "TLS-рукопожатия", ["client"])
+
+_lock = threading.Lock()
+_pid = os.getpid()
+_langfuse = None
+_openai_client = None
+_pools = []
+
+
+class PoolStats:
+    """Счетчики одного пула: запросы в работе, ожидание соединения, новые соединения"""
+
+    def __init__(self, name):
+        self.name = name
+        self.active_requests = 0
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def request_started(self):
+        with self._lock:
+            self.active_requests += 1
+            self.requests += 1
+        POOL_REQUESTS.inc(client=self.name)
+
+    def request_finished(self):
+        with self._lock:
+            self.active_requests -= 1
+
+    def observe(self, event, started, state):
+        """Обработка события расширения trace httpcore; отмечает момент получения соединения"""
+        if event == "connection.connect_tcp.started":
+            with self._lock:
+                self.connections_opened += 1
+            POOL_CONNECTIONS_OPENED.inc(client=self.name)
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+            POOL_TLS_HANDSHAKES.inc(client=self.name)
+        if not state["waited"] and event in (
+            "connection.connect_tcp.started",
+            "http11.send_request_headers.started",
+            "http2.send_request_headers.started"
+        ):
+            state["waited"] = True
+            waited = time.perf_counter() - started
+            with self._lock:
+                self.wait_seconds += waited
+            POOL_WAIT_SECONDS.observe(waited, client=self.name)
+
+    def tracer(self, started, chained=None):
+        state = {"waited": False}
+
+        def trace(event, info):
+            self.observe(event, started, state)
+            if chained is not None:
+                chained(event, info)
+
+        return trace
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "client": self.name,
+                "active_requests": self.active_requests,
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "wait_seconds_total": self.wait_seconds
+            }
+
+
+def _connections_snapshot(pool):
+    """Состояние соединений httpcore: всего, занятых, простаивающих, HTTP/2"""
+    connections = list(pool.connections)
+    idle = sum(1 for connection in connections if connection.is_idle())
+    http2 = sum(1 for connection in connections if "HTTP/2" in connection.info())
+    return {
+        "connections": len(connections),
+        "active_connections": len(connections) - idle,
+        "idle_connections": idle,
+        "http2_connections": http2
+    }
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """HTTP-транспорт, собирающий метрики пула соединений"""
+
+    def __init__(self, name, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = PoolStats(name)
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        request.extensions["trace"] = self.stats.tracer(started, request.extensions.get("trace"))
+        self.stats.request_started()
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self.stats.request_finished()
+            raise
+        # Запрос занимает соединение, пока тело ответа не дочитано
+        response.stream = _TrackedStream(response.stream, self.stats.request_finished)
+        return response
+
+    def snapshot(self):
+        return dict(_connections_snapshot(self._pool), **self.stats.snapshot())
+
+
+def _transport_options():
+    return {
+        "http2": OPENAI_HTTP2,
+        "limits": httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+        )
+    }
+
+
+def _timeout():
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def reset_clients():
+    """В дочернем процессе соединения и фоновые потоки родителя непригодны — создаем заново"""
+    global _lock, _pid, _langfuse, _openai_client, _pools
+    _lock = threading.Lock()
+    _pid = os.getpid()
+    _langfuse = None
+    _openai_client = None
+    _pools = []
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
+
+
+def _check_pid():
+    if _pid != os.getpid():
+        reset_clients()
+
+
+def get_langfuse():
+    """Клиент Langfuse, создается при первом обращении"""
+    global _langfuse
+    _check_pid()
+    if _langfuse is None:
+        with _lock:
+            if _langfuse is None:
+                logger.info("Инициализация клиента Langfuse...")
+                _langfuse = Langfuse(
+                    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
+                    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
+                    host=os.getenv("LANGFUSE_BASE_URL", "https://us.cloud.langfuse.com")
+                )
+    return _langfuse
+
+
+def get_openai_client():
+    """Синхронный клиент OpenAI процесса, создается при первом обращении"""
+    global _openai_client
+    _check_pid()
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                transport = InstrumentedTransport("openai", **_transport_options())
+                _pools.append(transport)
+                _openai_client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                    http_client=httpx.Client(transport=transport, timeout=_timeout()),
+                    # Повторы выполняет планировщик запросов (rate_limit.py)
+                    max_retries=0
+                )
+    return _openai_client
+
+
+def pool_stats():
+    """Снимок пулов соединений текущего процесса"""
+    _check_pid()
+    return [transport.snapshot() for transport in list(_pools)]
+
+
+def _pool_total(key):
+    return sum(snapshot[key] for snapshot in pool_stats())
+
+
+registry.gauge("http_pool_connections", "Соединения в пулах", lambda: _pool_total("connections"))
+registry.gauge("http_pool_active_connections", "Занятые соединения в пулах", lambda: _pool_total("active_connections"))
+registry.gauge("http_pool_idle_connections", "Простаивающие соединения в пулах", lambda: _pool_total("idle_connections"))
+registry.gauge("http_pool_active_requests", "Запросы в работе", lambda: _pool_total("active_requests"))
+
+
+def close_clients():
+    """Закрытие синхронного пула и сброс буфера Langfuse при остановке процесса"""
+    global _openai_client
+    with _lock:
+        if _openai_client is not None:
+            transport = _openai_client._client._transport
+            _openai_client.close()
+            _openai_client = None
+            if transport in _pools:
+                _pools.remove(transport)
+        if _langfuse is not None:
+            _langfuse.flush()
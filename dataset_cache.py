@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+CachedDatasetItem = namedtuple("CachedDatasetItem", ["id", "input", "expected_output", "metadata"])
+
+
+class CachedDataset:
+    """Локальный снимок датасета Langfuse с маркером версии"""
+
+    def __init__(self, name, version, items, loaded_at, checked_at=None):
+        self.name = name
+        self.version = version
+        self.items = items
+        self.loaded_at = loaded_at
+        self.checked_at = checked_at or loaded_at
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "items": [item._asdict() for item in self.items]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            name=data["name"],
+            version=data["version"],
+            items=[CachedDatasetItem(**item) for item in data["items"]],
+            loaded_at=data["loaded_at"],
+            checked_at=0
+        )
+
+
+class DatasetCache:
+    """Кэш датасетов в памяти и на диске с TTL и проверкой версии
+
+    Снимок старше max_age секунд загружается заново даже при той же версии: маркер версии
+    не видит правку элемента без изменения их числа."""
+
+    def __init__(self, loader, version_loader=None, directory=None, ttl=300, max_age=None):
+        # loader(name) -> (version, items); version_loader(name) -> version (дешевый запрос)
+        self.loader = loader
+        self.version_loader = version_loader
+        self.directory = directory
+        self.ttl = ttl
+        self.max_age = max_age
+        self._datasets = {}
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        self._stats = {"hits": 0, "revalidations": 0, "loads": 0, "invalidations": 0}
+
+    def get(self, name):
+        """Датасет из кэша; при истечении TTL сверяется версия, при изменении — перезагрузка"""
+        with self._lock:
+            loading_lock = self._loading_locks.setdefault(name, threading.Lock())
+
+        # Один поток загружает датасет, остальные ждут готовый результат
+        with loading_lock:
+            now = time.time()
+            cached = self._datasets.get(name)
+            if cached is None:
+                cached = self._read_disk(name)
+
+            if cached is not None and self.max_age and now - cached.loaded_at >= self.max_age:
+                cached = None
+
+            if cached is not None and now - cached.checked_at < self.ttl:
+                self._count("hits")
+                return cached
+
+            if cached is not None and self.version_loader is not None:
+                try:
+                    version = self.version_loader(name)
+                except Exception as e:
+                    logger.error(f"Ошибка проверки версии датасета {name}: {str(e)}")
+                    version = None
+                if version is not None and version == cached.version:
+                    cached.checked_at = now
+                    self._datasets[name] = cached
+                    self._count("revalidations")
+                    return cached
+
+            version, items = self.loader(name)
+            cached = CachedDataset(
+                name=name,
+                version=version,
+                items=[
+                    CachedDatasetItem(item.id, item.input, item.expected_output, item.metadata)
+                    for item in items
+                ],
+                loaded_at=now
+            )
+            self._datasets[name] = cached
+            self._write_disk(cached)
+            self._count("loads")
+            logger.info(f"Датасет {name} загружен в кэш ({len(cached.items)} элементов, версия {version})")
+            return cached
+
+    def invalidate(self, name=None):
+        """Сброс кэша одного датасета или всех"""
+        with self._lock:
+            names = [name] if name is not None else list(self._datasets)
+            for dataset_name in names:
+                self._datasets.pop(dataset_name, None)
+                path = self._path(dataset_name)
+                if path and os.path.exists(path):
+                    os.remove(path)
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["datasets"] = {
+                name: {"version": cached.version, "items": len(cached.items), "loaded_at": cached.loaded_at}
+                for name, cached in self._datasets.items()
+            }
+        stats["ttl"] = self.ttl
+        stats["max_age"] = self.max_age
+        return stats
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _path(self, name):
+        if self.directory is None:
+            return None
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _read_disk(self, name):
+        path = self._path(name)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return CachedDataset.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Ошибка чтения кэша датасета {name}: {str(e)}")
+            return None
+
+    def _write_disk(self, cached):
+        path = self._path(cached.name)
+        if not path:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cached.to_dict(), f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logger.error(f"Ошибка записи кэша датасета {cached.name}: {str(e)}")
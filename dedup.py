@@ -0,0 +1,435 @@
+import logging
+import re
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = ("off", "flag", "reject")
+PENDING_KEY = "pending"
+
+SHINGLE_SIZE = 5
+# Ограничение памяти: шинглов в одной матрице (шинглы × num_perm) при расчете сигнатур
+SIGNATURE_CHUNK_SHINGLES = 32768
+# Сколько добавленных строк индекс держит вне отсортированных полос до слияния
+MIN_MERGE_ROWS = 1024
+
+_SHINGLE_BASE = np.uint64(0x100000001B3)
+_MIX = np.uint64(0xBF58476D1CE4E5B9)
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+class DuplicateItemError(ValueError):
+    """Элемент отклонен как почти дубликат уже существующего"""
+
+    def __init__(self, message, duplicate_of, similarity):
+        super().__init__(message)
+        self.duplicate_of = duplicate_of
+        self.similarity = similarity
+
+
+def normalize_text(text):
+    """Нижний регистр, без пунктуации и лишних пробелов"""
+    return _NON_WORD.sub(" ", (text or "").lower()).strip()
+
+
+def shingle_hashes(texts, size=SHINGLE_SIZE):
+    """64-битные хэши символьных n-грамм всех текстов и номер текста для каждой n-граммы
+
+    Тексты склеиваются через разделитель и хэшируются одним проходом NumPy;
+    n-граммы, пересекающие разделитель, отбрасываются."""
+    joined = "\0".join(normalize_text(text).ljust(size) for text in texts)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    windows = len(codes) - size + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * _SHINGLE_BASE + codes[offset:offset + windows]
+    hashes ^= hashes >> np.uint64(31)
+    hashes *= _MIX
+    separators = np.concatenate(([0], np.cumsum(codes == 0)))
+    valid = separators[size:] == separators[:windows]
+    return hashes[valid], separators[:windows][valid]
+
+
+def item_text(input_data):
+    """Текст элемента датасета: input.text или строка input"""
+    if isinstance(input_data, dict):
+        return input_data.get("text") or ""
+    return input_data if isinstance(input_data, str) else ""
+
+
+class MinHasher:
+    """MinHash-сигнатуры: минимум по шинглам для num_perm перестановок a·x + b (mod 2^32)"""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # Нечетное a делает a·x + b взаимно однозначным на uint32; переполнение — это взятие по модулю.
+        # 32-битная арифметика вдвое легче по памяти и в несколько раз быстрее 64-битной
+        self._a = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint32) * np.uint32(2) + np.uint32(1)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint32)
+
+    def signatures(self, texts):
+        """Матрица сигнатур (текст × num_perm) для пакета текстов"""
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            # Пакет текстов, шинглы которого умещаются в ограничение памяти
+            end, shingle_count = start, 0
+            while end < len(texts) and (end == start or shingle_count < SIGNATURE_CHUNK_SHINGLES):
+                shingle_count += len(texts[end] or "") + 1
+                end += 1
+            hashes, owners = shingle_hashes(texts[start:end])
+            # Матрица (перестановка × шингл): минимум по непрерывным строкам в разы быстрее, чем по столбцам
+            values = np.multiply.outer(self._a, (hashes >> np.uint64(32)).astype(np.uint32))
+            values += self._b[:, None]
+            boundaries = np.flatnonzero(np.diff(owners)) + 1
+            result[start:end] = np.minimum.reduceat(values, np.concatenate(([0], boundaries)), axis=1).T
+            start = end
+        return result
+
+    def signature(self, text):
+        return self.signatures([text])[0]
+
+
+def similarity(signature, signatures):
+    """Оценка сходства Жаккара по доле совпавших позиций сигнатур"""
+    return (signatures == signature).mean(axis=-1)
+
+
+class NearDuplicateIndex:
+    """LSH-индекс MinHash-сигнатур в компактных массивах NumPy
+
+    Ключи полос хранятся отсортированными по каждой полосе (поиск — searchsorted),
+    новые строки копятся в небольшом несортированном хвосте и периодически сливаются."""
+
+    def __init__(self, hasher, bands=16, threshold=0.8, initial_capacity=1024):
+        if hasher.num_perm % bands:
+            raise ValueError("num_perm должен делиться на число полос LSH")
+        self.hasher = hasher
+        self.bands = bands
+        self.rows = hasher.num_perm // bands
+        self.threshold = threshold
+        # Для проверки кандидатов хватает младших 16 бит каждой позиции сигнатуры (b-bit MinHash):
+        # случайное совпадение 2^-16 не влияет на порог, а память вдвое меньше
+        self._signatures = np.empty((initial_capacity, hasher.num_perm), dtype=np.uint16)
+        self._band_keys = np.empty((initial_capacity, bands), dtype=np.uint64)
+        self._alive = np.zeros(initial_capacity, dtype=bool)
+        self._sorted_keys = np.empty((bands, 0), dtype=np.uint64)
+        self._sorted_rows = np.empty((bands, 0), dtype=np.int32)
+        self._keys = []
+        self._lock = threading.Lock()
+        self._weights = np.uint64(0x9E3779B97F4A7C15) ** np.arange(1, self.rows + 1, dtype=np.uint64)
+
+    def __len__(self):
+        return int(self._alive[:len(self._keys)].sum())
+
+    def band_keys(self, signatures):
+        """Ключ полосы — хэш ее строк; совпадение хоть одной полосы делает пару кандидатом"""
+        signatures = np.atleast_2d(signatures).astype(np.uint64)
+        bands = signatures.reshape(len(signatures), self.bands, self.rows)
+        return (bands * self._weights).sum(axis=2, dtype=np.uint64)
+
+    def _grow(self, capacity):
+        self._signatures = np.resize(self._signatures, (capacity, self._signatures.shape[1]))
+        self._band_keys = np.resize(self._band_keys, (capacity, self.bands))
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _merge(self):
+        count = len(self._keys)
+        keys = self._band_keys[:count].T
+        order = np.argsort(keys, axis=1, kind="stable").astype(np.int32)
+        self._sorted_keys = np.take_along_axis(keys, order, axis=1)
+        self._sorted_rows = order
+
+    def _candidates(self, band_keys):
+        merged = self._sorted_keys.shape[1]
+        found = [np.flatnonzero((self._band_keys[merged:len(self._keys)] == band_keys).any(axis=1)) + merged]
+        for band in range(self.bands):
+            keys = self._sorted_keys[band]
+            start = np.searchsorted(keys, band_keys[band], side="left")
+            end = np.searchsorted(keys, band_keys[band], side="right")
+            if end > start:
+                found.append(self._sorted_rows[band, start:end])
+        candidates = np.unique(np.concatenate(found))
+        return candidates[self._alive[candidates]]
+
+    def _query(self, signature, band_keys):
+        if not self._keys:
+            return None, 0.0
+        candidates = self._candidates(band_keys)
+        if not len(candidates):
+            return None, 0.0
+        scores = similarity(signature.astype(np.uint16), self._signatures[candidates])
+        best = int(scores.argmax())
+        if scores[best] < self.threshold:
+            return None, float(scores[best])
+        return self._keys[candidates[best]], float(scores[best])
+
+    def query(self, text):
+        """Ближайший почти дубликат текста: (ключ или None, сходство)"""
+        signature = self.hasher.signature(text)
+        with self._lock:
+            return self._query(signature, self.band_keys(signature)[0])
+
+    def extend(self, keys, texts):
+        """Массовое добавление без проверки (построение индекса по существующим элементам)"""
+        if not keys:
+            return
+        signatures = self.hasher.signatures(texts)
+        band_keys = self.band_keys(signatures)
+        with self._lock:
+            start = len(self._keys)
+            end = start + len(keys)
+            if end > len(self._signatures):
+                self._grow(max(end, len(self._signatures) * 3 // 2))
+            self._signatures[start:end] = signatures.astype(np.uint16)
+            self._band_keys[start:end] = band_keys
+            self._alive[start:end] = True
+            self._keys.extend(keys)
+            self._merge()
+
+    def add(self, key, text, check=True):
+        """Проверка и добавление текста одной операцией: параллельные дубликаты тоже ловятся"""
+        signature = self.hasher.signature(text)
+        band_keys = self.band_keys(signature)[0]
+        with self._lock:
+            duplicate, score = self._query(signature, band_keys) if check else (None, 0.0)
+            position = len(self._keys)
+            if position == len(self._signatures):
+                self._grow(position * 3 // 2 + 1)
+            self._signatures[position] = signature.astype(np.uint16)
+            self._band_keys[position] = band_keys
+            self._alive[position] = True
+            self._keys.append(key)
+            # Хвост растет пропорционально индексу: стоимость слияний амортизируется
+            if position + 1 - self._sorted_keys.shape[1] >= max(MIN_MERGE_ROWS, position // 8):
+                self._merge()
+            return position, duplicate, score
+
+    def replace_key(self, position, key):
+        """Замена временного ключа на id, присвоенный хранилищем"""
+        with self._lock:
+            self._keys[position] = key
+
+    def discard(self, position):
+        with self._lock:
+            self._alive[position] = False
+
+    def keys(self):
+        """Ключи элементов в индексе, кроме добавляемых прямо сейчас"""
+        with self._lock:
+            return {key for key, alive in zip(self._keys, self._alive) if alive and key != PENDING_KEY}
+
+    def memory_bytes(self):
+        return (self._signatures.nbytes + self._band_keys.nbytes + self._alive.nbytes
+                + self._sorted_keys.nbytes + self._sorted_rows.nbytes)
+
+
+class DatasetDeduplicator:
+    """Индексы почти дубликатов по датасетам: строятся при первой загрузке, далее пополняются
+
+    Раз в refresh_interval секунд версия датасета сверяется с version_loader: при смене
+    (элементы добавлены другим процессом) в индекс догружаются элементы, которых в нем нет."""
+
+    def __init__(self, loader, version_loader=None, mode="flag", threshold=0.8, num_perm=128, bands=16,
+                 refresh_interval=60.0):
+        # loader(name) -> [(id, text)] для существующих элементов датасета;
+        # version_loader(name) -> версия датасета (дешевый запрос)
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Неизвестный режим дедупликации: {mode}")
+        self.loader = loader
+        self.version_loader = version_loader
+        self.mode = mode
+        self.threshold = threshold
+        self.bands = bands
+        self.refresh_interval = refresh_interval
+        self.hasher = MinHasher(num_perm)
+        self._indexes = {}
+        # name -> (версия датасета, на которой индекс сверен, время сверки)
+        self._synced = {}
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        self._stats = {"checked": 0, "flagged": 0, "rejected": 0}
+
+    def _fresh(self, name):
+        synced = self._synced.get(name)
+        return synced is not None and time.monotonic() - synced[1] < self.refresh_interval
+
+    def index(self, name):
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is not None and self._fresh(name):
+                return index
+            loading_lock = self._loading_locks.setdefault(name, threading.Lock())
+        with loading_lock:
+            with self._lock:
+                index = self._indexes.get(name)
+                if index is not None and self._fresh(name):
+                    return index
+                synced_version = self._synced.get(name, (None, 0))[0]
+            try:
+                version = self.version_loader(name) if self.version_loader is not None else None
+                if index is not None and version is not None and version == synced_version:
+                    with self._lock:
+                        self._synced[name] = (version, time.monotonic())
+                    return index
+                existing = self.loader(name)
+            except Exception as e:
+                # Датасета еще нет (или он недоступен): индекс без существующих элементов
+                # не считается сверенным, загрузка повторится при следующей проверке
+                logger.warning(f"Индекс дубликатов {name} без существующих элементов: {str(e)}")
+                if index is None:
+                    index = NearDuplicateIndex(
+                        self.hasher, bands=self.bands, threshold=self.threshold, initial_capacity=MIN_MERGE_ROWS
+                    )
+                    with self._lock:
+                        self._indexes[name] = index
+                return index
+            if index is None:
+                index = NearDuplicateIndex(
+                    self.hasher, bands=self.bands, threshold=self.threshold,
+                    initial_capacity=len(existing) + MIN_MERGE_ROWS
+                )
+            # Элементы, уже добавленные через этот индекс, повторно не индексируются
+            known = index.keys()
+            existing = [(key, text) for key, text in existing if key not in known and normalize_text(text)]
+            index.extend([key for key, _ in existing], [text for _, text in existing])
+            with self._lock:
+                self._indexes[name] = index
+                self._synced[name] = (version, time.monotonic())
+            return index
+
+    def invalidate(self, name):
+        with self._lock:
+            self._indexes.pop(name, None)
+            self._synced.pop(name, None)
+
+    def resolve_mode(self, mode=None):
+        mode = mode or self.mode
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Режим дедупликации должен быть одним из: {', '.join(DEDUP_MODES)}")
+        return mode
+
+    def add(self, name, text, add_item, metadata=None, mode=None):
+        """Проверка текста на почти дубликат и добавление элемента через add_item(metadata)
+
+        flag — элемент добавляется с пометкой near_duplicate_of в метаданных,
+        reject — вызывается DuplicateItemError, off — проверка не выполняется."""
+        mode = self.resolve_mode(mode)
+        if mode == "off" or not normalize_text(text):
+            # Индекс без этого элемента устарел — перестроим при следующей проверке
+            if mode == "off":
+                self.invalidate(name)
+            return add_item(metadata)
+
+        index = self.index(name)
+        # До ответа хранилища элемент числится в индексе как добавляемый
+        position, duplicate, score = index.add(PENDING_KEY, text)
+        with self._lock:
+            self._stats["checked"] += 1
+        if duplicate is not None:
+            with self._lock:
+                self._stats["rejected" if mode == "reject" else "flagged"] += 1
+            if mode == "reject":
+                index.discard(position)
+                target = "элемента, добавляемого параллельно" if duplicate == PENDING_KEY else f"элемента {duplicate}"
+                raise DuplicateItemError(f"Почти дубликат {target} (сходство {score:.2f})", duplicate, score)
+            metadata = dict(metadata or {}, near_duplicate_of=duplicate, near_duplicate_similarity=round(score, 3))
+        try:
+            item = add_item(metadata)
+        except Exception:
+            index.discard(position)
+            raise
+        index.replace_key(position, item.id)
+        return item
+
+    def report(self, items, threshold=None):
+        """Кластеры почти дубликатов среди элементов [(id, text)]"""
+        items = [(key, text) for key, text in items if normalize_text(text)]
+        return duplicate_report(
+            [key for key, _ in items], [text for _, text in items], self.hasher,
+            bands=self.bands, threshold=self.threshold if threshold is None else threshold
+        )
+
+    def stats(self):
+        with self._lock:
+            indexes = dict(self._indexes)
+            stats = dict(self._stats)
+        stats.update(
+            mode=self.mode,
+            threshold=self.threshold,
+            indexes={
+                name: {"items": len(index), "memory_bytes": index.memory_bytes()}
+                for name, index in indexes.items()
+            }
+        )
+        return stats
+
+
+def duplicate_report(keys, texts, hasher, bands=16, threshold=0.8):
+    """Пакетный отчет: кластеры почти дубликатов среди существующих элементов"""
+    count = len(keys)
+    if count < 2:
+        return {"items_total": count, "duplicate_items": 0, "clusters": []}
+    index = NearDuplicateIndex(hasher, bands=bands, threshold=threshold, initial_capacity=1)
+    signatures = hasher.signatures(texts)
+    band_keys = index.band_keys(signatures)
+
+    # Кандидаты — элементы с одинаковым ключом хотя бы одной полосы: сортировка вместо
+    # попарного сравнения; каждый элемент группы сравнивается с ее первым элементом
+    candidates = []
+    for band in range(bands):
+        order = np.argsort(band_keys[:, band], kind="stable")
+        sorted_keys = band_keys[order, band]
+        same = sorted_keys[1:] == sorted_keys[:-1]
+        if not same.any():
+            continue
+        group_start = np.maximum.accumulate(np.where(np.r_[True, ~same], np.arange(count), 0))
+        positions = np.flatnonzero(same) + 1
+        first, other = order[group_start[positions]], order[positions]
+        candidates.append(np.minimum(first, other).astype(np.int64) * count + np.maximum(first, other))
+    pairs = np.unique(np.concatenate(candidates)) if candidates else np.empty(0, dtype=np.int64)
+    left, right = pairs // count, pairs % count
+    pair_scores = (signatures[left] == signatures[right]).mean(axis=1) if len(pairs) else np.empty(0)
+    confirmed = pair_scores >= threshold
+
+    # Объединение подтвержденных пар в кластеры (система непересекающихся множеств)
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(left[confirmed].tolist(), right[confirmed].tolist()):
+        parent[find(j)] = find(i)
+
+    clusters = {}
+    min_scores = {}
+    for i in range(count):
+        clusters.setdefault(find(i), []).append(i)
+    for i, score in zip(left[confirmed].tolist(), pair_scores[confirmed].tolist()):
+        root = find(i)
+        min_scores[root] = min(score, min_scores.get(root, score))
+    result = []
+    for root, members in clusters.items():
+        if len(members) < 2:
+            continue
+        result.append({
+            "keep": keys[members[0]],
+            "duplicates": [keys[i] for i in members[1:]],
+            "texts": [texts[i][:200] for i in members],
+            "min_similarity": min_scores.get(root)
+        })
+    result.sort(key=lambda cluster: -len(cluster["duplicates"]))
+    return {
+        "items_total": count,
+        "duplicate_items": sum(len(cluster["duplicates"]) for cluster in result),
+        "clusters": result
+    }
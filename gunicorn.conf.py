@@ -0,0 +1,41 @@
+import multiprocessing
+import os
+
+# Продакшен-запуск: gunicorn -c gunicorn.conf.py wsgi:application
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Процессы для CPU-части (сериализация, оценка ответов) и потоки на время ожидания LLM и Langfuse
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Приложение и датасеты загружаются один раз в мастере, воркеры получают их через fork
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Синхронный /run_experiment и SSE-потоки держат запрос дольше обычного
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Периодический перезапуск воркеров ограничивает рост памяти
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    """Клиенты и фоновые потоки мастера непригодны в воркере — инициализируем заново"""
+    if server.cfg.preload_app:
+        from wsgi import load_app_module
+
+        load_app_module().init_worker()
+
+
+def worker_exit(server, worker):
+    """Отправка буфера телеметрии перед остановкой воркера"""
+    from wsgi import load_app_module
+
+    load_app_module().shutdown_worker()
@@ -0,0 +1,152 @@
+import codecs
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class IngestError(ValueError):
+    """Ошибка разбора тела запроса целиком (а не отдельного элемента)"""
+
+
+def iter_json_array(stream, chunk_size=65536, max_item_bytes=1024 * 1024):
+    """Потоковый разбор JSON-массива: элементы выдаются по мере чтения тела"""
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+    index = 0
+
+    while True:
+        # Пропускаем пробелы и разделители между элементами
+        while position < len(buffer) and buffer[position] in _WHITESPACE + ("," if started else ""):
+            position += 1
+
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != "[":
+                    raise IngestError("Ожидался JSON-массив элементов")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+            except ValueError:
+                value, end = None, None
+            if end is not None:
+                if isinstance(value, dict):
+                    yield index, value, None
+                else:
+                    yield index, None, "Элемент должен быть JSON-объектом"
+                index += 1
+                buffer = buffer[end:]
+                position = 0
+                continue
+            if eof:
+                raise IngestError(f"Некорректный JSON в элементе {index}")
+            if len(buffer) - position > max_item_bytes:
+                raise IngestError(f"Элемент {index} превышает {max_item_bytes} байт")
+        elif eof:
+            raise IngestError("Неожиданный конец JSON-массива")
+
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            buffer += text_decoder.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+            position = 0
+
+
+def iter_jsonl(stream):
+    """Построчный разбор JSONL: ошибки отдельной строки не прерывают загрузку"""
+    index = 0
+    for raw_line in iter(stream.readline, b""):
+        line = raw_line.decode("utf-8", errors="replace").strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            yield index, None, f"Некорректный JSON: {str(e)}"
+        else:
+            if isinstance(value, dict):
+                yield index, value, None
+            else:
+                yield index, None, "Элемент должен быть JSON-объектом"
+        index += 1
+
+
+def validate_item(data):
+    """Проверка структуры элемента датасета"""
+    if "input" not in data:
+        raise ValueError("Отсутствует поле input")
+    metadata = data.get("metadata")
+    if metadata is not None and not isinstance(metadata, dict):
+        raise ValueError("Поле metadata должно быть объектом")
+    return data["input"], data.get("expected_output"), metadata
+
+
+def bulk_ingest(entries, add_item, max_parallel=8):
+    """Загрузка элементов с ограниченным параллелизмом и отчетом по каждому элементу
+
+    Ошибка разбора посреди потока не отменяет уже отправленные элементы: они дозагружаются,
+    а отчет по ним возвращается вместе с текстом ошибки в поле parse_error."""
+    report = []
+    parse_error = None
+    report_lock = threading.Lock()
+    # Ограничиваем число элементов в полете, чтобы не буферизовать все тело запроса
+    in_flight = threading.BoundedSemaphore(max_parallel * 2)
+
+    def record(entry):
+        with report_lock:
+            report.append(entry)
+
+    def process(index, input_data, expected_output, metadata):
+        try:
+            item = add_item(input_data, expected_output, metadata)
+            entry = {"index": index, "status": "success", "id": item.id}
+            duplicate_of = (getattr(item, "metadata", None) or {}).get("near_duplicate_of")
+            if duplicate_of:
+                entry["near_duplicate_of"] = duplicate_of
+            record(entry)
+        except Exception as e:
+            record({"index": index, "status": "error", "error": str(e)})
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="ingest") as executor:
+        try:
+            for index, data, error in entries:
+                if error is None:
+                    try:
+                        input_data, expected_output, metadata = validate_item(data)
+                    except ValueError as e:
+                        error = str(e)
+                if error is not None:
+                    record({"index": index, "status": "error", "error": error})
+                    continue
+                in_flight.acquire()
+                executor.submit(process, index, input_data, expected_output, metadata)
+        except IngestError as e:
+            parse_error = str(e)
+            logger.error(f"Пакетная загрузка прервана: {parse_error}")
+
+    report.sort(key=lambda entry: entry["index"])
+    succeeded = sum(1 for entry in report if entry["status"] == "success")
+    logger.info(f"Пакетная загрузка: {succeeded} из {len(report)} элементов добавлено")
+    return {
+        "total": len(report),
+        "succeeded": succeeded,
+        "failed": len(report) - succeeded,
+        "items": report,
+        "parse_error": parse_error
+    }
@@ -0,0 +1,415 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Общее для воркеров хранилище состояния и событий фоновых задач (SQLite)
+
+    Задача выполняется в воркере, который ее принял, а статус и поток событий может отдать
+    любой воркер: снимки состояния и события пишутся сюда по ходу выполнения."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _db(self):
+        # Соединение открывается лениво и заново после fork
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    finished INTEGER NOT NULL,
+                    snapshot TEXT NOT NULL,
+                    results TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_events (
+                    job_id TEXT NOT NULL,
+                    event_id INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (job_id, event_id)
+                )
+                """
+            )
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _execute(self, statements):
+        try:
+            with self._lock:
+                db = self._db()
+                for sql, params in statements:
+                    db.execute(sql, params)
+                db.commit()
+        except sqlite3.Error as e:
+            # Сбой общего хранилища не должен ронять эксперимент
+            logger.error(f"Ошибка записи состояния задачи: {str(e)}")
+
+    def _snapshot_statement(self, job_id, snapshot, results=None):
+        return (
+            """
+            INSERT INTO jobs (job_id, pid, finished, snapshot, results, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (job_id) DO UPDATE SET finished = excluded.finished, snapshot = excluded.snapshot,
+                results = COALESCE(excluded.results, jobs.results), updated_at = excluded.updated_at
+            """,
+            (
+                job_id, os.getpid(), int(snapshot["status"] in ("completed", "failed")),
+                json.dumps(snapshot, ensure_ascii=False, default=str),
+                None if results is None else json.dumps(results, ensure_ascii=False, default=str),
+                time.time()
+            )
+        )
+
+    def save(self, job_id, snapshot, results=None):
+        self._execute([self._snapshot_statement(job_id, snapshot, results)])
+
+    def append(self, job_id, event_id, event, data, snapshot, results=None):
+        """Событие задачи и снимок состояния после него одной транзакцией"""
+        self._execute([
+            (
+                "INSERT OR REPLACE INTO job_events (job_id, event_id, event, data) VALUES (?, ?, ?, ?)",
+                (job_id, event_id, event, json.dumps(data, ensure_ascii=False, default=str))
+            ),
+            self._snapshot_statement(job_id, snapshot, results)
+        ])
+
+    def load(self, job_id):
+        """(pid, finished, снимок, результаты) или None"""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT pid, finished, snapshot, results FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        pid, finished, snapshot, results = row
+        return pid, bool(finished), json.loads(snapshot), None if results is None else json.loads(results)
+
+    def events(self, job_id, after):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT event_id, event, data FROM job_events WHERE job_id = ? AND event_id > ? ORDER BY event_id",
+                (job_id, after)
+            ).fetchall()
+        return [(event_id, event, json.loads(data)) for event_id, event, data in rows]
+
+    def evict(self, keep):
+        """Ограниченная история: удаляются самые старые завершенные задачи сверх keep"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT job_id FROM jobs WHERE finished = 1 ORDER BY updated_at DESC LIMIT -1 OFFSET ?", (keep,)
+            ).fetchall()
+        if rows:
+            self._execute(
+                [("DELETE FROM job_events WHERE job_id = ?", row) for row in rows]
+                + [("DELETE FROM jobs WHERE job_id = ?", row) for row in rows]
+            )
+
+
+class StoredJob:
+    """Задача другого воркера: статус и события читаются из общего хранилища"""
+
+    def __init__(self, store, job_id, poll_interval=0.5):
+        self.store = store
+        self.id = job_id
+        self.poll_interval = poll_interval
+
+    def _state(self):
+        state = self.store.load(self.id)
+        if state is None:
+            return True, {"job_id": self.id, "status": "failed", "error": "Задача удалена из истории"}, None
+        pid, finished, snapshot, results = state
+        if not finished and not _process_alive(pid):
+            # Воркер задачи завершился, не успев ее закончить
+            snapshot = dict(snapshot, status="failed", error=f"Процесс задачи {pid} завершился")
+            finished = True
+        return finished, snapshot, results
+
+    def snapshot(self, include_results=False):
+        _, snapshot, results = self._state()
+        if include_results and snapshot["status"] == "completed":
+            snapshot = dict(snapshot, results=results)
+        return snapshot
+
+    def events(self, last_event_id=0, keepalive=15):
+        """Опрос событий из хранилища; None означает keepalive для подписчика"""
+        position = last_event_id
+        idle = 0.0
+        while True:
+            pending = self.store.events(self.id, position)
+            if pending:
+                for event in pending:
+                    yield event
+                position = pending[-1][0]
+                idle = 0.0
+                continue
+            finished, _, _ = self._state()
+            if finished:
+                # События, записанные вместе с финальным снимком
+                for event in self.store.events(self.id, position):
+                    yield event
+                return
+            time.sleep(self.poll_interval)
+            idle += self.poll_interval
+            if idle >= keepalive:
+                idle = 0.0
+                yield None
+
+
+class ExperimentJob:
+    """Фоновая задача эксперимента с прогрессом и историей событий"""
+
+    def __init__(self, params, store=None):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.store = store
+        self.status = "queued"
+        self.items_total = 0
+        self.items_done = 0
+        self.cells_total = 0
+        self.cells_done = 0
+        self.cells_resumed = 0
+        self.cells_skipped = 0
+        self.eliminated = []
+        self.batch = None
+        self.errors = 0
+        self.results = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._events = []
+        self._condition = threading.Condition()
+        self._saved_at = 0.0
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed")
+
+    def publish(self, event, data):
+        """Добавление события в историю задачи и пробуждение подписчиков"""
+        with self._condition:
+            event_id = len(self._events) + 1
+            self._events.append((event_id, event, data))
+            if self.store is not None:
+                # Финальное событие пишется вместе с результатами и признаком завершения
+                self.store.append(
+                    self.id, event_id, event, data, self.snapshot(), self.results if self.finished else None
+                )
+                self._saved_at = time.monotonic()
+            self._condition.notify_all()
+
+    def save(self, min_interval=0.0):
+        """Снимок состояния в общее хранилище не чаще min_interval секунд"""
+        if self.store is None:
+            return
+        with self._condition:
+            if time.monotonic() - self._saved_at < min_interval:
+                return
+            self._saved_at = time.monotonic()
+            snapshot = self.snapshot()
+            results = self.results if self.finished else None
+        self.store.save(self.id, snapshot, results)
+
+    def events(self, last_event_id=0, keepalive=15):
+        """Генератор событий задачи; None означает keepalive для подписчика"""
+        position = last_event_id
+        while True:
+            with self._condition:
+                if position >= len(self._events) and not self.finished:
+                    self._condition.wait(timeout=keepalive)
+                pending = self._events[position:]
+                finished = self.finished
+            if not pending:
+                if finished:
+                    return
+                yield None
+                continue
+            for event in pending:
+                yield event
+            position += len(pending)
+
+    # Колбэки, которые вызывает run_experiment по ходу выполнения
+
+    def experiment_started(self, items_total, cells_total, cells_resumed=0):
+        with self._condition:
+            self.items_total = items_total
+            self.cells_total = cells_total
+            self.cells_resumed = cells_resumed
+        self.publish("started", {
+            "items_total": items_total,
+            "cells_total": cells_total,
+            "cells_resumed": cells_resumed
+        })
+
+    def cell_finished(self, item_index, version, result):
+        with self._condition:
+            self.cells_done += 1
+            if result is None:
+                self.errors += 1
+        if result is None:
+            self.publish("cell_error", {"item_index": item_index, "version": version})
+        else:
+            self.save(min_interval=1.0)
+
+    def skip_cells(self, count):
+        """Ячейки исключенных версий в адаптивном режиме не выполняются и выходят из прогресса"""
+        with self._condition:
+            self.cells_skipped += count
+            self.cells_total -= count
+
+    def version_eliminated(self, info):
+        with self._condition:
+            self.eliminated.append(info)
+        self.publish("version_eliminated", info)
+
+    def batch_progress(self, status):
+        """Статус пакета в пакетном режиме: ячейки завершаются разом после обработки пакета"""
+        with self._condition:
+            self.batch = status
+        self.publish("batch", status)
+
+    def item_finished(self, item_index, item_result):
+        with self._condition:
+            self.items_done += 1
+        self.publish("item", {"item_index": item_index, "result": item_result})
+
+    def finish(self, results=None, error=None):
+        """Фиксация итога задачи и финальное событие для подписчиков"""
+        with self._condition:
+            self.results = results
+            self.error = error
+            self.status = "failed" if error else "completed"
+            self.finished_at = time.time()
+            self.publish("finished", self.snapshot())
+
+    def snapshot(self, include_results=False):
+        """Текущее состояние задачи для status-эндпоинта"""
+        with self._condition:
+            eta = None
+            # Восстановленные из чекпоинта ячейки завершаются мгновенно и не участвуют в оценке ETA
+            cells_executed = self.cells_done - self.cells_resumed
+            if self.started_at and cells_executed > 0 and not self.finished:
+                elapsed = time.time() - self.started_at
+                eta = elapsed / cells_executed * (self.cells_total - self.cells_done)
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "params": self.params,
+                "progress": {
+                    "items_total": self.items_total,
+                    "items_done": self.items_done,
+                    "cells_total": self.cells_total,
+                    "cells_done": self.cells_done,
+                    "cells_resumed": self.cells_resumed,
+                    "cells_skipped": self.cells_skipped,
+                    "errors": self.errors,
+                    "eta_seconds": round(eta, 1) if eta is not None else None
+                },
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error
+            }
+            if self.params.get("adaptive"):
+                data["eliminated"] = list(self.eliminated)
+            if self.params.get("mode") == "batch":
+                data["batch"] = self.batch
+            if include_results and self.status == "completed":
+                data["results"] = self.results
+            return data
+
+
+class JobManager:
+    """Очередь фоновых экспериментов на отдельном пуле потоков"""
+
+    def __init__(self, runner, max_workers=2, history_limit=100, store=None, poll_interval=0.5):
+        # store — общее хранилище задач: статус доступен из любого воркера WSGI-сервера
+        self.runner = runner
+        self.history_limit = history_limit
+        self.store = store
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="experiment-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, params):
+        """Постановка эксперимента в очередь, возвращает задачу сразу"""
+        job = ExperimentJob(params, self.store)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_finished()
+        if self.store is not None:
+            job.save()
+            self.store.evict(self.history_limit)
+        self._executor.submit(self._run, job)
+        logger.info(f"Задача эксперимента {job.id} поставлена в очередь")
+        return job
+
+    def get(self, job_id):
+        """Задача этого процесса или, при общем хранилище, задача другого воркера"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        try:
+            if self.store.load(job_id) is None:
+                return None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения состояния задачи {job_id}: {str(e)}")
+            return None
+        return StoredJob(self.store, job_id, self.poll_interval)
+
+    def _run(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        job.save()
+        try:
+            results = self.runner(job)
+        except Exception as e:
+            logger.error(f"Ошибка в задаче эксперимента {job.id}: {str(e)}")
+            job.finish(error=str(e))
+        else:
+            job.finish(results=results)
+
+    def _evict_finished(self):
+        # Храним ограниченную историю завершенных задач
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(self._jobs) - self.history_limit)]:
+            del self._jobs[job.id]
+
+
+def format_sse(event_id, event, data):
+    """Сериализация события в формат Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
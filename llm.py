@@ -0,0 +1,178 @@
+import json
+import os
+import time
+from dotenv import load_dotenv
+from openai.types.chat import ChatCompletion
+from llm_cache import LLMCache
+from rate_limit import RequestScheduler
+from singleflight import SingleFlight
+
+load_dotenv()
+
+# Общий кэш ответов для приложения и скриптов тюнинга промптов
+llm_cache = LLMCache(
+    path=os.getenv("LLM_CACHE_PATH", os.path.join("results", "llm_cache.sqlite")),
+    max_memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024")),
+    max_disk_entries=int(os.getenv("LLM_CACHE_DISK_ENTRIES", "100000")),
+    ttl=int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))) or None,
+    enabled=os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+)
+
+# Планировщик вызовов OpenAI: бюджеты RPM/TPM по моделям и повторы с backoff.
+# OPENAI_RATE_LIMITS — JSON вида {"gpt-3.5-turbo": {"rpm": 3500, "tpm": 160000}};
+# для остальных моделей лимиты берутся из OPENAI_DEFAULT_RPM/TPM или из заголовков ответа.
+# Ведра общие для процессов с одним OPENAI_RATE_LIMIT_STATE_PATH (воркеры gunicorn, скрипты)
+request_scheduler = RequestScheduler(
+    limits=json.loads(os.getenv("OPENAI_RATE_LIMITS", "{}")),
+    default_rpm=int(os.getenv("OPENAI_DEFAULT_RPM", "0")),
+    default_tpm=int(os.getenv("OPENAI_DEFAULT_TPM", "0")),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "6")),
+    expected_completion_tokens=int(os.getenv("OPENAI_EXPECTED_COMPLETION_TOKENS", "500")),
+    state_path=os.getenv("OPENAI_RATE_LIMIT_STATE_PATH", os.path.join("results", "rate_limits.sqlite")) or None
+)
+
+# Одинаковые запросы в полете выполняются один раз: в пределах процесса ожидающие получают
+# тот же объект ответа, между процессами (воркеры gunicorn, скрипты) — ответ из общего кэша
+single_flight = SingleFlight(
+    lock_path=f"{llm_cache.path}.lock" if llm_cache.enabled and llm_cache.path else None
+)
+SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT", "1") == "1"
+
+def _create_completion(client, params):
+    """Вызов API через планировщик с учетом заголовков лимитов и фактических токенов"""
+    model = params.get("model")
+
+    def call():
+        raw = client.chat.completions.with_raw_response.create(**params)
+        request_scheduler.observe_headers(model, raw.headers)
+        return raw.parse()
+
+    return request_scheduler.call(model, params, call)
+
+def _fetch_completion(client, key, params):
+    """Вызов API лидером single-flight; между процессами ключ удерживается до записи в кэш.
+    Возвращает (ответ, cached): cached — ответ взят из кэша после ожидания другого процесса"""
+    if not llm_cache.enabled:
+        return _create_completion(client, params), False
+
+    with single_flight.across_processes(key) as waited:
+        if waited:
+            cached = llm_cache.get(key)
+            if cached is not None:
+                single_flight.record_cross_process_hit()
+                return ChatCompletion.model_validate_json(cached), True
+        response = _create_completion(client, params)
+        tokens = response.usage.total_tokens if response.usage else 0
+        llm_cache.set(key, response.model_dump_json(), tokens=tokens)
+        return response, False
+
+def cached_chat_completion(client, use_cache=True, **params):
+    """chat_completion с признаком источника ответа: (ответ, cached)
+
+    cached — ответ взят из кэша или у одинакового вызова в полете, а не получен от API для
+    этого запроса; время такого вызова не является задержкой модели."""
+    if not use_cache:
+        return _create_completion(client, params), False
+
+    key = llm_cache.make_key(params)
+    if llm_cache.enabled:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return ChatCompletion.model_validate_json(cached), True
+
+    if not SINGLE_FLIGHT_ENABLED:
+        return _fetch_completion(client, key, params)
+    (response, cached), shared = single_flight.do(key, lambda: _fetch_completion(client, key, params))
+    return response, cached or shared
+
+def chat_completion(client, use_cache=True, **params):
+    """Вызов chat completions через кэш и объединение одинаковых запросов в полете;
+    use_cache=False идет мимо кэша и без объединения"""
+    return cached_chat_completion(client, use_cache, **params)[0]
+
+class ChatStream:
+    """Потоковый вызов chat completions с замером времени до первого токена"""
+
+    def __init__(self, client, **params):
+        self.client = client
+        self.params = params
+        self.parts = []
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.usage = None
+        self.chunks = 0
+
+    def __iter__(self):
+        """Выдает фрагменты текста по мере поступления от модели"""
+        self.started_at = time.perf_counter()
+        stream = request_scheduler.call(
+            self.params.get("model"),
+            self.params,
+            lambda: self.client.chat.completions.create(
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.params
+            )
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                self.usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.chunks += 1
+            self.parts.append(delta)
+            yield delta
+        self.finished_at = time.perf_counter()
+        if self.usage is not None:
+            request_scheduler.settle(
+                self.params.get("model"),
+                request_scheduler.estimate(self.params),
+                self.usage.total_tokens
+            )
+
+    def consume(self):
+        """Дочитать поток до конца без обработки фрагментов"""
+        for _ in self:
+            pass
+        return self
+
+    @property
+    def answer(self):
+        return "".join(self.parts)
+
+    @property
+    def total_tokens(self):
+        return self.usage.total_tokens if self.usage else None
+
+    @property
+    def completion_tokens(self):
+        # Без usage в потоке считаем каждый фрагмент за токен
+        return self.usage.completion_tokens if self.usage else self.chunks
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        generation_time = self.finished_at - self.first_token_at
+        return self.completion_tokens / generation_time if generation_time > 0 else None
+
+    def metrics(self):
+        """Метрики потока для трейса"""
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "tokens_per_second": self.tokens_per_second,
+            "total_time": self.finished_at - self.started_at if self.finished_at else None,
+            "completion_tokens": self.completion_tokens
+        }
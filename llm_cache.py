@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """Двухуровневый кэш ответов LLM: LRU в памяти и SQLite на диске"""
+
+    def __init__(self, path=None, max_memory_entries=1024, max_disk_entries=100000, ttl=None, enabled=True):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+            "tokens_saved": 0
+        }
+
+    @staticmethod
+    def make_key(params):
+        """Хэш полного запроса (модель, сообщения, температура и прочие параметры)"""
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _db(self):
+        # Соединение открывается лениво и заново после fork
+        if self.path is None:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key):
+        """Поиск ответа сначала в памяти, затем на диске"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, tokens, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    self._stats["tokens_saved"] += tokens
+                    return value
+                del self._memory[key]
+
+            row = None
+            db = self._db()
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT value, tokens, created_at FROM llm_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and self._expired(row[2], now):
+                        db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                        db.commit()
+                        row = None
+                    elif row is not None:
+                        db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Ошибка чтения кэша LLM: {str(e)}")
+                    row = None
+
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, tokens, created_at = row
+            self._remember(key, value, tokens, created_at)
+            self._stats["disk_hits"] += 1
+            self._stats["tokens_saved"] += tokens
+            return value
+
+    def set(self, key, value, tokens=0):
+        """Сохранение ответа в оба уровня кэша"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, tokens, now)
+            self._stats["writes"] += 1
+            db = self._db()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, tokens, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, tokens, now, now)
+                )
+                # Вытеснение давно не использованных записей сверх лимита
+                if self._stats["writes"] % 100 == 0:
+                    self._evict_disk(db)
+                db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи в кэш LLM: {str(e)}")
+
+    def _remember(self, key, value, tokens, created_at):
+        self._memory[key] = (value, tokens, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, db):
+        if self.ttl is not None:
+            db.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        db.execute(
+            """
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_disk_entries,)
+        )
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._memory.clear()
+            db = self._db()
+            if db is not None:
+                db.execute("DELETE FROM llm_cache")
+                db.commit()
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        return stats
@@ -0,0 +1,131 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Группировка одновременных запросов в пачки для одного пакетного прохода
+
+    Первый запрос открывает окно: пачка закрывается, когда в ней max_batch_size запросов
+    или с момента первого прошло max_wait секунд. process(items) получает пачку и возвращает
+    результаты в том же порядке; исключение на месте результата достается только своему
+    запросу, исключение самого process — всем запросам пачки.
+
+    workers — число пачек в обработке одновременно. Новое окно открывается только при
+    свободном воркере, поэтому пока все заняты, запросы копятся в очереди и уходят
+    следующей полной пачкой."""
+
+    def __init__(self, process, max_batch_size=32, max_wait=0.01, workers=1, name="microbatch"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size должен быть положительным числом")
+        if max_wait < 0:
+            raise ValueError("max_wait не может быть отрицательным")
+        if workers < 1:
+            raise ValueError("workers должен быть положительным числом")
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self.name = name
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(workers)
+        self._stats = {"requests": 0, "batches": 0, "failed_batches": 0, "max_batch": 0, "wait_seconds": 0.0}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Поток сборки пачек не переживает fork: в ребенке он стартует при первом запросе
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.workers)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        """Постановка запроса в очередь; результат — Future"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def call(self, item, timeout=None):
+        """Синхронный вызов: ожидание результата запроса из его пачки"""
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            batch = self._collect()
+            self._executor.submit(self._process_batch, batch)
+
+    def _process_batch(self, batch):
+        try:
+            self._run_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            results = self.process([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name}: {len(results)} результатов на пачку из {len(batch)}")
+        except Exception as e:
+            logger.error(f"Ошибка обработки пачки {self.name}: {str(e)}")
+            results = [e] * len(batch)
+            failed = 1
+        else:
+            failed = 0
+        for (_, future, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        with self._lock:
+            self._stats["requests"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["failed_batches"] += failed
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["wait_seconds"] += sum(started - queued for _, _, queued in batch)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats["batches"]
+        requests = stats.pop("requests")
+        wait_seconds = stats.pop("wait_seconds")
+        return dict(
+            stats,
+            requests=requests,
+            max_batch_size=self.max_batch_size,
+            max_wait=self.max_wait,
+            workers=self.workers,
+            mean_batch=requests / batches if batches else None,
+            mean_wait_seconds=wait_seconds / requests if requests else None
+        )
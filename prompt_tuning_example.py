@@ -1,50 +1,23 @@
-import os
 from dotenv import load_dotenv
-from openai import OpenAI
-from langfuse import Langfuse
+import atexit
 import time
 import json
+from clients import close_clients, get_langfuse, get_openai_client
+from llm import ChatStream, chat_completion, llm_cache, single_flight
+from prompts import build_messages, create_prompt_v1, create_prompt_v2
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Инициализация клиентов
-openai_client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-)
+# Пул соединений закрывается, а буфер Langfuse отправляется при выходе
+atexit.register(close_clients)
 
-langfuse = Langfuse(
-    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-    secret_key=os.getenv("LANGFUSE_SECRET_KEY")
-)
-
-def create_prompt_v1(query):
-    """Базовая версия промпта"""
-    return f"""
-    Пожалуйста, ответь на следующий вопрос максимально подробно и информативно.
-    Вопрос: {query}
-    """
-
-def create_prompt_v2(query):
-    """Оптимизированная версия промпта"""
-    return f"""
-    Контекст: Ты - эксперт в области технологий.
-    
-    Правила:
-    1. Начни с краткого ответа (1-2 предложения)
-    2. Приведи 2-3 конкретных примера
-    3. Заверши практическим советом
-    
-    Вопрос: {query}
-    """
-
-def test_prompt(prompt_func, query, version):
+def test_prompt(prompt_func, query, version, use_cache=True, stream=False):
     """Тестирование промпта с измерением метрик"""
     start_time = time.time()
     
     # Создаем trace в Langfuse
-    trace = langfuse.trace(
+    trace = get_langfuse().trace(
         name=f"prompt_test_v{version}",
         input={"query": query}
     )
@@ -53,50 +26,71 @@ def test_prompt(prompt_func, query, version):
         # Создаем промпт
         prompt = prompt_func(query)
         
-        # Вызываем OpenAI API
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+        messages = build_messages(prompt)
+        
+        # Вызываем OpenAI API; в потоковом режиме замеряем время до первого токена
+        stream_metrics = None
+        if stream:
+            chat_stream = ChatStream(
+                get_openai_client(),
+                model="gpt-3.5-turbo",
+                messages=messages,
+                temperature=0.7
+            ).consume()
+            answer = chat_stream.answer
+            tokens_used = chat_stream.total_tokens
+            stream_metrics = chat_stream.metrics()
+        else:
+            response = chat_completion(
+                get_openai_client(),
+                use_cache=use_cache,
+                model="gpt-3.5-turbo",
+                messages=messages,
+                temperature=0.7
+            )
+            answer = response.choices[0].message.content
+            tokens_used = response.usage.total_tokens
         
-        # Получаем ответ и метрики
-        answer = response.choices[0].message.content
-        tokens_used = response.usage.total_tokens
+        # Получаем метрики
         execution_time = time.time() - start_time
         
-        # Завершаем trace с результатами
-        trace.end(
+        # Сохраняем результаты в trace
+        trace.update(
             output={
                 "answer": answer,
                 "tokens_used": tokens_used,
                 "execution_time": execution_time
-            }
+            },
+            metadata={"streaming": stream_metrics}
         )
         
-        return {
+        result = {
             "version": version,
             "answer": answer,
             "tokens_used": tokens_used,
             "execution_time": execution_time
         }
+        if stream_metrics is not None:
+            result["time_to_first_token"] = stream_metrics["time_to_first_token"]
+            result["tokens_per_second"] = stream_metrics["tokens_per_second"]
+        return result
         
     except Exception as e:
-        trace.end(error=str(e))
-        return {"error": str(e)}
+        trace.update(
+            output={"error": str(e)},
+            metadata={"error": True}
+        )
+        return {"version": version, "error": str(e)}
 
-def compare_prompts(query):
+def compare_prompts(query, use_cache=True, stream=False):
     """Сравнение разных версий промптов"""
     results = []
     
     # Тестируем базовую версию
-    results.append(test_prompt(create_prompt_v1, query, 1))
+    results.append(test_prompt(create_prompt_v1, query, 1, use_cache, stream))
     
     # Тестируем оптимизированную версию
-    results.append(test_prompt(create_prompt_v2, query, 2))
+    results.append(test_prompt(create_prompt_v2, query, 2, use_cache, stream))
     
     # Выводим результаты
     print("\nРезультаты сравнения:")
@@ -105,11 +99,19 @@ def compare_prompts(query):
         if "error" not in result:
             print(f"\nВерсия {result['version']}:")
             print(f"Время выполнения: {result['execution_time']:.2f} сек")
+            if result.get("time_to_first_token") is not None:
+                print(f"Время до первого токена: {result['time_to_first_token']:.2f} сек")
+                print(f"Скорость генерации: {result['tokens_per_second'] or 0:.1f} токенов/сек")
             print(f"Использовано токенов: {result['tokens_used']}")
             print(f"Ответ: {result['answer'][:200]}...")
         else:
             print(f"\nОшибка в версии {result['version']}: {result['error']}")
     
+    stats = llm_cache.stats()
+    print(f"\nКэш LLM: попаданий {stats['hits']}, промахов {stats['misses']}, сэкономлено токенов {stats['tokens_saved']}")
+    flights = single_flight.stats()
+    print(f"Объединено одинаковых вызовов: {flights['coalesced']} в процессе, {flights['coalesced_cross_process']} между процессами")
+    
     return results
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+def build_messages(prompt):
+    """Сообщения для модели по готовому промпту"""
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def create_prompt_v1(query):
+    """Базовая версия промпта"""
+    return f"""
+    Пожалуйста, ответь на следующий вопрос максимально подробно и информативно.
+    Вопрос: {query}
+    """
+
+
+def create_prompt_v2(query):
+    """Оптимизированная версия промпта с контекстом"""
+    return f"""
+    Контекст: Ты - эксперт в области технологий.
+    
+    Правила:
+    1. Начни с краткого ответа (1-2 предложения)
+    2. Приведи 2-3 конкретных примера
+    3. Заверши практическим советом
+    
+    Вопрос: {query}
+    """
+
+
+def create_prompt_v3(query):
+    """Версия промпта с шаблоном и ограничениями"""
+    return f"""
+    Ты - эксперт в области технологий. Ответь на вопрос, следуя шаблону:
+    
+    [Краткий ответ]
+    - Основная мысль
+    - Ключевой момент
+    
+    [Примеры]
+    - Пример 1
+    - Пример 2
+    
+    [Практическое применение]
+    - Совет 1
+    - Совет 2
+    
+    Вопрос: {query}
+    
+    Ограничения:
+    - Не используй технический жаргон
+    - Держи ответ в пределах 200 слов
+    - Фокусируйся на практической пользе
+    """
+
+
+# Версии промптов, участвующие в экспериментах
+PROMPT_VERSIONS = [
+    (1, create_prompt_v1),
+    (2, create_prompt_v2),
+    (3, create_prompt_v3)
+]
@@ -0,0 +1,129 @@
+import math
+import threading
+from statistics import NormalDist
+import numpy as np
+
+
+def look_schedule(min_items, items_total, growth=1.5):
+    """Моменты проверок (число завершенных элементов): геометрическая сетка от min_items"""
+    looks = []
+    look = max(2, min_items)
+    while look < items_total:
+        looks.append(look)
+        look = max(look + 1, int(math.ceil(look * growth)))
+    return looks
+
+
+class VersionRace:
+    """Последовательное исключение версий промпта (successive elimination) по парным оценкам
+
+    На каждой проверке лидер — версия с наибольшим средним качеством на общих элементах.
+    Версия исключается, если нижняя граница парной разности «лидер − версия» выше нуля.
+    Уровень значимости делится поровну между сравнениями и проверками (поправка Бонферрони),
+    поэтому повторные проверки по ходу эксперимента не завышают долю ошибочных исключений."""
+
+    def __init__(self, versions, items_total, confidence=0.95, min_items=10, growth=1.5):
+        self.versions = list(versions)
+        self.alive = list(self.versions)
+        self.scores = np.full((items_total, len(self.versions)), np.nan)
+        self.looks = look_schedule(min_items, items_total, growth)
+        alpha = (1 - confidence) / (max(1, len(self.versions) - 1) * max(1, len(self.looks)))
+        self.z = NormalDist().inv_cdf(1 - alpha)
+        self.eliminated = []
+        self._next_look = 0
+
+    def record(self, item_index, version, score):
+        if score is not None:
+            self.scores[item_index, self.versions.index(version)] = score
+
+    def check(self, items_done):
+        """Проверка по достижении очередной точки сетки; возвращает исключенные версии"""
+        if len(self.alive) < 2 or self._next_look >= len(self.looks) or items_done < self.looks[self._next_look]:
+            return []
+        while self._next_look < len(self.looks) and self.looks[self._next_look] <= items_done:
+            self._next_look += 1
+
+        columns = [self.versions.index(version) for version in self.alive]
+        scores = self.scores[:, columns]
+        scores = scores[~np.isnan(scores).any(axis=1)]
+        n = len(scores)
+        if n < 2:
+            return []
+        means = scores.mean(axis=0)
+        leader = int(means.argmax())
+        eliminated = []
+        for position, version in enumerate(list(self.alive)):
+            if position == leader:
+                continue
+            differences = scores[:, leader] - scores[:, position]
+            margin = self.z * differences.std(ddof=1) / math.sqrt(n)
+            lower = float(differences.mean() - margin)
+            if lower > 0:
+                eliminated.append({
+                    "version": version,
+                    "leader": self.alive[leader],
+                    "items": n,
+                    "mean_difference": float(differences.mean()),
+                    "lower_bound": lower
+                })
+        for info in eliminated:
+            self.alive.remove(info["version"])
+        self.eliminated.extend(eliminated)
+        return eliminated
+
+
+class ExperimentRace:
+    """Гонки версий по моделям эксперимента: у каждой модели свой набор живых версий"""
+
+    def __init__(self, confidence=0.95, min_items=10):
+        if not 0 < confidence < 1:
+            raise ValueError("confidence должен быть в интервале (0, 1)")
+        if min_items < 2:
+            raise ValueError("min_items должен быть не меньше 2")
+        self.confidence = confidence
+        self.min_items = min_items
+        self.races = {}
+        self.cells_skipped = 0
+        self._items_done = 0
+        self._lock = threading.Lock()
+
+    def start(self, models, versions, items_total):
+        """Вызывается экспериментом, когда известны модели, версии и размер датасета"""
+        with self._lock:
+            self.races = {
+                model: VersionRace(versions, items_total, self.confidence, self.min_items) for model in models
+            }
+            self.cells_skipped = 0
+            self._items_done = 0
+
+    def is_alive(self, model, version):
+        with self._lock:
+            return version in self.races[model].alive
+
+    def record(self, item_index, model, version, result):
+        with self._lock:
+            self.races[model].record(item_index, version, result["quality_score"] if result else None)
+
+    def item_finished(self):
+        """Элемент завершен по всем живым версиям; возвращает исключения [(модель, сведения)]"""
+        with self._lock:
+            self._items_done += 1
+            return [
+                (model, info) for model, race in self.races.items() for info in race.check(self._items_done)
+            ]
+
+    def skip(self, count):
+        with self._lock:
+            self.cells_skipped += count
+
+    def summary(self):
+        with self._lock:
+            return {
+                "confidence": self.confidence,
+                "min_items": self.min_items,
+                "cells_skipped": self.cells_skipped,
+                "models": {
+                    model: {"alive": list(race.alive), "eliminated": list(race.eliminated)}
+                    for model, race in self.races.items()
+                }
+            }
@@ -0,0 +1,384 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых запрос имеет смысл повторить
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+class TokenBucket:
+    """Ведро токенов с равномерным пополнением; capacity=0 — без ограничения"""
+
+    def __init__(self, capacity, per_seconds=60.0):
+        self.capacity = capacity
+        self.per_seconds = per_seconds
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self):
+        return not self.capacity
+
+    def refill(self, now):
+        if self.unlimited:
+            return
+        rate = self.capacity / self.per_seconds
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """Сколько ждать, пока в ведре наберется amount"""
+        if self.unlimited:
+            return 0.0
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * self.per_seconds / self.capacity
+
+    def take(self, amount):
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def resize(self, capacity):
+        if capacity and capacity != self.capacity:
+            self.level = capacity if self.unlimited else min(self.level, capacity)
+            self.capacity = capacity
+
+
+class ModelBudget:
+    """Бюджеты RPM/TPM одной модели и пауза после 429"""
+
+    def __init__(self, rpm=0, tpm=0, configured=False):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # Явно заданные лимиты не перезаписываются заголовками ответа
+        self.configured = configured
+        self.paused_until = 0.0
+        self.stats = {
+            "admitted": 0,
+            "wait_seconds": 0.0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failed": 0,
+            "estimated_tokens": 0,
+            "actual_tokens": 0
+        }
+
+
+def estimate_tokens(params, expected_completion_tokens=500):
+    """Оценка токенов запроса до вызова: ~4 символа на токен плюс ожидаемый ответ"""
+    prompt_tokens = 0
+    for message in params.get("messages", []):
+        content = message.get("content") or ""
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+        prompt_tokens += len(content) // 4 + 4
+    completion_tokens = params.get("max_tokens") or params.get("max_completion_tokens") or expected_completion_tokens
+    return prompt_tokens + completion_tokens
+
+
+def _retry_after(error):
+    """Задержка из заголовков retry-after-ms / retry-after, если сервер ее сообщил"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class SharedBudgetStore:
+    """Уровни ведер и паузы моделей в SQLite, общие для процессов (воркеры gunicorn, скрипты)
+
+    Каждое изменение бюджета — транзакция BEGIN IMMEDIATE: процесс читает уровни, пополняет
+    их по прошедшему времени, списывает запрос и записывает обратно, поэтому все процессы
+    расходуют один лимит ключа API, а не каждый — свой."""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._connection_pid = None
+
+    def _db(self):
+        # Соединение открывается лениво и заново после fork; вызывается под блокировкой планировщика
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # Потеря последних уровней ведер при сбое питания безвредна — fsync не нужен
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rate_limit_budgets (
+                    model TEXT PRIMARY KEY,
+                    rpm_capacity INTEGER NOT NULL,
+                    rpm_level REAL NOT NULL,
+                    tpm_capacity INTEGER NOT NULL,
+                    tpm_level REAL NOT NULL,
+                    paused_until REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def load(self, model, budget):
+        """Начало транзакции и загрузка общего состояния модели в budget"""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT rpm_capacity, rpm_level, tpm_capacity, tpm_level, paused_until, updated_at "
+                "FROM rate_limit_budgets WHERE model = ?", (model,)
+            ).fetchone()
+        except sqlite3.Error:
+            db.execute("ROLLBACK")
+            raise
+        now = time.monotonic()
+        if row is not None:
+            rpm_capacity, rpm_level, tpm_capacity, tpm_level, paused_until, updated_at = row
+            # Время в файле — настенное: монотонные часы разных процессов несравнимы
+            wall = time.time()
+            elapsed = max(0.0, wall - updated_at)
+            for bucket, capacity, level in ((budget.requests, rpm_capacity, rpm_level),
+                                            (budget.tokens, tpm_capacity, tpm_level)):
+                if not budget.configured:
+                    bucket.capacity = int(capacity)
+                bucket.level = min(level, bucket.capacity)
+                bucket.updated_at = now - elapsed
+            budget.paused_until = now + paused_until - wall
+        budget.requests.refill(now)
+        budget.tokens.refill(now)
+        return db
+
+    def save(self, db, model, budget):
+        """Запись состояния модели и завершение транзакции"""
+        now = time.monotonic()
+        wall = time.time()
+        budget.requests.refill(now)
+        budget.tokens.refill(now)
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO rate_limit_budgets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (model, budget.requests.capacity, budget.requests.level, budget.tokens.capacity,
+                 budget.tokens.level, wall + budget.paused_until - now, wall)
+            )
+            db.execute("COMMIT")
+        except sqlite3.Error:
+            self.rollback(db)
+            raise
+
+    @staticmethod
+    def rollback(db):
+        try:
+            db.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+
+class RequestScheduler:
+    """Допуск вызовов OpenAI через ведра RPM/TPM и повторы с backoff и jitter
+
+    С state_path ведра общие для всех процессов с этим файлом (SharedBudgetStore), иначе
+    у каждого процесса свои."""
+
+    def __init__(self, limits=None, default_rpm=0, default_tpm=0, max_retries=6,
+                 base_delay=0.5, max_delay=30.0, expected_completion_tokens=500, state_path=None):
+        self.limits = limits or {}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.expected_completion_tokens = expected_completion_tokens
+        self.shared = SharedBudgetStore(state_path) if state_path else None
+        self._budgets = {}
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _synced(self, model):
+        """Бюджет модели под блокировкой; при общем состоянии — внутри транзакции SQLite"""
+        with self._lock:
+            budget = self._budget(model)
+            db = None
+            if self.shared is not None:
+                try:
+                    db = self.shared.load(model, budget)
+                except sqlite3.Error as e:
+                    # Недоступный файл состояния не останавливает вызовы: работаем по своему ведру
+                    logger.error(f"Ошибка чтения общего состояния лимитов: {str(e)}")
+            if db is None:
+                yield budget
+                return
+            try:
+                yield budget
+            except BaseException:
+                self.shared.rollback(db)
+                raise
+            try:
+                self.shared.save(db, model, budget)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи общего состояния лимитов: {str(e)}")
+
+    def _budget(self, model):
+        budget = self._budgets.get(model)
+        if budget is None:
+            limits = self.limits.get(model)
+            if limits is not None:
+                budget = ModelBudget(limits.get("rpm", 0), limits.get("tpm", 0), configured=True)
+            else:
+                budget = ModelBudget(self.default_rpm, self.default_tpm)
+            self._budgets[model] = budget
+        return budget
+
+    def acquire(self, model, tokens):
+        """Блокирует вызывающего, пока оба ведра модели не позволят запрос"""
+        waited = 0.0
+        while True:
+            with self._synced(model) as budget:
+                now = time.monotonic()
+                budget.requests.refill(now)
+                budget.tokens.refill(now)
+                wait = max(
+                    budget.paused_until - now,
+                    budget.requests.wait_time(1),
+                    budget.tokens.wait_time(tokens)
+                )
+                if wait <= 0:
+                    budget.requests.take(1)
+                    budget.tokens.take(tokens)
+                    budget.stats["admitted"] += 1
+                    budget.stats["wait_seconds"] += waited
+                    budget.stats["estimated_tokens"] += tokens
+            if wait <= 0:
+                return
+            # Спим небольшими шагами: ведро могут пересчитать по заголовкам ответа
+            step = min(wait, 1.0)
+            time.sleep(step)
+            waited += step
+
+    def settle(self, model, estimated, actual):
+        """Поправка ведра токенов на разницу между оценкой и фактом"""
+        with self._synced(model) as budget:
+            budget.stats["actual_tokens"] += actual
+            if not budget.tokens.unlimited:
+                budget.tokens.level -= actual - estimated
+
+    def observe_headers(self, model, headers):
+        """Подстройка под лимиты из заголовков x-ratelimit-* ответа OpenAI"""
+        if headers is None:
+            return
+        try:
+            limit_requests = int(headers.get("x-ratelimit-limit-requests", 0))
+            limit_tokens = int(headers.get("x-ratelimit-limit-tokens", 0))
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            remaining_requests = float(remaining_requests) if remaining_requests is not None else None
+            remaining_tokens = float(remaining_tokens) if remaining_tokens is not None else None
+        except ValueError:
+            return
+        with self._synced(model) as budget:
+            if budget.configured:
+                return
+            budget.requests.resize(limit_requests)
+            budget.tokens.resize(limit_tokens)
+            # Остаток на сервере учитывает и чужие запросы с тем же ключом
+            if remaining_requests is not None and not budget.requests.unlimited:
+                budget.requests.level = min(budget.requests.level, remaining_requests)
+            if remaining_tokens is not None and not budget.tokens.unlimited:
+                budget.tokens.level = min(budget.tokens.level, remaining_tokens)
+
+    def pause(self, model, seconds):
+        """Пауза для всех вызовов модели (после 429 с retry-after)"""
+        with self._synced(model) as budget:
+            budget.paused_until = max(budget.paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt):
+        """Экспоненциальная задержка с полным jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def estimate(self, params):
+        return estimate_tokens(params, self.expected_completion_tokens)
+
+    def call(self, model, params, func):
+        """Выполнение func() с допуском по бюджету и повторами транзиентных ошибок"""
+        estimated = self.estimate(params)
+        attempt = 0
+        while True:
+            self.acquire(model, estimated)
+            try:
+                result = func()
+                usage = getattr(result, "usage", None)
+                if usage is not None:
+                    self.settle(model, estimated, usage.total_tokens)
+                return result
+            except RETRYABLE_ERRORS as e:
+                # Неудачный запрос не потребил токены — возвращаем оценку в ведро
+                self.settle(model, estimated, 0)
+                rate_limited = isinstance(e, openai.RateLimitError)
+                with self._lock:
+                    stats = self._budget(model).stats
+                    if rate_limited:
+                        stats["rate_limited"] += 1
+                    if attempt >= self.max_retries:
+                        stats["failed"] += 1
+                    else:
+                        stats["retries"] += 1
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = _retry_after(e)
+                delay = self.backoff(attempt)
+                if retry_after is not None:
+                    delay = retry_after + delay * 0.1
+                if rate_limited:
+                    self.pause(model, delay)
+                logger.warning(
+                    f"Повтор вызова {model} через {delay:.2f} сек (попытка {attempt + 1}): {type(e).__name__}"
+                )
+                if not rate_limited:
+                    time.sleep(delay)
+                attempt += 1
+
+    def stats(self):
+        with self._lock:
+            models = list(self._budgets)
+        result = {}
+        for model in models:
+            with self._synced(model) as budget:
+                now = time.monotonic()
+                budget.requests.refill(now)
+                budget.tokens.refill(now)
+                result[model] = dict(
+                    budget.stats,
+                    rpm_limit=budget.requests.capacity,
+                    tpm_limit=budget.tokens.capacity,
+                    requests_available=budget.requests.level,
+                    tokens_available=budget.tokens.level,
+                    paused_seconds=max(0.0, budget.paused_until - now)
+                )
+        return result
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Состояние прогрева зависимостей для readiness-проверки"""
+
+    def __init__(self, checks):
+        self.started_at = time.time()
+        self.ready_at = None
+        self._checks = {name: {"status": "pending", "error": None, "attempts": 0} for name in checks}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def update(self, name, status, error=None):
+        with self._lock:
+            check = self._checks[name]
+            check["status"] = status
+            check["error"] = error
+            if status != "pending":
+                check["attempts"] += 1
+            if all(check["status"] == "ok" for check in self._checks.values()):
+                self.ready_at = time.time()
+                self._ready.set()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ready": self.is_ready,
+                "started_at": self.started_at,
+                "ready_at": self.ready_at,
+                "warmup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+                "checks": {name: dict(check) for name, check in self._checks.items()}
+            }
+
+
+def warm_up(readiness, steps, retry_delay=1.0, max_retry_delay=60.0, max_attempts=None):
+    """Шаги прогрева по порядку с повтором ошибок; False, если шаг исчерпал max_attempts"""
+    for name, func in steps:
+        delay = retry_delay
+        attempts = 0
+        while True:
+            try:
+                func()
+                readiness.update(name, "ok")
+                logger.info(f"Прогрев: шаг {name} выполнен")
+                break
+            except Exception as e:
+                attempts += 1
+                readiness.update(name, "error", str(e))
+                if max_attempts is not None and attempts >= max_attempts:
+                    logger.error(f"Прогрев: шаг {name} не выполнен за {attempts} попыток: {str(e)}")
+                    return False
+                logger.error(f"Прогрев: ошибка шага {name}: {str(e)}, повтор через {delay:.0f} сек")
+                time.sleep(delay)
+                delay = min(delay * 2, max_retry_delay)
+    return True
+
+
+def start_warmup(readiness, steps, retry_delay=1.0, max_retry_delay=60.0):
+    """Фоновый прогрев: шаги выполняются по порядку, ошибки повторяются с backoff"""
+    thread = threading.Thread(
+        target=warm_up, args=(readiness, steps, retry_delay, max_retry_delay), name="warmup", daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,177 @@
+import base64
+import binascii
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета brotli ответы сжимаются только gzip
+    brotli = None
+
+# Ответы меньше порога отдаются без сжатия
+MIN_COMPRESS_BYTES = 1024
+
+MAX_PAGE_SIZE = 500
+
+
+class CursorError(ValueError):
+    """Некорректный или устаревший курсор пагинации"""
+
+
+def encode_cursor(offset, version):
+    payload = json.dumps({"o": offset, "v": version}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, version):
+    """Смещение из курсора; курсор от другой версии данных отклоняется"""
+    if not cursor:
+        return 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(payload["o"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise CursorError("Некорректный курсор")
+    if payload.get("v") != version or offset < 0:
+        raise CursorError("Курсор устарел: данные изменились, начните с первой страницы")
+    return offset
+
+
+def parse_limit(value, default=None):
+    """Размер страницы из параметра limit; без параметра (None) — все элементы"""
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 0:
+        raise ValueError("limit должен быть неотрицательным числом")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def content_version(data):
+    """Хэш содержимого для данных без собственной версии"""
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SerializedResponse:
+    """JSON-ответ, сериализованный один раз; сжатые варианты создаются при первом запросе"""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        with self._lock:
+            body = self._encoded.get(encoding)
+            if body is None:
+                if encoding == "br":
+                    body = brotli.compress(self.body, quality=5)
+                else:
+                    body = gzip.compress(self.body, compresslevel=6)
+                self._encoded[encoding] = body
+            return body
+
+
+def _accepted_encoding(accept_encoding):
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Сжатые представления помечаются суффиксом, но содержимое у них одно
+        if tag.strip('"').split("-")[0] == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU готовых JSON-ответов по ключу и версии данных"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0}
+
+    def get(self, key, build):
+        """Готовый ответ по ключу (ключ включает версию данных); build() строит payload при промахе"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            self._stats["misses"] += 1
+        entry = SerializedResponse(build())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return entry
+
+    def respond(self, request, key, build, status=200):
+        """Flask-ответ с ETag, 304 по If-None-Match и сжатием по Accept-Encoding"""
+        entry = self.get(key, build)
+        headers = {"Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("If-None-Match"), entry.etag):
+            with self._lock:
+                self._stats["not_modified"] += 1
+            return Response(status=304, headers=dict(headers, ETag=f'"{entry.etag}"'))
+
+        encoding = _accepted_encoding(request.headers.get("Accept-Encoding"))
+        if encoding is None or len(entry.body) < MIN_COMPRESS_BYTES:
+            body = entry.body
+            headers["ETag"] = f'"{entry.etag}"'
+        else:
+            body = entry.encoded(encoding)
+            headers["ETag"] = f'"{entry.etag}-{encoding}"'
+            headers["Content-Encoding"] = encoding
+        return Response(body, status=status, headers=headers, content_type="application/json")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+def paginate(items, cursor, limit, version):
+    """Страница элементов и курсор следующей страницы; limit=None — все элементы от курсора"""
+    offset = decode_cursor(cursor, version)
+    page = items[offset:] if limit is None else items[offset:offset + limit]
+    next_offset = offset + len(page)
+    next_cursor = encode_cursor(next_offset, version) if limit and next_offset < len(items) else None
+    return page, next_cursor
@@ -0,0 +1,238 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Колонки результатов: по одному бинарному файлу фиксированного типа на колонку
+COLUMNS = {
+    "experiment": np.int32,
+    "item": np.int32,
+    "version": np.int16,
+    "model": np.int32,
+    "item_type": np.int32,
+    "complexity": np.int32,
+    "quality_score": np.float32,
+    "tokens": np.int32,
+    "latency_seconds": np.float32,
+    "time_to_first_token": np.float32,
+    "criteria": np.uint32,
+    "created_at": np.float64,
+    "answer_offset": np.int64,
+    "answer_length": np.int32
+}
+
+# Строковые колонки хранятся кодами словаря
+DICTIONARY_COLUMNS = ("experiment", "item", "model", "item_type", "complexity")
+
+# Флаги критериев качества упакованы в битовую маску uint32
+MAX_CRITERIA = 32
+
+
+class StoredResults:
+    """Снимок хранилища: колонки как np.memmap и словари для декодирования"""
+
+    def __init__(self, columns, dictionaries, answers_path):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.answers_path = answers_path
+
+    def __len__(self):
+        return len(self.columns["version"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def code(self, column, value):
+        """Код значения в словаре колонки, -1 если значение не встречалось"""
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return -1
+
+    def decode(self, column, codes):
+        values = self.dictionaries[column]
+        return [values[code] for code in np.asarray(codes).tolist()]
+
+    def mask(self, **filters):
+        """Булева маска строк по равенству колонок; строковые значения переводятся в коды"""
+        mask = np.ones(len(self), dtype=bool)
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column in DICTIONARY_COLUMNS:
+                value = self.code(column, value)
+            mask &= self.columns[column] == value
+        return mask
+
+    def criterion(self, name):
+        """Флаги одного критерия по всем строкам"""
+        bit = self.dictionaries["criteria"].index(name)
+        return (self.columns["criteria"] >> np.uint32(bit)) & np.uint32(1) == 1
+
+    def answer(self, index):
+        """Текст ответа строки: читается из отдельного файла по смещению"""
+        offset = int(self.columns["answer_offset"][index])
+        length = int(self.columns["answer_length"][index])
+        with open(self.answers_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8")
+
+
+class ResultStore:
+    """Колоночное хранилище результатов экспериментов с дозаписью и чтением через memmap"""
+
+    def __init__(self, directory, enabled=True):
+        self.directory = directory
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _column_path(self, column):
+        return self._path(f"{column}.bin")
+
+    @contextmanager
+    def _exclusive(self):
+        # Межпроцессная блокировка: в хранилище могут писать несколько воркеров
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(self._path(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_dictionaries(self):
+        try:
+            with open(self._path("dictionaries.json"), encoding="utf-8") as f:
+                dictionaries = json.load(f)
+        except FileNotFoundError:
+            dictionaries = {}
+        for column in DICTIONARY_COLUMNS + ("criteria",):
+            dictionaries.setdefault(column, [])
+        return dictionaries
+
+    def _write_dictionaries(self, dictionaries):
+        path = self._path("dictionaries.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dictionaries, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _rows_on_disk(self):
+        """Число целых строк: минимум по колонкам (после сбоя колонки могут разойтись)"""
+        counts = []
+        for column, dtype in COLUMNS.items():
+            try:
+                size = os.path.getsize(self._column_path(column))
+            except FileNotFoundError:
+                size = 0
+            counts.append(size // np.dtype(dtype).itemsize)
+        return min(counts)
+
+    def append(self, rows):
+        """Дозапись пачки строк результатов"""
+        if not self.enabled or not rows:
+            return
+        with self._exclusive():
+            dictionaries = self._read_dictionaries()
+            indexes = {column: {value: code for code, value in enumerate(values)}
+                       for column, values in dictionaries.items()}
+            changed = False
+
+            def encode(column, value):
+                nonlocal changed
+                value = "" if value is None else str(value)
+                code = indexes[column].get(value)
+                if code is None:
+                    code = indexes[column][value] = len(dictionaries[column])
+                    dictionaries[column].append(value)
+                    changed = True
+                return code
+
+            values = {column: [] for column in COLUMNS}
+            answers = []
+            answers_path = self._path("answers.bin")
+            offset = os.path.getsize(answers_path) if os.path.exists(answers_path) else 0
+            for row in rows:
+                for column in DICTIONARY_COLUMNS:
+                    values[column].append(encode(column, row.get(column)))
+                mask = 0
+                for name, flag in (row.get("criteria") or {}).items():
+                    bit = encode("criteria", name)
+                    if bit >= MAX_CRITERIA:
+                        raise ValueError(f"Поддерживается не более {MAX_CRITERIA} критериев качества")
+                    if flag:
+                        mask |= 1 << bit
+                answer = (row.get("answer") or "").encode("utf-8")
+                ttft = row.get("time_to_first_token")
+                # Задержка неизвестна у ячеек пакетного режима: NaN не участвует в перцентилях
+                latency = row.get("latency_seconds")
+                values["version"].append(row["version"])
+                values["quality_score"].append(row.get("quality_score") or 0)
+                values["tokens"].append(row.get("tokens") or 0)
+                values["latency_seconds"].append(np.nan if latency is None else latency)
+                values["time_to_first_token"].append(np.nan if ttft is None else ttft)
+                values["criteria"].append(mask)
+                values["created_at"].append(row.get("created_at") or time.time())
+                values["answer_offset"].append(offset)
+                values["answer_length"].append(len(answer))
+                answers.append(answer)
+                offset += len(answer)
+
+            # Словари пишутся до данных, чтобы любой код в колонках был разрешим
+            if changed:
+                self._write_dictionaries(dictionaries)
+            with open(answers_path, "ab") as f:
+                f.write(b"".join(answers))
+            # Хвосты от прерванной записи отбрасываются, чтобы колонки не разъехались
+            rows_on_disk = self._rows_on_disk()
+            for column, dtype in COLUMNS.items():
+                path = self._column_path(column)
+                with open(path, "ab") as f:
+                    f.truncate(rows_on_disk * np.dtype(dtype).itemsize)
+                    np.asarray(values[column], dtype=dtype).tofile(f)
+
+    def signature(self):
+        """Дешевая отметка версии хранилища без блокировки: размер и mtime колонки и словарей
+
+        Меняется после каждой дозаписи, поэтому по ней кэшируются производные от load() данные."""
+        signature = []
+        for path in (self._column_path("quality_score"), self._path("dictionaries.json")):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def load(self):
+        """Снимок всех строк; колонки отображаются в память, а не читаются целиком"""
+        with self._exclusive():
+            rows = self._rows_on_disk()
+            dictionaries = self._read_dictionaries()
+        columns = {}
+        for column, dtype in COLUMNS.items():
+            if rows == 0:
+                columns[column] = np.empty(0, dtype=dtype)
+            else:
+                columns[column] = np.memmap(self._column_path(column), dtype=dtype, mode="r", shape=(rows,))
+        return StoredResults(columns, dictionaries, self._path("answers.bin"))
+
+    def stats(self):
+        results = self.load()
+        size = 0
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                size += os.path.getsize(self._path(name))
+        return {
+            "enabled": self.enabled,
+            "rows": len(results),
+            "experiments": len(results.dictionaries["experiment"]),
+            "criteria": results.dictionaries["criteria"],
+            "bytes": size
+        }
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from analysis import model_stats
+
+OBJECTIVES = ("cost", "latency")
+
+
+class ModelRouter:
+    """Выбор модели для запроса по истории экспериментов: самая дешевая или быстрая
+    из тех, что держат порог качества для версии промпта и типа элемента"""
+
+    def __init__(self, store, prices=None, default_model="gpt-3.5-turbo", min_quality=3.0, min_cells=5,
+                 max_cached=256):
+        # prices — стоимость 1K токенов по моделям (USD)
+        self.store = store
+        self.prices = prices or {}
+        self.default_model = default_model
+        self.min_quality = min_quality
+        self.min_cells = min_cells
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def stats(self, version=None, item_type=None):
+        """Показатели моделей; хранилище читается заново только после его изменения
+
+        Изменение определяется по размеру и mtime файлов (stat без блокировки), поэтому
+        запрос /ask при неизменной истории не разбирает словари и не отображает колонки."""
+        signature = self.store.signature()
+        key = (version, item_type)
+        with self._lock:
+            if signature != self._signature:
+                self._cache.clear()
+                self._signature = signature
+            stats = self._cache.get(key)
+            if stats is not None:
+                self._cache.move_to_end(key)
+                return stats
+        stats = model_stats(self.store.load(), version=version, item_type=item_type)
+        with self._lock:
+            if signature != self._signature:
+                # Хранилище изменилось во время расчета: результат не кэшируется
+                return stats
+            self._cache[key] = stats
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return stats
+
+    def cost(self, model, tokens_mean):
+        price = self.prices.get(model)
+        return None if price is None else tokens_mean / 1000 * price
+
+    def decide(self, version=None, item_type=None, objective="cost", min_quality=None, models=None):
+        """Решение маршрутизатора с таблицей кандидатов; без истории — модель по умолчанию"""
+        if objective not in OBJECTIVES:
+            raise ValueError(f"objective должен быть одним из: {', '.join(OBJECTIVES)}")
+        min_quality = self.min_quality if min_quality is None else min_quality
+        stats = self.stats(version, item_type)
+        if item_type is not None and not any(history["cells"] >= self.min_cells for history in stats.values()):
+            # По типу элемента истории мало — берем показатели версии по всем типам
+            stats = self.stats(version, None)
+            item_type = None
+
+        candidates = []
+        for model in (models or sorted(stats)):
+            history = stats.get(model)
+            if history is None:
+                candidates.append({"model": model, "cells": 0, "eligible": False})
+                continue
+            candidates.append({
+                "model": model,
+                "cells": history["cells"],
+                "quality_mean": history["quality_mean"],
+                "tokens_mean": history["tokens_mean"],
+                "cost_per_call": self.cost(model, history["tokens_mean"]),
+                "latency_p50": history["latency_seconds"]["p50"],
+                "eligible": history["cells"] >= self.min_cells and history["quality_mean"] >= min_quality
+            })
+
+        eligible = [candidate for candidate in candidates if candidate["eligible"]]
+        if eligible:
+            if objective == "cost":
+                # Модели без цены сравниваются после моделей с известной ценой
+                chosen = min(eligible, key=lambda c: (c["cost_per_call"] is None, c["cost_per_call"] or 0,
+                                                      c["latency_p50"] or 0))
+            else:
+                chosen = min(eligible, key=lambda c: (c["latency_p50"] is None, c["latency_p50"] or 0))
+            model, reason = chosen["model"], objective
+        else:
+            known = [candidate for candidate in candidates if candidate["cells"]]
+            if known:
+                # Порог не держит никто — лучшая по качеству модель
+                model, reason = max(known, key=lambda c: c["quality_mean"])["model"], "best_quality"
+            else:
+                model = models[0] if models else self.default_model
+                reason = "no_history"
+        return {
+            "model": model,
+            "reason": reason,
+            "objective": objective,
+            "min_quality": min_quality,
+            "version": version,
+            "item_type": item_type,
+            "candidates": candidates
+        }
@@ -0,0 +1,92 @@
+from statistics import NormalDist
+import numpy as np
+
+
+def stratum_key(metadata, strata):
+    """Страта элемента по полям метаданных, например ("technical", "advanced")"""
+    metadata = metadata or {}
+    return tuple(str(metadata.get(field) or "unknown") for field in strata)
+
+
+def stratified_order(keys, seed=0):
+    """Порядок обхода элементов, любой префикс которого — стратифицированная выборка
+
+    Сначала по одному элементу из каждой страты (от крупных к мелким), затем элементы
+    добавляются пропорционально размерам страт. Внутри страты порядок случайный, но
+    фиксирован seed, поэтому выборку можно расширять, не меняя уже отобранные элементы."""
+    rng = np.random.default_rng(seed)
+    groups = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    names = sorted(groups, key=lambda key: (-len(groups[key]), key))
+    queues = [rng.permutation(groups[name]) for name in names]
+    sizes = np.array([len(queue) for queue in queues], dtype=np.float64)
+    shares = sizes / sizes.sum() if len(sizes) else sizes
+
+    order = [int(queue[0]) for queue in queues]
+    taken = np.ones(len(queues))
+    for step in range(len(order), len(keys)):
+        # Страта, сильнее всего отстающая от своей доли, с оставшимися элементами
+        deficit = shares * (step + 1) - taken
+        deficit[taken >= sizes] = -np.inf
+        chosen = int(deficit.argmax())
+        order.append(int(queues[chosen][int(taken[chosen])]))
+        taken[chosen] += 1
+    return order
+
+
+def stratified_mean(strata, values, population, confidence=0.95):
+    """Стратифицированная оценка среднего с поправкой на конечную совокупность
+
+    strata — страта каждой оценки, population — размеры страт во всем датасете.
+    Для страт с одним наблюдением дисперсия берется объединенной по остальным стратам
+    (или по всей выборке, если ни в одной страте нет двух наблюдений), поправка на конечную
+    совокупность к ним не применяется. Среднее не представленных в выборке страт неизвестно:
+    оно считается равным среднему по представленным, а интервал расширяется на их долю;
+    такая оценка помечается complete: false."""
+    values = np.asarray(values, dtype=np.float64)
+    total = sum(population.values())
+    groups = {}
+    for stratum, value in zip(strata, values.tolist()):
+        groups.setdefault(stratum, []).append(value)
+    if not groups:
+        return {"n": 0, "mean": None, "se": None, "ci_low": None, "ci_high": None, "margin": None,
+                "complete": False, "strata_sampled": 0, "strata_total": len(population)}
+
+    sampled = {stratum: np.array(group) for stratum, group in groups.items()}
+    variances = [group.var(ddof=1) for group in sampled.values() if len(group) > 1]
+    if variances:
+        pooled = float(np.mean(variances))
+    else:
+        pooled = float(values.var(ddof=1)) if len(values) > 1 else None
+    covered = sum(population.get(stratum, len(group)) for stratum, group in sampled.items())
+    uncovered = max(0, total - covered)
+    mean = 0.0
+    variance = 0.0
+    for stratum, group in sampled.items():
+        size = population.get(stratum, len(group))
+        weight = size / covered
+        mean += weight * group.mean()
+        if len(group) > 1:
+            variance += weight ** 2 * group.var(ddof=1) / len(group) * max(0.0, 1 - len(group) / size)
+        elif pooled is not None:
+            variance += weight ** 2 * pooled
+    if pooled is not None and uncovered:
+        # Отклонение среднего непредставленных страт от оценки — как у одного элемента
+        variance += (uncovered / (covered + uncovered)) ** 2 * pooled
+    result = {
+        "n": int(len(values)),
+        "mean": float(mean),
+        "se": None,
+        "ci_low": None,
+        "ci_high": None,
+        "margin": None,
+        "complete": pooled is not None and not uncovered,
+        "strata_sampled": len(sampled),
+        "strata_total": len(population)
+    }
+    if pooled is not None:
+        se = float(np.sqrt(variance))
+        margin = NormalDist().inv_cdf(1 - (1 - confidence) / 2) * se
+        result.update(se=se, ci_low=float(mean - margin), ci_high=float(mean + margin), margin=float(margin))
+    return result
@@ -0,0 +1,118 @@
+import re
+import threading
+from collections import namedtuple
+import numpy as np
+
+# Одна нормализация ответа на все критерии
+NormalizedAnswer = namedtuple("NormalizedAnswer", ["text", "lower", "word_count"])
+
+Criterion = namedtuple("Criterion", ["name", "check", "weight", "description"])
+
+
+def normalize(answer):
+    """Нормализация ответа: исходный текст, нижний регистр, число слов"""
+    text = answer or ""
+    return NormalizedAnswer(text, text.lower(), len(text.split()))
+
+
+def _as_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class ScoreBatch:
+    """Результат оценки пачки ответов: матрица критериев и итоговые баллы"""
+
+    def __init__(self, names, matrix, weights, descriptions=None):
+        self.names = names
+        self.matrix = matrix
+        self.weights = weights
+        self.descriptions = descriptions or [""] * len(names)
+        self.totals = matrix @ weights if len(names) else np.zeros(len(matrix), dtype=weights.dtype)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def score(self, index):
+        return _as_number(self.totals[index])
+
+    def criteria(self, index):
+        return {name: bool(flag) for name, flag in zip(self.names, self.matrix[index])}
+
+    def explain(self, index):
+        """Разбор оценки ответа: вклад каждого критерия с описанием и весом"""
+        return [
+            {"name": name, "description": description, "weight": _as_number(weight), "passed": bool(flag)}
+            for name, description, weight, flag in zip(self.names, self.descriptions, self.weights, self.matrix[index])
+        ]
+
+
+class ScoringEngine:
+    """Реестр критериев качества и пакетная оценка ответов"""
+
+    def __init__(self):
+        self._criteria = []
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        return [criterion.name for criterion in self._criteria]
+
+    @property
+    def max_score(self):
+        return _as_number(sum(criterion.weight for criterion in self._criteria))
+
+    def register(self, name, check, weight=1, description=""):
+        """Регистрация критерия: check(NormalizedAnswer) -> bool"""
+        with self._lock:
+            # Копия списка, чтобы параллельная оценка видела согласованный набор
+            criteria = [criterion for criterion in self._criteria if criterion.name != name]
+            criteria.append(Criterion(name, check, weight, description))
+            self._criteria = criteria
+        return check
+
+    def register_pattern(self, name, pattern, field="lower", weight=1, description=""):
+        """Критерий-регулярное выражение по полю нормализованного ответа (text или lower)"""
+        regex = re.compile(pattern)
+        index = NormalizedAnswer._fields.index(field)
+        return self.register(name, lambda answer: regex.search(answer[index]) is not None, weight, description)
+
+    def criterion(self, name, weight=1, description=""):
+        """Декоратор для регистрации критерия"""
+        def decorator(check):
+            return self.register(name, check, weight, description)
+        return decorator
+
+    def unregister(self, name):
+        with self._lock:
+            self._criteria = [criterion for criterion in self._criteria if criterion.name != name]
+
+    def score_batch(self, answers):
+        """Оценка пачки ответов за один проход: матрица (ответы × критерии)"""
+        criteria = self._criteria
+        checks = [criterion.check for criterion in criteria]
+        rows = [[check(normalized) for check in checks] for normalized in map(normalize, answers)]
+        matrix = np.array(rows, dtype=bool).reshape(len(answers), len(checks))
+        weights = np.array([criterion.weight for criterion in criteria], dtype=np.float64)
+        return ScoreBatch(
+            [criterion.name for criterion in criteria], matrix, weights,
+            [criterion.description for criterion in criteria]
+        )
+
+    def score(self, answer):
+        """Оценка одного ответа: (балл, флаги критериев)"""
+        batch = self.score_batch([answer])
+        return batch.score(0), batch.criteria(0)
+
+
+# Критерии качества ответов экспериментов
+scoring_engine = ScoringEngine()
+scoring_engine.register_pattern("has_examples", r"пример|example", description="Есть примеры")
+scoring_engine.register_pattern("has_practical_advice", r"совет|advice", description="Есть практический совет")
+scoring_engine.register_pattern("has_code_blocks", r"```", field="text", description="Есть блок кода")
+scoring_engine.register_pattern("has_bullet_points", r"[-*] ", field="text", description="Есть списки")
+scoring_engine.register(
+    "word_count_optimal",
+    lambda answer: 100 <= answer.word_count <= 300,
+    description="Длина ответа 100–300 слов"
+)
@@ -0,0 +1,117 @@
+import fcntl
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+# Диапазон смещений байтовых блокировок: ключи раскладываются по нему хэшем
+_LOCK_RANGE = 1 << 30
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одинаковых вызовов в полете: первый выполняет, остальные ждут его результат"""
+
+    def __init__(self, lock_path=None):
+        # lock_path — файл байтовых блокировок для объединения вызовов между процессами
+        self.lock_path = lock_path
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._lock_file_pid = None
+        self._stats = {
+            "leaders": 0,
+            "coalesced": 0,
+            "coalesced_cross_process": 0,
+            "cross_process_waits": 0,
+            "errors_shared": 0
+        }
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Потоки-лидеры не переживают fork: незавершенные вызовы родителя в ребенке не дождаться
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._lock_file_pid = None
+
+    def do(self, key, fn):
+        """Результат fn() для ключа и признак того, что он получен от чужого вызова"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                with self._lock:
+                    self._stats["errors_shared"] += 1
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _file(self):
+        # Один дескриптор на процесс: закрытие любого дескриптора файла снимает все его блокировки
+        with self._lock:
+            if self._lock_file is None or self._lock_file_pid != os.getpid():
+                os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+                self._lock_file = open(self.lock_path, "a+b")
+                self._lock_file_pid = os.getpid()
+            return self._lock_file
+
+    @contextmanager
+    def across_processes(self, key):
+        """Межпроцессная блокировка ключа (байтовый диапазон в общем файле блокировок)
+
+        Возвращает True, если пришлось ждать другой процесс: тогда его результат, скорее всего,
+        уже в общем кэше. Внутри процесса вызовы по ключу уже объединены do(), поэтому
+        блокировку берет один поток на ключ."""
+        if self.lock_path is None:
+            yield False
+            return
+        offset = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:15], 16) % _LOCK_RANGE
+        lock_file = self._file()
+        try:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+            waited = False
+        except OSError:
+            with self._lock:
+                self._stats["cross_process_waits"] += 1
+            fcntl.lockf(lock_file, fcntl.LOCK_EX, 1, offset)
+            waited = True
+        try:
+            yield waited
+        finally:
+            fcntl.lockf(lock_file, fcntl.LOCK_UN, 1, offset)
+
+    def record_cross_process_hit(self):
+        """Результат получен от вызова в другом процессе (через общий кэш после ожидания)"""
+        with self._lock:
+            self._stats["coalesced_cross_process"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,294 @@
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_new", "drop_oldest")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class HttpIngestionSink:
+    """Отправка пачек событий в batch ingestion API Langfuse"""
+
+    def __init__(self, host, public_key, secret_key, timeout=10.0):
+        self.url = f"{host.rstrip('/')}/api/public/ingestion"
+        self.public_key = public_key
+        self.secret_key = secret_key
+        self.timeout = timeout
+        self._client = None
+        self._client_pid = None
+
+    def _http(self):
+        # Клиент создается заново после fork
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = httpx.Client(
+                auth=(self.public_key or "", self.secret_key or ""),
+                timeout=self.timeout
+            )
+            self._client_pid = os.getpid()
+        return self._client
+
+    def send(self, events):
+        """Отправка пачки, возвращает число событий, отклоненных сервером"""
+        response = self._http().post(
+            self.url,
+            json={"batch": events, "metadata": {"sdk_name": "prompt_monitoring_telemetry"}}
+        )
+        response.raise_for_status()
+        if response.status_code == 207:
+            errors = response.json().get("errors", [])
+            for error in errors[:5]:
+                logger.error(f"Langfuse отклонил событие {error.get('id')}: {error.get('message')}")
+            return len(errors)
+        return 0
+
+
+class LangfuseSDKSink:
+    """Воспроизведение событий через клиент Langfuse SDK"""
+
+    def __init__(self, get_langfuse):
+        self.get_langfuse = get_langfuse
+
+    def send(self, events):
+        langfuse = self.get_langfuse()
+        for event in events:
+            body = dict(event["body"])
+            if event["type"] == "trace-create":
+                langfuse.trace(**body)
+            elif event["type"] == "score-create":
+                body["trace_id"] = body.pop("traceId")
+                langfuse.score(**body)
+        return 0
+
+
+class TelemetryWriter:
+    """Буферизованная отправка трейсов и оценок пачками из фонового потока"""
+
+    def __init__(self, sink, max_queue_size=10000, batch_size=100, flush_interval=1.0,
+                 overflow="block", block_timeout=5.0, max_retries=3):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._flush_requested = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._thread_pid = None
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "sent": 0,
+            "rejected": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "flush_latency_last": 0.0,
+            "flush_latency_max": 0.0,
+            "flush_latency_total": 0.0
+        }
+
+    # Публичный API для горячего пути
+
+    def trace(self, name, input=None, metadata=None, trace_id=None):
+        """Создание трейса, возвращает его id без ожидания отправки"""
+        trace_id = trace_id or str(uuid.uuid4())
+        self.enqueue("trace-create", {
+            "id": trace_id,
+            "name": name,
+            "input": input,
+            "metadata": metadata,
+            "timestamp": _now()
+        })
+        return trace_id
+
+    def update_trace(self, trace_id, output=None, metadata=None):
+        """Обновление трейса (upsert по id)"""
+        self.enqueue("trace-create", {
+            "id": trace_id,
+            "output": output,
+            "metadata": metadata
+        })
+
+    def score(self, trace_id, name, value, comment=None):
+        """Оценка трейса"""
+        self.enqueue("score-create", {
+            "id": str(uuid.uuid4()),
+            "traceId": trace_id,
+            "name": name,
+            "value": value,
+            "comment": comment
+        })
+
+    def enqueue(self, event_type, body):
+        """Постановка события в очередь с учетом политики переполнения"""
+        event = {
+            "id": str(uuid.uuid4()),
+            "type": event_type,
+            "timestamp": _now(),
+            "body": {key: value for key, value in body.items() if value is not None}
+        }
+        self._ensure_started()
+        with self._condition:
+            self._pending += 1
+        if not self._put(event):
+            with self._condition:
+                self._pending -= 1
+                self._stats["dropped"] += 1
+                self._condition.notify_all()
+            return False
+        with self._condition:
+            self._stats["enqueued"] += 1
+        return True
+
+    def _put(self, event):
+        if self.overflow == "block":
+            try:
+                self._queue.put(event, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                return False
+        if self.overflow == "drop_new":
+            try:
+                self._queue.put_nowait(event)
+                return True
+            except queue.Full:
+                return False
+        # drop_oldest: освобождаем место, выбрасывая самое старое событие
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return True
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                with self._condition:
+                    self._pending -= 1
+                    self._stats["dropped"] += 1
+
+    # Фоновая отправка
+
+    def _ensure_started(self):
+        # Поток запускается лениво и заново в дочернем процессе после fork
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._condition:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            if self._thread_pid is not None and self._thread_pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._pending = 0
+            self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._send(batch)
+            elif self._closed:
+                return
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        # Добираем пачку, пока она не заполнена или не истек интервал
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._flush_requested.is_set() or self._closed:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.05)))
+            except queue.Empty:
+                pass
+        return batch
+
+    def _send(self, batch):
+        started = time.perf_counter()
+        rejected = 0
+        failed = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                rejected = self.sink.send(batch)
+                failed = False
+                break
+            except Exception as e:
+                failed = True
+                logger.error(f"Ошибка отправки телеметрии (попытка {attempt + 1}): {str(e)}")
+                if attempt < self.max_retries and not self._closed:
+                    time.sleep(min(2 ** attempt * 0.5, 5.0))
+        latency = time.perf_counter() - started
+        with self._condition:
+            self._pending -= len(batch)
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["flush_latency_last"] = latency
+            self._stats["flush_latency_max"] = max(self._stats["flush_latency_max"], latency)
+            self._stats["flush_latency_total"] += latency
+            if failed:
+                self._stats["failed"] += len(batch)
+            else:
+                self._stats["sent"] += len(batch) - rejected
+                self._stats["rejected"] += rejected
+            self._condition.notify_all()
+
+    def flush(self, timeout=30.0):
+        """Ожидание отправки всех событий из очереди"""
+        if self._thread is None or self._thread_pid != os.getpid():
+            return True
+        self._flush_requested.set()
+        try:
+            with self._condition:
+                return self._condition.wait_for(lambda: self._pending <= 0, timeout=timeout)
+        finally:
+            self._flush_requested.clear()
+
+    def close(self, timeout=30.0):
+        """Сброс очереди и остановка фонового потока при завершении"""
+        flushed = self.flush(timeout)
+        self._closed = True
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 1)
+        if not flushed:
+            logger.error("Не удалось отправить всю телеметрию до завершения")
+        return flushed
+
+    def stats(self):
+        """Метрики очереди и задержки отправки"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["pending"] = self._pending
+        stats["queue_depth"] = self._queue.qsize()
+        stats["max_queue_size"] = self.max_queue_size
+        stats["overflow"] = self.overflow
+        stats["flush_latency_avg"] = (
+            stats["flush_latency_total"] / stats["batches"] if stats["batches"] else 0.0
+        )
+        return stats
@@ -0,0 +1,39 @@
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Тот же флаг, что preload_app в gunicorn.conf.py: приложение загружается в мастере до fork
+PRELOAD_APP = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def load_app_module(name="prompt_app"):
+    """Загрузка app.py по пути: имя app занято пакетом app/"""
+    if name in sys.modules:
+        return sys.modules[name]
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_application():
+    """WSGI-приложение для gunicorn"""
+    # С preload прогрев выполняет create_app до fork воркеров; без него каждый воркер
+    # прогревается фоновым потоком при импорте и не блокирует загрузку
+    os.environ.setdefault("APP_WARMUP", "preload" if PRELOAD_APP else "background")
+    module = load_app_module()
+    return module.create_app(preload=os.getenv("APP_WARMUP") == "preload", forks_workers=PRELOAD_APP)
+
+
+def __getattr__(name):
+    # application создается при первом обращении (gunicorn: wsgi:application), поэтому импорт
+    # load_app_module из бенчмарков не переключает режим прогрева и не загружает приложение
+    if name == "application":
+        application = globals()["application"] = create_application()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")